@@ -0,0 +1,283 @@
+import os
+import json
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+logger = logging.getLogger("Alerts")
+
+DEFAULT_QUEUE_PATH = os.path.join(os.getenv('PERSISTENT_DATA_DIR', '/data'), 'alerts.jsonl')
+
+
+class AlertRule:
+    """单条告警规则。
+
+    type:
+      threshold  {"above": x} 或 {"below": x}，针对当前价差
+      band       {"lower": a, "upper": b}，价差越出区间
+      zscore     {"window": "60m", "limit": 2.0}，当前价差在该滚动窗口的 |z| 超限
+      roc        {"minutes": 5, "limit": 0.01}，当前价差与 N 分钟前（按分时时间，午休不计行情）相比的变化幅度超限
+    通用参数：hysteresis（回落到阈值内侧多少才重新布防）、debounce（连续多少个 tick 越限才触发）、
+    cooldown（两次触发的最小间隔秒数）。
+    """
+
+    TYPES = ("threshold", "band", "zscore", "roc")
+
+    def __init__(self, spec, index=0):
+        self.type = spec.get("type")
+        if self.type not in self.TYPES:
+            raise ValueError(f"unknown rule type: {self.type}")
+        self.id = str(spec.get("id") or f"{self.type}-{index}")
+        self.hysteresis = float(spec.get("hysteresis", 0))
+        self.debounce = max(int(spec.get("debounce", 1)), 1)
+        self.cooldown = float(spec.get("cooldown", 0))
+        self.above = self.below = None
+        if self.type == "threshold":
+            self.above = float(spec["above"]) if "above" in spec else None
+            self.below = float(spec["below"]) if "below" in spec else None
+            if self.above is None and self.below is None:
+                raise ValueError("threshold rule needs 'above' or 'below'")
+        elif self.type == "band":
+            self.below, self.above = float(spec["lower"]), float(spec["upper"])
+            if self.below >= self.above:
+                raise ValueError("band rule needs lower < upper")
+        elif self.type == "zscore":
+            self.window = str(spec.get("window", "60m"))
+            self.limit = float(spec.get("limit", 2.0))
+        else:
+            self.minutes = int(spec.get("minutes", 5))
+            self.limit = float(spec["limit"])
+            if self.minutes < 1:
+                raise ValueError("roc rule needs minutes >= 1")
+        self.spec = dict(spec, id=self.id)
+
+    def measure(self, data):
+        """从已发布的响应数据中取出规则关注的量；数据不足时返回 None"""
+        if self.type in ("threshold", "band"):
+            return data.get("diff", {}).get("current")
+        if self.type == "zscore":
+            window = data.get("intraday", {}).get("stats", {}).get("rolling", {}).get(self.window, {})
+            return window.get("zscore")
+        rows = data.get("intraday", {}).get("data", [])
+        if not rows:
+            return None
+        # 取时间不晚于 (最新分钟 - minutes) 的最后一行作比较基准；缺分钟时不会把行数当作分钟数
+        target = _minute_of_day(rows[-1]["time"]) - self.minutes
+        for row in reversed(rows):
+            if _minute_of_day(row["time"]) <= target:
+                return rows[-1]["value"] - row["value"]
+        return None
+
+    def excess(self, value):
+        """越限程度：> 0 为越限，< -hysteresis 为已回到安全区"""
+        if self.type in ("zscore", "roc"):
+            return abs(value) - self.limit
+        margins = []
+        if self.above is not None:
+            margins.append(value - self.above)
+        if self.below is not None:
+            margins.append(self.below - value)
+        return max(margins)
+
+    def describe(self, value):
+        if self.type == "zscore":
+            return f"z-score {value:.2f} ({self.window}) beyond ±{self.limit}"
+        if self.type == "roc":
+            return f"spread moved {value:+.4%} in {self.minutes} min (limit {self.limit:.4%})"
+        if self.type == "band":
+            return f"spread {value:.4%} left band [{self.below:.4%}, {self.above:.4%}]"
+        side = "above" if self.above is not None and value > self.above else "below"
+        bound = self.above if side == "above" else self.below
+        return f"spread {value:.4%} {side} {bound:.4%}"
+
+
+def _minute_of_day(text):
+    """'HH:MM' -> 距 00:00 的分钟数"""
+    return int(text[:2]) * 60 + int(text[3:5])
+
+
+class _RuleState:
+    __slots__ = ("armed", "streak", "last_fired")
+
+    def __init__(self):
+        self.armed = True
+        self.streak = 0
+        self.last_fired = 0.0
+
+
+class LogSink:
+    def emit(self, alert):
+        logger.warning(f"[{alert['pair']}] {alert['rule']}: {alert['message']}")
+
+
+class WebhookSink:
+    """POST 告警 JSON 到 url；在单独线程中发送，不阻塞刷新"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = float(timeout)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AlertWebhook")
+
+    def emit(self, alert):
+        self._executor.submit(self._send, alert)
+
+    def _send(self, alert):
+        try:
+            requests.post(self.url, json=alert, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Webhook {self.url} failed: {e}")
+
+
+class FileQueueSink:
+    """以 JSON Lines 追加写入本地文件，供其他进程消费"""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, alert):
+        line = json.dumps(alert, ensure_ascii=False) + "\n"
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Alert queue {self.path} write failed: {e}")
+
+
+SINKS = {"log": LogSink, "webhook": WebhookSink, "file": FileQueueSink}
+
+
+def build_sink(spec):
+    params = {key: value for key, value in spec.items() if key != "type"}
+    if spec.get("type") not in SINKS:
+        raise ValueError(f"unknown sink type: {spec.get('type')}")
+    return SINKS[spec["type"]](**params)
+
+
+class AlertEngine:
+    """按套利对评估告警规则；每个 tick 的开销为 O(规则数)，不扫描历史数据。
+
+    rules 的键为 pair_id，"default" 下的规则作用于所有套利对。
+    """
+
+    def __init__(self, rules=None, sinks=None, history_size=500):
+        self._lock = threading.Lock()
+        self.sinks = list(sinks) if sinks is not None else [LogSink()]
+        self.history = deque(maxlen=int(history_size))
+        self._rules = {}
+        self._states = {}       # (pair_id, 规则来源, rule_id) -> _RuleState
+        self._next_id = 1
+        for pid, specs in (rules or {}).items():
+            self.set_rules(pid, specs)
+
+    @classmethod
+    def from_config(cls, settings):
+        sinks = []
+        for spec in settings.get("sinks", [{"type": "log"}]):
+            try:
+                sinks.append(build_sink(spec))
+            except (TypeError, ValueError) as e:
+                logger.error(f"Invalid alert sink {spec}: {e}")
+        engine = cls(sinks=sinks, history_size=settings.get("history_size", 500))
+        for pid, specs in settings.get("rules", {}).items():
+            try:
+                engine.set_rules(pid, specs)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Invalid alert rules for {pid}: {e}")
+        return engine
+
+    @staticmethod
+    def parse_rules(specs):
+        """校验并构建规则列表；非法时抛出 ValueError"""
+        try:
+            rules = [AlertRule(spec, i) for i, spec in enumerate(specs)]
+        except (AttributeError, KeyError, TypeError) as e:
+            raise ValueError(f"invalid rule: {e}")
+        if len({rule.id for rule in rules}) != len(rules):
+            raise ValueError("duplicate rule id")
+        return rules
+
+    def set_rules(self, pid, specs):
+        rules = self.parse_rules(specs)
+        with self._lock:
+            if rules:
+                self._rules[pid] = rules
+            else:
+                self._rules.pop(pid, None)
+            for key in [key for key in self._states if key[1] == pid]:
+                del self._states[key]
+        return rules
+
+    def rules(self):
+        with self._lock:
+            return {pid: [rule.spec for rule in rules] for pid, rules in self._rules.items()}
+
+    def resume(self, last_id):
+        """告警 id 从 last_id 之后继续编号（重启后接续已持久化的告警）"""
+        with self._lock:
+            self._next_id = max(self._next_id, int(last_id) + 1)
+
+    def drop_pair(self, pid):
+        with self._lock:
+            for key in [key for key in self._states if key[0] == pid]:
+                del self._states[key]
+
+    def _active_rules(self, pid):
+        for source in ("default", pid):
+            for rule in self._rules.get(source, []):
+                yield source, rule
+
+    def evaluate(self, pid, data, now=None):
+        """对套利对 pid 的最新响应数据评估规则，返回本次触发的告警"""
+        now = now if now is not None else datetime.now().timestamp()
+        fired = []
+        with self._lock:
+            for source, rule in self._active_rules(pid):
+                value = rule.measure(data)
+                if value is None:
+                    continue
+                excess = rule.excess(value)
+                state = self._states.get((pid, source, rule.id))
+                if state is None:
+                    state = self._states[(pid, source, rule.id)] = _RuleState()
+                if not state.armed:
+                    if excess < -rule.hysteresis:
+                        state.armed = True
+                    continue
+                if excess <= 0:
+                    state.streak = 0
+                    continue
+                state.streak += 1
+                if state.streak < rule.debounce or now - state.last_fired < rule.cooldown:
+                    continue
+                state.armed, state.streak, state.last_fired = False, 0, now
+                alert = {
+                    "id": self._next_id,
+                    "pair": pid,
+                    "rule": rule.id,
+                    "type": rule.type,
+                    "value": value,
+                    "message": rule.describe(value),
+                    "time": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+                }
+                self._next_id += 1
+                self.history.append(alert)
+                fired.append(alert)
+        for alert in fired:
+            for sink in self.sinks:
+                try:
+                    sink.emit(alert)
+                except Exception as e:
+                    logger.error(f"Alert sink {type(sink).__name__} failed: {e}")
+        return fired
+
+    def query(self, pid=None, after=0, limit=100):
+        """按 id 升序返回 id > after 的告警（可按套利对过滤），最多 limit 条"""
+        with self._lock:
+            alerts = [alert for alert in self.history
+                      if alert["id"] > after and (pid is None or alert["pair"] == pid)]
+        return alerts[-limit:] if limit else alerts
@@ -1,9 +1,12 @@
 import os
 import sys
+import time
 import threading
 import logging
-from flask import Flask, request, jsonify, send_from_directory, redirect
+from datetime import datetime
+from flask import Flask, Response, g, request, jsonify, send_from_directory, redirect, make_response, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,91 +16,96 @@ logger = logging.getLogger("MainApp")
 
 CONFIG_FILE = os.getenv('CONFIG_FILE', '/data/config.ini')
 USER_DB_PATH = os.getenv('USER_DB_PATH', '/data/users.json')
+HISTORY_DIR = os.getenv('HISTORY_DIR', os.path.join(os.getenv('PERSISTENT_DATA_DIR', '/data'), 'history'))
+# standalone：本进程拉取并计算（单 worker）；web：只从采集进程（ingest.py）发布的共享状态读取
+STATE_ROLE = os.getenv('STATE_ROLE', 'standalone')
+SHARED_STATE_PATH = os.getenv('SHARED_STATE_PATH', os.path.join(os.getenv('PERSISTENT_DATA_DIR', '/data'), 'state.db'))
+# 前面的反向代理层数：> 0 时 request.remote_addr 取自 X-Forwarded-For 中由这些代理追加的客户端地址
+# （登录限流按客户端 IP 计数）；未经代理直接暴露时必须保持 0，否则客户端可伪造该请求头
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
 
 logger.info(f"Using config file: {CONFIG_FILE}")
 logger.info(f"Using user database: {USER_DB_PATH}")
+logger.info(f"Using history store: {HISTORY_DIR}")
+logger.info(f"State role: {STATE_ROLE}")
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 try:
+    import codec
+    import metrics
+    from profiler import SamplingProfiler
     from config import ConfigManager
-    from authentication import AuthManager
-    from data import DataService, StockMonitorApp, MultiPairManager
+    from authentication import STREAM_TICKET_SECONDS, AuthManager
+    from login_guard import LoginRejected, LoginThrottled
+    from data import DataService, StockMonitorApp, MultiPairManager, history_payload, to_delta
 except ImportError as e:
     logger.error(f"Import error: {e}")
     try:
+        from . import codec, metrics
+        from .profiler import SamplingProfiler
         from .config import ConfigManager
-        from .authentication import AuthManager
-        from .data import DataService, StockMonitorApp, MultiPairManager
+        from .authentication import STREAM_TICKET_SECONDS, AuthManager
+        from .login_guard import LoginRejected, LoginThrottled
+        from .data import DataService, StockMonitorApp, MultiPairManager, history_payload, to_delta
     except ImportError:
         logger.error("Failed to import required modules")
         exit(1)
 
 app = Flask(__name__, template_folder='templates')
 CORS(app)
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
 
 config_manager = ConfigManager(CONFIG_FILE)
 auth_manager = AuthManager(USER_DB_PATH)
 
-# 全局多 pair 管理器
+# 全局多 pair 管理器；其套利对字典写时复制，读接口无需加锁
 pair_manager = None
+# 只用于串行化增删/切换套利对及保存配置的写操作
 pair_manager_lock = threading.Lock()
 
 if not os.path.exists(CONFIG_FILE):
     logger.info("Creating default config file")
     config_manager._create_default_config()
 
-try:
-    if not os.path.exists(USER_DB_PATH):
-        logger.info("Creating default user")
-        auth_manager.user_dao.add_user("admin", "password")
-except Exception as e:
-    logger.error(f"Failed to create default user: {e}")
-
 def init_pair_manager():
     global pair_manager
     config = config_manager.load_config()
-    pair_manager = MultiPairManager(config)
+    DataService.configure(config, HISTORY_DIR)
+    if STATE_ROLE == 'web':
+        from shared_state import SharedPairView, SharedStateStore
+        pair_manager = SharedPairView(SharedStateStore(SHARED_STATE_PATH), config_manager,
+                                      wait_seconds=DataService.fetch_deadline)
+    else:
+        pair_manager = MultiPairManager(config)
     logger.info(f"Initialized with {len(pair_manager.apps)} pairs, active: {pair_manager.active_pair_id}")
 
 init_pair_manager()
+pair_manager.start()
 
 def ensure_default_user():
+    """缺少 admin 用户时创建默认账户 admin/password（多个 worker 同时创建时只有一个生效）"""
     try:
-        if not os.path.exists(USER_DB_PATH):
-            logger.info("User database not found, creating default user")
-            auth_manager.user_dao.add_user("admin", "password")
-            logger.info("Default user admin/password created")
-        else:
-            users = auth_manager.user_dao.users
-            if 'admin' not in users:
-                logger.info("Admin user missing, recreating")
-                auth_manager.user_dao.add_user("admin", "password")
+        if auth_manager.user_dao.get_user('admin') is None:
+            logger.info("Admin user missing, creating default user")
+            if auth_manager.user_dao.add_user("admin", "password"):
+                logger.info("Default user admin/password created")
     except Exception as e:
         logger.error(f"Failed to ensure default user: {e}")
-        try:
-            import json
-            from werkzeug.security import generate_password_hash
-            from datetime import datetime
-            default_users = {
-                'admin': {
-                    'password': generate_password_hash('password'),
-                    'created_at': datetime.now().isoformat(),
-                    'updated_at': datetime.now().isoformat()
-                }
-            }
-            os.makedirs(os.path.dirname(USER_DB_PATH), exist_ok=True)
-            with open(USER_DB_PATH, 'w') as f:
-                json.dump(default_users, f, indent=2)
-            logger.info("Default user created via fallback")
-        except Exception as e2:
-            logger.error(f"Fallback also failed: {e2}")
 
 ensure_default_user()
 
 # ---------- 认证路由 ----------
+def _login_rejected(error):
+    """失败次数过多返回 429，密码校验池繁忙返回 503，均带 Retry-After"""
+    status = 429 if isinstance(error, LoginThrottled) else 503
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, status
+
 @app.route('/auth/login', methods=['POST'])
 def login():
     data = request.json
@@ -105,7 +113,10 @@ def login():
     password = data.get('password')
     if not username or not password:
         return jsonify({'error': 'Username and password are required'}), 400
-    token = auth_manager.login(username, password)
+    try:
+        token = auth_manager.login(username, password)
+    except LoginRejected as e:
+        return _login_rejected(e)
     if token:
         return jsonify({'token': token}), 200
     return jsonify({'error': 'Invalid credentials'}), 401
@@ -119,7 +130,10 @@ def update_account():
     current_password = data.get('current_password')
     if not current_username or not current_password:
         return jsonify({'error': 'Current username and password are required'}), 400
-    success, message = auth_manager.update_account(current_username, new_username, new_password, current_password)
+    try:
+        success, message = auth_manager.update_account(current_username, new_username, new_password, current_password)
+    except LoginRejected as e:
+        return _login_rejected(e)
     if success:
         return jsonify({'status': 'success', 'message': message})
     else:
@@ -141,12 +155,20 @@ def main_app():
 @app.route('/api/pairs')
 @auth_manager.protected_route
 def get_pairs():
-    with pair_manager_lock:
-        pair_ids = pair_manager.get_pair_ids()
-        active = pair_manager.active_pair_id
-        # 不再自动修复，让前端处理无效 active
+    pair_ids = pair_manager.get_pair_ids()
+    active = pair_manager.active_pair_id
+    # 不再自动修复，让前端处理无效 active
     return jsonify({"pairs": pair_ids, "active": active})
 
+@app.route('/api/pairs/overview')
+@auth_manager.protected_route
+def pairs_overview():
+    """全部套利对的当前价差与 z-score（?window=<最近点数>，默认 60）"""
+    window = request.args.get('window', 60, type=int)
+    if not 2 <= window <= 240:
+        return jsonify({"error": "window 应在 2-240 之间"}), 400
+    return jsonify(pair_manager.overview(window))
+
 @app.route('/api/add-pair', methods=['POST'])
 @auth_manager.protected_route
 def add_pair():
@@ -155,7 +177,7 @@ def add_pair():
     code2 = data.get('stock2', '').strip()
     if not code1 or not code2:
         return jsonify({"error": "两个股票代码都不能为空"}), 400
-    with pair_manager_lock:
+    with pair_manager_lock, config_manager.transaction():
         pid = pair_manager.add_pair(code1, code2)
         config = config_manager.load_config()
         pair_list = [[app_obj.stocks[0]['code'], app_obj.stocks[1]['code']] for app_obj in pair_manager.apps.values()]
@@ -171,7 +193,7 @@ def remove_pair():
     pid = data.get('pair_id')
     if not pid:
         return jsonify({"error": "pair_id is required"}), 400
-    with pair_manager_lock:
+    with pair_manager_lock, config_manager.transaction():
         if pid not in pair_manager.apps:
             return jsonify({"error": "Pair not found"}), 404
         pair_manager.remove_pair(pid)
@@ -189,7 +211,7 @@ def switch_pair():
     pid = data.get('pair_id')
     if not pid:
         return jsonify({"error": "pair_id is required"}), 400
-    with pair_manager_lock:
+    with pair_manager_lock, config_manager.transaction():
         if pid not in pair_manager.apps:
             return jsonify({"error": "Pair not found"}), 404
         pair_manager.switch_to(pid)
@@ -199,37 +221,216 @@ def switch_pair():
     return jsonify({"status": "switched", "active": pid})
 
 # ---------- 获取数据（支持指定 pair） ----------
+def _resolve_pair(pair_id):
+    """无锁解析请求的套利对，不存在时回退到当前套利对；均无效时返回 None"""
+    apps = pair_manager.apps     # 写时复制：取一次引用即为一致视图
+    if not (pair_id and pair_id in apps):
+        pair_id = pair_manager.active_pair_id
+    return pair_id if pair_id in apps else None
+
+def _payload_options():
+    """解析 format/precision/dtype 查询参数，非法值返回 None"""
+    fmt = request.args.get('format', 'rows')
+    dtype = request.args.get('dtype')
+    precision = request.args.get('precision', type=int)
+    if fmt not in ('rows', 'columnar') or dtype not in (None, 'float32', 'float64'):
+        return None
+    if precision is not None and not 0 <= precision <= 12:
+        return None
+    return fmt, precision, dtype
+
 @app.route('/api/get-data')
 @auth_manager.protected_route
 def get_data():
-    pair_id = request.args.get('pair', None)
-    with pair_manager_lock:
-        if pair_id and pair_id in pair_manager.apps:
-            target_app = pair_manager.apps[pair_id]
+    options = _payload_options()
+    if options is None:
+        return jsonify({"error": "Invalid format options"}), 400
+    pair_id = _resolve_pair(request.args.get('pair'))
+    if pair_id is None:
+        return jsonify({"error": "No pair configured"}), 400
+    snapshot = pair_manager.get_snapshot(pair_id)
+
+    # 后台线程尚未覆盖到该 pair（如刚添加），同步刷新一次
+    if snapshot is None:
+        pair_manager.refresh_pair(pair_id)
+        snapshot = pair_manager.get_snapshot(pair_id)
+        if snapshot is None:
+            if pair_manager.get_app(pair_id) is None:
+                return jsonify({"error": "Pair not found"}), 404
+            # 首次刷新失败：没有可用的快照，稍后重试
+            return jsonify({"error": "Data temporarily unavailable"}), 503, {'Retry-After': '5'}
+
+    # ETag 标识快照版本及响应格式；内容未变时返回 304
+    etag = "-".join(str(part) for part in (pair_id, snapshot.version) + options)
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        since = request.args.get('since')
+        delta = to_delta(snapshot.payload(*options), since, request.args.get('fiveDay', type=int)) if since else None
+        if delta is not None:
+            response = Response(codec.dumps(delta), mimetype='application/json')
         else:
-            target_app = pair_manager.get_active_app()
-        if target_app is None:
-            return jsonify({"error": "No pair configured"}), 400
-
-        data = target_app.get_frontend_data()
-        index_codes = [
-            "sh000001", "sz399001", "sz399006", "sh000688",
-            "sh000016", "sh000300", "sh000905", "sh000852"
-        ]
-        index_data = DataService.get_realtime_data(index_codes)
-        for i, code in enumerate(index_codes, 1):
-            data[f"index{i}"] = index_data.get(code, {"name": f"指数{i}", "price": 0.0, "changePercent": 0.0})
-    return jsonify(data)
+            # 完整数据直接发送快照预先编码（及压缩）好的字节
+            body = snapshot.body(*options)
+            encoding = codec.negotiate(request.accept_encodings, len(body))
+            response = Response(snapshot.body(*options, encoding) if encoding else body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    # 当前交易时段，休市时前端放慢轮询（快照已冻结）
+    response.headers['X-Market-Phase'] = pair_manager.calendar.phase(datetime.now())
+    return response
+
+# ---------- 长周期价差 ----------
+HISTORY_MAX_DAYS = 250
+HISTORY_DEFAULT_WIDTH = 1200   # 未指定分辨率时按此点数选层（约等于五日视图的分钟点数）
+
+@app.route('/api/history')
+@auth_manager.protected_route
+def get_history():
+    """?pair=&days=&resolution=1m|5m|30m|1d 或 &width=<图表点数>（自动选层）&precision=&dtype="""
+    options = _payload_options()
+    days = request.args.get('days', type=int)
+    width = request.args.get('width', type=int)
+    resolution = request.args.get('resolution')
+    if options is None or (days is not None and not 1 <= days <= HISTORY_MAX_DAYS) \
+            or (width is not None and width < 1) or resolution not in (None, "1m", "5m", "30m", "1d"):
+        return jsonify({"error": "Invalid history options"}), 400
+    pair_id = _resolve_pair(request.args.get('pair'))
+    if pair_id is None:
+        return jsonify({"error": "No pair configured"}), 400
+
+    history = pair_manager.spread_history(pair_id, days)
+    if history is None:
+        return jsonify({"error": "No stored history for this pair"}), 404
+    pyramid, trade_days = history
+    if resolution is None:
+        resolution = pyramid.resolution_for(width or HISTORY_DEFAULT_WIDTH)
+    stamps = pyramid.levels["1m"][0]
+    last = str(stamps[-1]) if len(stamps) else ""
+    etag = "-".join(str(part) for part in (pair_id, trade_days[0], last, len(stamps), resolution) + options[1:])
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        payload = history_payload(pyramid, resolution, *options[1:])
+        payload.update({"pair": pair_id, "days": len(trade_days),
+                        "from": trade_days[0].isoformat(), "to": trade_days[-1].isoformat()})
+        response = jsonify(payload)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# ---------- 告警 ----------
+@app.route('/api/alerts')
+@auth_manager.protected_route
+def get_alerts():
+    """?pair=&after=<告警 id>&limit= 查询告警历史"""
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    alerts = pair_manager.alerts.query(request.args.get('pair'), after, limit)
+    return jsonify({"alerts": alerts, "last_id": alerts[-1]["id"] if alerts else after})
+
+@app.route('/api/alerts/rules', methods=['GET', 'POST'])
+@auth_manager.protected_route
+def alert_rules():
+    if request.method == 'GET':
+        return jsonify(pair_manager.alerts.rules())
+    data = request.json or {}
+    pid = data.get('pair', '')
+    if not pid or not isinstance(data.get('rules'), list):
+        return jsonify({"error": "需要 pair 和 rules"}), 400
+    with config_manager.transaction():
+        try:
+            rules = pair_manager.alerts.set_rules(pid, data['rules'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        config = config_manager.load_config()
+        config.setdefault("alerts", {})["rules"] = pair_manager.alerts.rules()
+        config_manager.save_config(config)
+    return jsonify({"status": "success", "rules": [rule.spec for rule in rules]})
+
+# ---------- 推送流（SSE） ----------
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = 600   # 定期断开（先发送 reconnect 事件），客户端携带 Last-Event-ID 自动重连
+# gthread worker 中每条推送流独占一个线程；只把一半线程留给推送流，超出时返回 503，客户端改为轮询
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '32'))
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', str(max(1, GUNICORN_THREADS // 2))))
+
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+STREAM_CLIENTS = metrics.gauge("stockmonitor_stream_clients", "Open /api/stream connections in this process")
+STREAM_REJECTED = metrics.counter("stockmonitor_stream_rejected_total",
+                                  "Stream requests refused because the per-worker limit was reached")
+
+def _release_stream_slot():
+    STREAM_CLIENTS.dec()
+    _stream_slots.release()
+
+@app.route('/api/stream/ticket', methods=['POST'])
+@auth_manager.protected_route
+def stream_ticket():
+    """用登录令牌换取短期推送流票据，前端以 ?ticket= 建立推送流，登录令牌不出现在 URL 和访问日志中"""
+    return jsonify({"ticket": auth_manager.issue_stream_ticket(g.auth.username),
+                    "expires_in": STREAM_TICKET_SECONDS})
+
+@app.route('/api/stream')
+@auth_manager.protected_route(allow_stream_ticket=True)
+def stream_data():
+    options = _payload_options()
+    if options is None:
+        return jsonify({"error": "Invalid format options"}), 400
+    pair_id = _resolve_pair(request.args.get('pair'))
+    if pair_id is None:
+        return jsonify({"error": "No pair configured"}), 400
+    # 浏览器自动重连时带 Last-Event-ID 请求头；前端换新票据重连时以 lastEventId 参数传入
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('lastEventId', type=int)
+    if not _stream_slots.acquire(blocking=False):
+        STREAM_REJECTED.inc()
+        return jsonify({"error": "Too many streams, use polling"}), 503, {'Retry-After': str(STREAM_MAX_SECONDS)}
+    STREAM_CLIENTS.inc()
+
+    def events():
+        # 重连时若客户端已持有当前版本，则直接等待下一次刷新
+        last_version = last_event_id
+        sent = None   # 本连接上次发送的列式数据，用于计算增量
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            try:
+                snapshot = pair_manager.wait_for_snapshot(pair_id, last_version, STREAM_HEARTBEAT_SECONDS)
+            except KeyError:
+                yield "event: removed\ndata: {}\n\n"
+                return
+            if snapshot is None:
+                yield ": heartbeat\n\n"
+                continue
+            payload = snapshot.payload(*options)
+            delta = None
+            if sent is not None and sent["intraday"]["times"]:
+                since = f"{sent['intraday']['date']}T{sent['intraday']['times'][-1]}"
+                delta = to_delta(payload, since, sent["fiveDay"]["version"])
+            if options[0] == 'columnar':
+                sent = payload
+            last_version = snapshot.version
+            body = codec.dumps(delta) if delta else snapshot.body(*options)
+            yield f"id: {snapshot.version}\nevent: snapshot\ndata: {body.decode('utf-8')}\n\n"
+        yield "event: reconnect\ndata: {}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 连接结束（包括客户端断开）时由 WSGI 服务器调用 close()，归还名额
+    response.call_on_close(_release_stream_slot)
+    return response
 
 # ---------- 兼容旧版配置接口 ----------
 @app.route('/api/config')
 @auth_manager.protected_route
 def get_config():
-    with pair_manager_lock:
-        app_obj = pair_manager.get_active_app()
-        if app_obj:
-            return jsonify({"stock1": app_obj.stocks[0]['code'], "stock2": app_obj.stocks[1]['code']})
-        return jsonify({"stock1": "", "stock2": ""})
+    app_obj = pair_manager.get_active_app()
+    if app_obj:
+        return jsonify({"stock1": app_obj.stocks[0]['code'], "stock2": app_obj.stocks[1]['code']})
+    return jsonify({"stock1": "", "stock2": ""})
 
 @app.route('/api/update-stocks', methods=['POST'])
 @auth_manager.protected_route
@@ -239,7 +440,7 @@ def update_stocks():
     stock2 = data.get('stock2', '').strip()
     if not stock1 or not stock2:
         return jsonify({"error": "股票代码不能为空"}), 400
-    with pair_manager_lock:
+    with pair_manager_lock, config_manager.transaction():
         pid = f"{stock1}-{stock2}"
         if pid not in pair_manager.apps:
             pair_manager.add_pair(stock1, stock2)
@@ -251,10 +452,89 @@ def update_stocks():
         config_manager.save_config(config)
     return jsonify({"status": "success"})
 
+# ---------- 指标与性能剖析 ----------
+# Prometheus 抓取时可用固定令牌（Authorization: Bearer <METRICS_TOKEN>）代替登录令牌
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+HTTP_SECONDS = metrics.histogram("stockmonitor_http_request_seconds",
+                                 "Time to produce the response (streamed bodies excluded)", ("endpoint", "method"))
+HTTP_RESPONSES = metrics.counter("stockmonitor_http_responses_total", "Responses by route and status",
+                                 ("endpoint", "status"))
+
+profiler = SamplingProfiler()
+
+def _collect_pipeline_metrics():
+    if STATE_ROLE == 'web':
+        # 刷新相关的指标在采集进程中，见 /api/metrics?process=ingest
+        return metrics.cache_families(DataService.cache_stats())
+    return pair_manager.collect_metrics()
+
+metrics.register_collector(_collect_pipeline_metrics)
+metrics.register_collector(auth_manager.collect_metrics)
+
+@app.before_request
+def _start_timer():
+    request.started_at = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    started = getattr(request, 'started_at', None)
+    if started is not None:
+        # 用路由规则而不是实际路径作标签，避免指标数量随 URL 增长
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        HTTP_RESPONSES.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+def _metrics_authorized():
+    if METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}':
+        return True
+    return auth_manager.is_authenticated()
+
+@app.route('/api/metrics')
+def get_metrics():
+    """本进程的指标（Prometheus 文本格式）；多 worker 部署时 ?process=ingest 返回采集进程的指标"""
+    if not _metrics_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if request.args.get('process') == 'ingest':
+        if STATE_ROLE != 'web':
+            return jsonify({'error': 'No separate ingest process in standalone mode'}), 404
+        text = pair_manager.store.load_metrics()
+        if text is None:
+            return jsonify({'error': 'Ingest metrics not published yet'}), 503
+    else:
+        text = metrics.render()
+    return Response(text, content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+@auth_manager.protected_route
+def profiler_control():
+    """采样剖析开关：POST {"action": "start", "interval": 0.01, "seconds": 60} / {"action": "stop"}；
+    GET 返回状态，?format=collapsed 返回折叠栈文本（可用 flamegraph.pl / speedscope 绘图）"""
+    if request.method == 'POST':
+        data = request.json or {}
+        action = data.get('action')
+        if action == 'start':
+            try:
+                started = profiler.start(data.get('interval'), data.get('seconds'))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid interval or seconds'}), 400
+            if not started:
+                return jsonify({'error': 'Profiler already running', **profiler.status()}), 409
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            return jsonify({'error': 'action must be start or stop'}), 400
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(request.args.get('limit', type=int)), mimetype='text/plain')
+    return jsonify(profiler.status())
+
 # ---------- 其他路由 ----------
 @app.route('/auth/clear-cache', methods=['POST'])
+@auth_manager.protected_route
 def clear_auth_cache():
-    auth_manager.user_dao.users = auth_manager.user_dao._load_users()
+    """清空已验证令牌的缓存（用户数据直接读写存储，无需重新加载）"""
+    auth_manager.token_cache.clear()
     logger.info("Auth cache cleared")
     return jsonify({"status": "success"})
 
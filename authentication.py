@@ -1,8 +1,18 @@
 import jwt
+import time
+import hashlib
 import datetime
 import functools
 import logging
-from flask import request, make_response
+import threading
+from collections import namedtuple
+from flask import g, request, make_response
+
+import metrics
+from cache import TTLCache
+from login_guard import LoginThrottle, PasswordVerifier, SqliteThrottleState
+from user_dao import INVALID_PASSWORD, UserDAO
+from user_store import SqliteUserStore
 
 # 配置日志
 logging.basicConfig(
@@ -14,23 +24,79 @@ logger = logging.getLogger("AuthManager")
 # 安全密钥
 SECRET_KEY = "healwilson"
 
+# 已验证令牌的缓存：命中时只需一次字典查找，不再解码和校验签名
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_SIZE = 4096
+# 推送流票据的有效期（秒）：EventSource 无法设置请求头，以只能用于建立推送流的短期票据代替 URL 中的登录令牌
+STREAM_TICKET_SECONDS = 60
+STREAM_TICKET_AUDIENCE = "stream"
+# 同类认证日志的最小间隔（秒），期间的重复日志只计数
+AUTH_LOG_INTERVAL = 60
+# 密码哈希校验池：并发计算数、排队上限、最长等待秒数
+HASH_WORKERS = 2
+HASH_QUEUE_SIZE = 16
+HASH_TIMEOUT = 10
+# 同一用户名或 IP 连续失败超过该次数后按指数退避拒绝登录（1s、2s、4s…，最长 5 分钟）
+LOGIN_FREE_ATTEMPTS = 5
+
+# 每个请求的认证上下文，受保护路由中可通过 flask.g.auth 读取
+AuthContext = namedtuple("AuthContext", ["username", "expires_at"])
+
+
+class RateLimitedLog:
+    """按 key 限制日志频率：同一 key 在 interval 秒内只输出一次，并附带期间被抑制的条数"""
+
+    def __init__(self, interval=AUTH_LOG_INTERVAL, max_keys=1024):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._last = {}     # key -> (上次输出时间, 被抑制条数)
+
+    def log(self, level, key, message):
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return
+            if len(self._last) >= self.max_keys:
+                self._last.clear()
+            self._last[key] = (now, 0)
+        if suppressed:
+            message += f" suppressed={suppressed}"
+        logger.log(level, message)
+
 class AuthManager:
     def __init__(self, user_db_path):
         self.user_db_path = user_db_path
         logger.info(f"Initialized with user DB path: {user_db_path}")
         
         # 初始化 UserDAO
-        from user_dao import UserDAO
-        self.user_dao = UserDAO(user_db_path)
+        self.verifier = PasswordVerifier(HASH_WORKERS, HASH_QUEUE_SIZE, HASH_TIMEOUT)
+        self.user_dao = UserDAO(user_db_path, verifier=self.verifier)
         logger.info("UserDAO initialized")
+        # 登录失败计数与用户表存放在同一个 SQLite 库中，所有 worker 进程共享；JSON 后端时只在本进程内计数
+        store = self.user_dao.store
+        state = SqliteThrottleState(store.path) if isinstance(store, SqliteUserStore) else None
+        self.throttle = LoginThrottle(LOGIN_FREE_ATTEMPTS, state=state)
+        # 键为令牌的 SHA-256 摘要，值为 AuthContext；命中时仍检查 exp
+        self.token_cache = TTLCache("auth_tokens", TOKEN_CACHE_TTL, TOKEN_CACHE_SIZE)
+        self.auth_log = RateLimitedLog()
     
     def login(self, username, password):
-        """验证用户凭据并生成JWT令牌"""
+        """验证用户凭据并生成JWT令牌
+
+        失败过多时抛出 LoginThrottled，校验池繁忙时抛出 VerifierBusy（均带 retry_after）。
+        """
         logger.info(f"Login attempt for user: {username}")
-        
+        client = request.remote_addr
+        self.throttle.check(username, client)
+
         if not self.user_dao.validate_user(username, password):
             logger.warning(f"Invalid credentials for user: {username}")
+            self.throttle.failure(username, client)
             return None
+        self.throttle.success(username, client)
 
         # 生成JWT令牌
         token = jwt.encode({
@@ -44,7 +110,10 @@ class AuthManager:
     def update_account(self, current_username, new_username, new_password, current_password):
         """更新用户账户信息（用户名和/或密码）"""
         logger.info(f"Account update request: {current_username} -> {new_username}")
-        
+        # 修改账户同样需要校验当前密码，与登录共用失败计数
+        client = request.remote_addr
+        self.throttle.check(current_username, client)
+
         # 验证并更新账户信息
         success, message = self.user_dao.update_account(
             current_username,
@@ -55,40 +124,111 @@ class AuthManager:
         
         if success:
             logger.info(f"Account updated successfully: {message}")
+            # 用户名或密码变更后，已缓存的令牌需重新校验
+            self.token_cache.clear()
         else:
             logger.error(f"Account update failed: {message}")
+            if message == INVALID_PASSWORD:
+                self.throttle.failure(current_username, client)
             
         return success, message
 
-    def authenticate_request(self):
-        """验证请求是否包含有效的JWT令牌"""
+    def authenticate_request(self, allow_stream_ticket=False):
+        """验证请求是否包含有效的JWT令牌
+
+        allow_stream_ticket 为 True 时也接受 ?ticket= 推送流票据（见 issue_stream_ticket）。
+        """
         auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            logger.warning("Missing or invalid Authorization header")
+        if auth_header and auth_header.startswith('Bearer '):
+            valid, result = self.verify_token(auth_header.split(" ")[1])
+        elif allow_stream_ticket and request.args.get('ticket'):
+            valid, result = self.verify_stream_ticket(request.args.get('ticket'))
+        else:
+            self._log_failure("missing_token", "no Authorization header")
             return False, "Missing authentication token"
 
-        token = auth_header.split(" ")[1]
-        
+        if not valid:
+            return False, result
+        g.auth = result
+        return True, result.username
+
+    def verify_token(self, token):
+        """校验令牌，返回 (True, AuthContext) 或 (False, 错误信息)；校验结果按令牌摘要缓存"""
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        context = self.token_cache.get(digest)
+        if context is not None:
+            if context.expires_at > time.time():
+                return True, context
+            self.token_cache.invalidate(digest)
+            self._log_failure("expired", f"user={context.username}")
+            return False, "Token expired"
+
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            username = payload['sub']
-            logger.info(f"Authenticated user: {username}")
-            return True, username
+            context = AuthContext(payload['sub'], float(payload.get('exp', time.time() + TOKEN_CACHE_TTL)))
         except jwt.ExpiredSignatureError:
-            logger.warning("Token has expired")
+            self._log_failure("expired", "signature expired")
             return False, "Token expired"
-        except jwt.InvalidTokenError as e:
-            logger.warning(f"Invalid token: {str(e)}")
+        except (jwt.InvalidTokenError, KeyError) as e:
+            self._log_failure("invalid", str(e))
             return False, "Invalid token"
+        self.token_cache.put(digest, context)
+        self.auth_log.log(logging.INFO, ("verified", context.username),
+                          f"auth_verified user={context.username}")
+        return True, context
+
+    def issue_stream_ticket(self, username):
+        """签发推送流票据：有效期 STREAM_TICKET_SECONDS，aud 为 stream，不能当作登录令牌使用；
+        票据是签名令牌而非服务端状态，任一 worker 签发的票据可在其他 worker 上使用"""
+        return jwt.encode({
+            'sub': username,
+            'aud': STREAM_TICKET_AUDIENCE,
+            'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=STREAM_TICKET_SECONDS)
+        }, SECRET_KEY, algorithm='HS256')
+
+    def verify_stream_ticket(self, ticket):
+        """校验推送流票据，返回 (True, AuthContext) 或 (False, 错误信息)；只在建立连接时调用一次，不缓存"""
+        try:
+            payload = jwt.decode(ticket, SECRET_KEY, algorithms=['HS256'], audience=STREAM_TICKET_AUDIENCE)
+            return True, AuthContext(payload['sub'], float(payload['exp']))
+        except jwt.ExpiredSignatureError:
+            self._log_failure("expired", "stream ticket expired")
+            return False, "Ticket expired"
+        except (jwt.InvalidTokenError, KeyError) as e:
+            self._log_failure("invalid", f"stream ticket: {e}")
+            return False, "Invalid ticket"
+
+    def collect_metrics(self):
+        """令牌缓存命中率、密码校验池与登录限流的计数（注册为 metrics 采集回调）"""
+        verifier = self.verifier.stats()
+        throttle = self.throttle.stats()
+        return metrics.cache_families({self.token_cache.name: self.token_cache.stats()}) + [
+            metrics.Family("stockmonitor_password_hash_rejected_total", "counter",
+                           "Verifications rejected because the hash queue was full").add(verifier["rejected"]),
+            metrics.Family("stockmonitor_password_hash_timeouts_total", "counter",
+                           "Verifications that timed out waiting for a result").add(verifier["timeouts"]),
+            metrics.Family("stockmonitor_password_hash_in_flight", "gauge",
+                           "Verifications running or queued").add(verifier["in_flight"]),
+            metrics.Family("stockmonitor_login_throttled_total", "counter",
+                           "Login attempts rejected by brute-force throttling").add(throttle["throttled"]),
+            metrics.Family("stockmonitor_login_blocked_keys", "gauge",
+                           "Usernames and client IPs currently in back-off").add(throttle["blocked_keys"]),
+        ]
+
+    def _log_failure(self, reason, detail):
+        client = request.remote_addr
+        self.auth_log.log(logging.WARNING, ("failed", reason, client),
+                          f"auth_failed reason={reason} client={client} path={request.path} detail={detail}")
 
-    def protected_route(self, func):
-        """用于保护路由的装饰器"""
+    def protected_route(self, func=None, allow_stream_ticket=False):
+        """用于保护路由的装饰器，可写作 @protected_route 或 @protected_route(allow_stream_ticket=True)"""
+        if func is None:
+            return functools.partial(self.protected_route, allow_stream_ticket=allow_stream_ticket)
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            valid, response = self.authenticate_request()
+            valid, response = self.authenticate_request(allow_stream_ticket)
             if not valid:
-                logger.warning("Unauthorized access attempt")
                 return make_response({'error': response}, 401)
             return func(*args, **kwargs)
 
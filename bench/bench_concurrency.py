@@ -0,0 +1,122 @@
+"""读者并发基准：上游很慢时，一轮刷新进行期间并发读者（/api/get-data、/api/pairs、
+/api/pairs/overview）的响应时间，以及新增套利对首次同步加载的耗时。
+
+读接口不再经过全局锁，读者延迟应远小于刷新耗时；否则以非零状态退出。
+
+用法：python bench/bench_concurrency.py [--pairs 5] [--readers 16] [--delay 0.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from upstream_stub import UpstreamStub, install  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pairs", type=int, default=5)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.5, help="每个上游请求的延迟（秒）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-concurrency-")
+    codes = [f"{600000 + i}" for i in range(args.pairs + 1)]
+    pairs = [[codes[i], codes[i + 1]] for i in range(args.pairs)]
+    os.environ.update({
+        "CONFIG_FILE": os.path.join(workdir, "config.ini"),
+        "USER_DB_PATH": os.path.join(workdir, "users.json"),
+        "HISTORY_DIR": os.path.join(workdir, "history"),
+    })
+    with open(os.environ["CONFIG_FILE"], "w", encoding="utf-8") as f:
+        json.dump({"pairs": pairs, "active_pair": "-".join(pairs[0]),
+                   "refresh_interval": 3600, "idle_refresh_interval": 3600,
+                   # 关闭行情缓存，保证每次刷新都真正访问（慢）上游
+                   "cache": {"realtime_ttl": 0, "minute_ttl": 0, "five_days_ttl": 0}}, f)
+
+    stub = install(UpstreamStub(delay=0.0))
+    import app as webapp  # noqa: E402  导入即启动后台刷新线程
+
+    manager = webapp.pair_manager
+    deadline = time.time() + 30
+    while time.time() < deadline and any(manager.get_snapshot(pid) is None for pid in manager.get_pair_ids()):
+        time.sleep(0.05)
+
+    client = webapp.app.test_client()
+    token = client.post("/auth/login", json={"username": "admin", "password": "password"}).json["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    urls = ["/api/pairs", "/api/pairs/overview"] + [f"/api/get-data?pair={a}-{b}&format=columnar" for a, b in pairs]
+
+    stub.delay = args.delay
+    refreshing = threading.Event()
+    refresh_seconds = []
+
+    def refresh():
+        started = time.perf_counter()
+        refreshing.set()
+        manager.refresh_all()
+        refresh_seconds.append(time.perf_counter() - started)
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def reader(index):
+        local = webapp.app.test_client()
+        refreshing.wait()
+        i = index
+        while not refresh_seconds:
+            url = urls[i % len(urls)]
+            i += 1
+            started = time.perf_counter()
+            response = local.get(url, headers=headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append((url, response.status_code))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    refresher = threading.Thread(target=refresh)
+    refresher.start()
+
+    # 刷新进行中新增套利对：首次读取只等待它自己的上游请求
+    refreshing.wait()
+    time.sleep(args.delay / 2)
+    new_pid = manager.add_pair(codes[0], codes[-1])
+    started = time.perf_counter()
+    first_load = client.get(f"/api/get-data?pair={new_pid}", headers=headers).status_code
+    first_load_seconds = time.perf_counter() - started
+
+    refresher.join()
+    for thread in threads:
+        thread.join()
+    manager.stop()
+
+    print(f"pairs: {args.pairs}, readers: {args.readers}, upstream delay: {args.delay:.2f}s")
+    print(f"refresh_all duration : {refresh_seconds[0]:8.3f} s")
+    print(f"reader requests      : {len(latencies):8d} ({len(errors)} errors)")
+    print(f"reader latency p50   : {statistics.median(latencies) * 1000:8.2f} ms")
+    print(f"reader latency p99   : {percentile(latencies, 0.99) * 1000:8.2f} ms")
+    print(f"reader latency max   : {max(latencies) * 1000:8.2f} ms")
+    print(f"new pair first load  : {first_load_seconds:8.3f} s (HTTP {first_load})")
+    print(f"upstream requests    : {stub.requests}")
+    if errors or max(latencies) > refresh_seconds[0] / 2:
+        print("FAIL: readers were serialized behind the refresh")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
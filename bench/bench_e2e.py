@@ -0,0 +1,216 @@
+"""端到端 /api/get-data 基准：应用运行在本进程的 HTTP 服务器（werkzeug，多线程）上，
+上游由 UpstreamStub 模拟；N 个轮询者按前端的方式请求（首次全量，之后带 since/fiveDay 增量参数
+和 If-None-Match），同时每隔 --refresh 秒推进一分钟行情并执行一轮 refresh_all。
+
+每种套利对数量在独立子进程中运行（应用在导入时按配置初始化），依次测量各并发档位的
+延迟分位数与吞吐量。轮询者之间没有等待（闭环压测），结果反映服务端的饱和能力。
+
+用法：python bench/bench_e2e.py [--pairs 1,10,100] [--pollers 1,10,100,500] [--duration 5]
+                                [--mode browser|full] [--save out.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import results  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Poller(threading.Thread):
+    """模拟一个浏览器标签页：轮询一个套利对直到 stop 被设置"""
+
+    def __init__(self, base_url, token, pair, mode, start, stop):
+        super().__init__(daemon=True)
+        import requests
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        self.session.headers["Accept-Encoding"] = "gzip"
+        self.url = f"{base_url}/api/get-data?format=columnar&precision=6&pair={pair}"
+        self.mode = mode
+        self.start_event = start
+        self.stop_event = stop
+        self.recording = False
+        self.latencies = []
+        self.statuses = {}
+        self.bytes = 0
+        self.errors = 0
+        self._etag = None
+        self._cursor = None
+
+    def _request(self):
+        url, headers = self.url, {}
+        if self.mode == "browser" and self._cursor is not None:
+            url += f"&since={self._cursor[0]}&fiveDay={self._cursor[1]}"
+            headers["If-None-Match"] = self._etag
+        response = self.session.get(url, headers=headers, timeout=60)
+        if response.status_code == 200:
+            self._etag = response.headers.get("ETag")
+            body = response.json()
+            intraday = body.get("intraday", {})
+            if intraday.get("times"):
+                five_day = body.get("fiveDay", {}).get("version", self._cursor[1] if self._cursor else 0)
+                self._cursor = (f"{intraday['date']}T{intraday['times'][-1]}", five_day)
+        return response
+
+    def run(self):
+        self.start_event.wait()
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                response = self._request()
+            except Exception:
+                if self.recording:
+                    self.errors += 1
+                continue
+            elapsed = time.perf_counter() - started
+            if self.recording:
+                self.latencies.append(elapsed)
+                self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+                self.bytes += len(response.content)
+
+
+def run_scenario(args):
+    """子进程：启动应用与 HTTP 服务器，依次测量各并发档位，结果以 JSON 输出到最后一行"""
+    from upstream_stub import UpstreamStub, install
+    from werkzeug.serving import make_server
+
+    workdir = tempfile.mkdtemp(prefix="bench-e2e-")
+    codes = [f"{600000 + i}" for i in range(args.pairs + 1)]
+    pairs = [[codes[i], codes[i + 1]] for i in range(args.pairs)]
+    os.environ.update({
+        "CONFIG_FILE": os.path.join(workdir, "config.ini"),
+        "USER_DB_PATH": os.path.join(workdir, "users.json"),
+        "HISTORY_DIR": os.path.join(workdir, "history"),
+    })
+    with open(os.environ["CONFIG_FILE"], "w", encoding="utf-8") as f:
+        # 后台线程只做首次加载，之后的刷新由本基准按 --refresh 驱动（与当天是否交易日无关）
+        json.dump({"pairs": pairs, "active_pair": "-".join(pairs[0]),
+                   "refresh_interval": 3600, "idle_refresh_interval": 3600,
+                   "cache": {"realtime_ttl": 0, "minute_ttl": 0}}, f)
+
+    stub = install(UpstreamStub(delay=args.delay, minutes=120, replay_dir=args.replay))
+    import app as webapp  # noqa: E402  导入即启动后台刷新线程
+    logging.disable(logging.WARNING)
+
+    manager = webapp.pair_manager
+    deadline = time.time() + 120
+    while time.time() < deadline and any(manager.get_snapshot(pid) is None for pid in manager.get_pair_ids()):
+        time.sleep(0.05)
+
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    token = webapp.app.test_client().post(
+        "/auth/login", json={"username": "admin", "password": "password"}).json["token"]
+
+    refresh_seconds = []
+    stop_refresh = threading.Event()
+
+    def refresher():
+        while not stop_refresh.wait(args.refresh):
+            stub.minutes += 1
+            started = time.perf_counter()
+            manager.refresh_all()
+            refresh_seconds.append(time.perf_counter() - started)
+
+    threading.Thread(target=refresher, daemon=True).start()
+
+    measured = {}
+    for count in args.poller_levels:
+        start, stop = threading.Event(), threading.Event()
+        pollers = [Poller(base_url, token, "-".join(pairs[i % len(pairs)]), args.mode, start, stop)
+                   for i in range(count)]
+        for poller in pollers:
+            poller.start()
+        refresh_seconds.clear()
+        start.set()
+        time.sleep(args.warmup)
+        for poller in pollers:
+            poller.recording = True
+        time.sleep(args.duration)
+        for poller in pollers:
+            poller.recording = False
+        stop.set()
+        for poller in pollers:
+            poller.join(timeout=60)
+
+        latencies = [value for poller in pollers for value in poller.latencies]
+        statuses = {}
+        for poller in pollers:
+            for status, n in poller.statuses.items():
+                statuses[str(status)] = statuses.get(str(status), 0) + n
+        total = len(latencies)
+        measured[f"pairs={args.pairs} pollers={count}"] = {
+            "requests_per_s": round(total / args.duration, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+            "mean_kb": round(sum(poller.bytes for poller in pollers) / total / 1024, 2) if total else 0.0,
+            "refresh_ms": round(statistics.mean(refresh_seconds) * 1000, 1) if refresh_seconds else 0.0,
+            "errors": sum(poller.errors for poller in pollers),
+            "statuses": statuses,
+        }
+    stop_refresh.set()
+    manager.stop()
+    server.shutdown()
+    print(json.dumps(measured))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", default="1,10,100", help="套利对数量（逗号分隔，每个数量一个子进程）")
+    parser.add_argument("--pollers", default="1,10,100,500", help="并发轮询者数量（逗号分隔）")
+    parser.add_argument("--duration", type=float, default=5.0, help="每档测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=1.0, help="每档开始测量前的预热时长（秒）")
+    parser.add_argument("--refresh", type=float, default=1.0, help="推进行情并刷新的间隔（秒）")
+    parser.add_argument("--delay", type=float, default=0.0, help="每个上游请求的延迟（秒）")
+    parser.add_argument("--mode", choices=("browser", "full"), default="browser",
+                        help="browser：增量参数 + If-None-Match（同前端）；full：每次请求完整数据")
+    parser.add_argument("--replay", metavar="DIR", help="回放 upstream_stub.py --record 录制的响应")
+    parser.add_argument("--scenario", type=int, help=argparse.SUPPRESS)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+    args.poller_levels = [int(n) for n in args.pollers.split(",")]
+
+    if args.scenario is not None:
+        args.pairs = args.scenario
+        run_scenario(args)
+        return
+
+    measured = {}
+    for pairs in (int(n) for n in args.pairs.split(",")):
+        command = [sys.executable, os.path.abspath(__file__), "--scenario", str(pairs),
+                   "--pollers", args.pollers, "--duration", str(args.duration), "--warmup", str(args.warmup),
+                   "--refresh", str(args.refresh), "--delay", str(args.delay), "--mode", args.mode]
+        if args.replay:
+            command += ["--replay", args.replay]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr[-2000:])
+            sys.exit(f"scenario with {pairs} pairs failed")
+        scenario = json.loads(completed.stdout.strip().splitlines()[-1])
+        for case, row in scenario.items():
+            print(f"{case:<24} {row['requests_per_s']:9.1f} req/s  p50 {row['p50_ms']:8.2f} ms  "
+                  f"p95 {row['p95_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms  max {row['max_ms']:8.2f} ms  "
+                  f"{row['mean_kb']:7.2f} KB  refresh {row['refresh_ms']:7.1f} ms  "
+                  f"errors {row['errors']}  {row['statuses']}")
+        measured.update(scenario)
+    results.finish(args, "e2e", measured)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""解析与价差计算的微基准：上游响应由 CannedHttp 直接返回（不经过 requests 传输层），
+只测量本仓库代码的开销。每个用例取多轮中最快一轮的单次耗时。
+
+用法：python bench/bench_micro.py [--filter parse] [--repeat 5] [--pairs 100]
+                                  [--save out.json] [--compare baseline.json]
+"""
+import argparse
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import results  # noqa: E402
+from upstream_stub import CannedHttp, UpstreamStub  # noqa: E402
+
+import codec  # noqa: E402
+from data import DataService, MultiPairManager, StockMonitorApp, to_columnar, to_delta  # noqa: E402
+
+
+def setup_service(stub):
+    DataService.http = CannedHttp(stub)
+    DataService.history = None
+    # 与线上刷新间隔（5s）下的行为一致：实时行情和分钟线每轮都重新拉取，五日数据走缓存
+    DataService.configure_cache({"realtime_ttl": 0, "minute_ttl": 0, "five_days_ttl": 30})
+
+
+def build_cases(args):
+    stub = UpstreamStub(minutes=None, replay_dir=args.replay)
+    setup_service(stub)
+    cases = {}
+
+    codes = [f"{600000 + i}" for i in range(max(args.pairs, 1) + 1)]
+    market_codes = tuple(DataService.to_market_code(code) for code in codes[:DataService.REALTIME_BATCH_SIZE])
+    cases["parse_realtime_batch60"] = lambda: DataService._fetch_realtime_batch(market_codes)
+
+    code = codes[0]
+    full = DataService._load_minute_data(code)
+
+    def parse_minute_full():
+        DataService.minute_cache.invalidate(code)
+        return DataService._load_minute_data(code)
+    cases["parse_minute_full"] = parse_minute_full
+
+    def parse_minute_incremental():
+        # 缓存中已有除最后一分钟外的数据，只解析尾部
+        DataService.minute_cache.put(code, full[:-1])
+        return DataService._load_minute_data(code)
+    cases["parse_minute_incremental"] = parse_minute_incremental
+    cases["parse_five_days"] = lambda: DataService._load_5days_data(code)
+
+    # 单个套利对：两腿的分时与五日数据已写入共享数据面
+    app = StockMonitorApp({"stock1": codes[0], "stock2": codes[1]})
+    realtime, series = DataService.fetch_tick(app.realtime_codes(), app.minute_cursors())
+    app.symbols.ingest(series)
+    response = app.refresh_data(realtime, series)
+    trade_date = app.intraday_state.trade_date
+    five1 = series[codes[0]]["five_days"]
+    five2 = series[codes[1]]["five_days"]
+    cases["process_intraday_data"] = lambda: app._process_intraday_data(trade_date)
+    cases["process_five_day_data"] = lambda: app._process_five_day_data(five1, five2)
+    cases["prepare_response"] = lambda: app._prepare_response(realtime)
+    cases["refresh_data_unchanged"] = lambda: app.refresh_data(realtime, series)
+
+    columnar = to_columnar(response, 6)
+    body = codec.dumps(columnar)
+    since = f"{columnar['intraday']['date']}T{columnar['intraday']['times'][-5]}"
+    five_day_version = columnar["fiveDay"]["version"]
+    cases["to_columnar"] = lambda: to_columnar(response, 6)
+    cases["encode_json_columnar"] = lambda: codec.dumps(columnar)
+    cases["compress_gzip"] = lambda: codec.compress(body, "gzip")
+    cases["to_delta"] = lambda: to_delta(columnar, since, five_day_version)
+
+    # 多个套利对：一轮 refresh_all（行情拉取由 CannedHttp 即时返回）与总览
+    pairs = [[codes[i], codes[i + 1]] for i in range(args.pairs)]
+    manager = MultiPairManager({"pairs": pairs, "active_pair": "-".join(pairs[0])})
+    manager.refresh_all()
+    cases[f"refresh_all_{args.pairs}_pairs"] = manager.refresh_all
+    cases[f"overview_{args.pairs}_pairs"] = manager.overview
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pairs", type=int, default=100, help="refresh_all / overview 用例的套利对数量")
+    parser.add_argument("--replay", metavar="DIR", help="回放 upstream_stub.py --record 录制的响应")
+    results.add_arguments(parser)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    measured = {}
+    for name, func in build_cases(args).items():
+        if args.filter not in name:
+            continue
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=args.repeat, number=number)) / number
+        measured[name] = {"us_per_op": round(best * 1e6, 2)}
+        print(f"{name:<32} {best * 1e6:12.2f} us/op  ({number} loops x {args.repeat})")
+    results.finish(args, "micro", measured)
+
+
+if __name__ == "__main__":
+    main()
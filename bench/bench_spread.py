@@ -0,0 +1,87 @@
+"""五日价差处理微基准：对比原 pandas merge_asof + iterrows 实现与向量化实现。
+
+用法：python bench/bench_spread.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import MinuteBar, StockMonitorApp  # noqa: E402
+
+
+def trading_minutes():
+    minutes = []
+    for start, end in ((time(9, 30), time(11, 30)), (time(13, 0), time(15, 0))):
+        current = datetime.combine(datetime.today(), start)
+        while current.time() <= end:
+            minutes.append(current.time())
+            current += timedelta(minutes=1)
+    return minutes
+
+
+def five_day_bars(seed, days=5):
+    """生成与 get_5days_data 返回结构一致的五日分钟线（约 5 x 242 条）"""
+    rnd = random.Random(seed)
+    close_prev = 10.0
+    price = close_prev
+    bars = []
+    first_day = datetime.today().date() - timedelta(days=days)
+    for offset in range(days):
+        trade_date = first_day + timedelta(days=offset)
+        for t in trading_minutes():
+            price *= 1 + rnd.gauss(0, 0.001)
+            bars.append(MinuteBar(datetime.combine(trade_date, t), round(price, 2),
+                                  (round(price, 2) - close_prev) / close_prev))
+    return bars
+
+
+def legacy_process_five_day(data1, data2):
+    """向量化之前的实现，仅用于对照"""
+    five_day_data = []
+    df1 = pd.DataFrame(data1).sort_values('datetime')
+    df2 = pd.DataFrame(data2).sort_values('datetime')
+    merged = pd.merge_asof(df1, df2, on='datetime', suffixes=('_1', '_2'), tolerance=pd.Timedelta('5min')).dropna()
+    merged['diff'] = merged['changePercent_1'] - merged['changePercent_2']
+    for _, row in merged.iterrows():
+        five_day_data.append({"datetime": row["datetime"].strftime("%m-%d %H:%M"), "value": row['diff']})
+    max_row = merged.loc[merged['diff'].idxmax()]
+    min_row = merged.loc[merged['diff'].idxmin()]
+    stats = {
+        "current": merged.iloc[-1]['diff'],
+        "max": max_row['diff'], "max_date": max_row["datetime"].strftime("%m-%d %H:%M"),
+        "min": min_row['diff'], "min_date": min_row["datetime"].strftime("%m-%d %H:%M"),
+    }
+    return five_day_data, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data1, data2 = five_day_bars("stock1"), five_day_bars("stock2")
+    app = StockMonitorApp({"stock1": "600000", "stock2": "000001"})
+
+    legacy_rows, legacy_stats = legacy_process_five_day(data1, data2)
+    app._process_five_day_data(data1, data2)
+    assert app.five_day_data == legacy_rows, "vectorized output differs from legacy output"
+    for key, value in legacy_stats.items():
+        assert app.five_day_stats[key] == value, key
+
+    legacy = min(timeit.repeat(lambda: legacy_process_five_day(data1, data2), number=1, repeat=args.repeat))
+    vectorized = min(timeit.repeat(lambda: app._process_five_day_data(data1, data2), number=1, repeat=args.repeat))
+    print(f"rows per leg: {len(data1)}")
+    print(f"legacy     : {legacy * 1000:8.2f} ms")
+    print(f"vectorized : {vectorized * 1000:8.2f} ms")
+    print(f"speedup    : {legacy / vectorized:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
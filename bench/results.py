@@ -0,0 +1,91 @@
+"""基准结果的保存与回归对比。
+
+结果文件为 JSON：{"suite", "environment", "results": {用例: {指标: 数值}}}。
+名称以 _per_s 结尾的指标越大越好，其余（耗时）越小越好。
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _module_available(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def environment():
+    """记录运行环境，对比不同机器上的结果时以此判断是否可比"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "orjson": _module_available("orjson"),
+        "brotli": _module_available("brotli"),
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument("--save", metavar="PATH", help="把结果保存为 JSON")
+    parser.add_argument("--compare", metavar="PATH", help="与之前保存的结果对比")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="变差超过该比例视为回归（默认 0.10），有回归时以非零状态退出")
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def compare(results, baseline, threshold):
+    """返回 [(用例, 指标, 基线值, 当前值, 变化比例, 是否回归)]，变化比例为正表示变好"""
+    rows = []
+    for case, metrics in results.items():
+        base_metrics = baseline.get(case, {})
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / base
+            if not higher_is_better(metric):
+                change = -change
+            rows.append((case, metric, base, value, change, change < -threshold))
+    return rows
+
+
+def finish(args, suite, results):
+    """按命令行参数保存结果、与基线对比；有回归时以状态 1 退出"""
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"suite": suite, "environment": environment(), "results": results}, f, indent=2)
+        print(f"results saved to {args.save}")
+    if not args.compare:
+        return
+    with open(args.compare, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("suite") != suite:
+        print(f"baseline is a {baseline.get('suite')!r} result, not {suite!r}")
+        sys.exit(2)
+    rows = compare(results, baseline["results"], args.threshold)
+    print(f"\ncompared with {args.compare} (commit {baseline['environment'].get('commit') or '?'})")
+    for case, metric, base, value, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"  {case:<36} {metric:<14} {base:>12.4g} -> {value:<12.4g} {change:+7.1%} {flag}")
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
@@ -0,0 +1,302 @@
+"""基准测试用的上游行情模拟：以 requests 传输适配器的形式挂到 HttpClient 的会话上，
+按真实接口的格式生成确定性的合成数据（GBK 实时行情、分钟线 JSON、五日 JSONP），可设置每个请求的延迟；
+也可回放事先录制的真实响应。
+
+用法：
+    stub = UpstreamStub(delay=0.2)
+    install(stub)          # 之后 DataService 的所有上游请求都由 stub 应答（含 configure_http 重建的客户端）
+
+    UpstreamStub(replay_dir="recordings")       # 录制过的代码回放真实响应，其余代码仍用合成数据
+    DataService.http = CannedHttp(stub)         # 微基准：跳过 requests 的传输层，只测解析
+
+录制（需要访问真实上游）：
+    python bench/upstream_stub.py --record recordings 600000 000001
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time as _time
+from datetime import datetime, timedelta, time
+
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+
+
+def trading_minutes():
+    """上游分钟线的时间点：9:30-11:30、13:00-15:00，共 242 个"""
+    minutes = []
+    for start, end in ((time(9, 30), time(11, 30)), (time(13, 0), time(15, 0))):
+        current = datetime.combine(datetime.today(), start)
+        while current.time() <= end:
+            minutes.append(current.strftime("%H%M"))
+            current += timedelta(minutes=1)
+    return minutes
+
+
+MINUTES = trading_minutes()
+
+
+def previous_weekdays(day, count):
+    days = []
+    while len(days) < count:
+        day -= timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day)
+    return days
+
+
+class UpstreamStub(BaseAdapter):
+    """模拟 qt.gtimg.cn / web.ifzq.gtimg.cn。
+
+    delay：每个请求的延迟（秒）；minutes：当日已产生的分钟数（None 为全天）。
+    同一代码同一天的价格序列是确定的，便于校验增量结果。生成的响应体按内容缓存，
+    模拟本身的开销不计入被测代码。
+    replay_dir：record() 录制的目录，其中有的代码回放录制的响应（不受 minutes 影响）。
+    """
+
+    def __init__(self, delay=0.0, minutes=None, seed=0, replay_dir=None):
+        super().__init__()
+        self.delay = delay
+        self.minutes = minutes
+        self.seed = seed
+        self.requests = {}      # 端点 -> 请求数
+        self._lock = threading.Lock()
+        self._paths = {}
+        self._bodies = {}
+        self.recorded = load_recordings(replay_dir) if replay_dir else {}
+
+    def _path(self, code, day):
+        """(昨收价, 242 个分钟价格) 的确定性随机游走"""
+        key = (code, day)
+        with self._lock:
+            path = self._paths.get(key)
+        if path is None:
+            rnd = random.Random(f"{self.seed}-{code}-{day.isoformat()}")
+            prev_close = round(5 + rnd.random() * 45, 2)
+            price, prices = prev_close, []
+            for _ in MINUTES:
+                price *= 1 + rnd.gauss(0, 0.0015)
+                prices.append(round(price, 2))
+            path = (prev_close, prices)
+            with self._lock:
+                self._paths[key] = path
+        return path
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def _elapsed(self):
+        return len(MINUTES) if self.minutes is None else max(0, min(self.minutes, len(MINUTES)))
+
+    def _memo(self, key, build):
+        with self._lock:
+            body = self._bodies.get(key)
+        if body is None:
+            body = build()
+            with self._lock:
+                self._bodies[key] = body
+        return body
+
+    def realtime(self, codes):
+        today = datetime.today().date()
+        elapsed = self._elapsed()
+        return self._memo(("realtime", tuple(codes), today, elapsed), lambda: self._realtime(codes, today, elapsed))
+
+    def _realtime(self, codes, today, elapsed):
+        recorded = self.recorded.get("realtime", {})
+        lines = []
+        for code in codes:
+            if code in recorded:
+                lines.append(recorded[code])
+                continue
+            prev_close, prices = self._path(code, today)
+            price = prices[elapsed - 1] if elapsed else prev_close
+            fields = ["1", f"股票{code[2:]}", code[2:], f"{price:.2f}", f"{prev_close:.2f}"] + ["0"] * 35
+            fields[32] = f"{(price - prev_close) / prev_close * 100:.2f}"
+            lines.append(f'v_{code}="' + "~".join(fields) + '"')
+        return (";\n".join(lines) + ";\n").encode("gbk")
+
+    def minute(self, code):
+        if code in self.recorded.get("minute", {}):
+            return self.recorded["minute"][code]
+        today = datetime.today().date()
+        elapsed = self._elapsed()
+        return self._memo(("minute", code, today, elapsed), lambda: self._minute(code, today, elapsed))
+
+    def _minute(self, code, today, elapsed):
+        prev_close, prices = self._path(code, today)
+        items = [f"{hm} {price:.2f} 100 1000.00" for hm, price in zip(MINUTES[:elapsed], prices)]
+        body = {"code": 0, "data": {code: {
+            "data": {"data": items, "date": today.strftime("%Y%m%d")},
+            "qt": {code: ["1", f"股票{code[2:]}", code[2:], "0", f"{prev_close:.2f}"]},
+        }}}
+        return json.dumps(body).encode("utf-8")
+
+    def five_days(self, code):
+        if code in self.recorded.get("fivedays", {}):
+            return self.recorded["fivedays"][code]
+        today = datetime.today().date()
+        return self._memo(("fivedays", code, today), lambda: self._five_days(code, today))
+
+    def _five_days(self, code, today):
+        days = []
+        for day in previous_weekdays(today, 5):
+            prev_close, prices = self._path(code, day)
+            days.append({"date": day.strftime("%Y%m%d"), "prec": f"{prev_close:.2f}",
+                         "data": [f"{hm} {price:.2f} 100 1000.00" for hm, price in zip(MINUTES, prices)]})
+        body = {"code": 0, "data": {code: {"data": days}}}
+        return f"fdays_data_{code}={json.dumps(body)}".encode("utf-8")
+
+    def respond(self, url):
+        """按 URL 生成 (响应体, 编码)，并计入请求数"""
+        endpoint = endpoint_of(url)
+        if endpoint == "realtime":
+            content, encoding = self.realtime(url.split("q=", 1)[1].split(",")), "gbk"
+        elif endpoint == "minute":
+            content, encoding = self.minute(url.split("code=", 1)[1]), "utf-8"
+        elif endpoint == "fivedays":
+            content, encoding = self.five_days(url.split("code=", 1)[1]), "utf-8"
+        else:
+            return b"", "utf-8"
+        self._count(endpoint)
+        return content, encoding
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.delay:
+            _time.sleep(self.delay)
+        content, encoding = self.respond(request.url)
+        response = make_response(request.url, content, encoding)
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def endpoint_of(url):
+    if "qt.gtimg.cn" in url:
+        return "realtime"
+    if "minute/query" in url:
+        return "minute"
+    if "day/query" in url:
+        return "fivedays"
+    return None
+
+
+def make_response(url, content, encoding):
+    response = Response()
+    response.status_code = 200 if content else 404
+    response._content = content
+    response.encoding = encoding
+    response.headers = CaseInsensitiveDict({"Content-Type": "text/plain"})
+    response.url = url
+    return response
+
+
+class CannedHttp:
+    """与 HttpClient.get 接口相同、直接返回 stub 响应的客户端（不经过 requests 会话与适配器），
+    用于只测量解析开销的微基准"""
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    def get(self, url, endpoint=None, timeout=10, headers=None):
+        return make_response(url, *self.stub.respond(url))
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+# ---------- 录制与回放 ----------
+def _recording_path(directory, endpoint, code):
+    return os.path.join(directory, f"{endpoint}_{code}.txt")
+
+
+def load_recordings(directory):
+    """{"realtime": code -> 该代码的一行行情, "minute"/"fivedays": code -> 响应体}"""
+    recorded = {"realtime": {}, "minute": {}, "fivedays": {}}
+    for name in sorted(os.listdir(directory)):
+        endpoint, _, rest = name.partition("_")
+        if endpoint not in recorded or not rest.endswith(".txt"):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            body = f.read()
+        if endpoint == "realtime":
+            for line in body.decode("gbk").split(";"):
+                match = re.search(r"v_(\w+)=", line)
+                if match:
+                    recorded["realtime"][match.group(1)] = line.strip()
+        else:
+            recorded[endpoint][rest[:-len(".txt")]] = body
+    return recorded
+
+
+class Recorder(HTTPAdapter):
+    """把真实上游的响应按端点和代码保存到 directory（供 UpstreamStub(replay_dir=...) 回放）"""
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        endpoint = endpoint_of(request.url)
+        if endpoint is not None and response.status_code == 200:
+            key = "batch" if endpoint == "realtime" else request.url.split("code=", 1)[1]
+            mode = "ab" if endpoint == "realtime" else "wb"
+            with open(_recording_path(self.directory, endpoint, key), mode) as f:
+                f.write(response.content)
+        return response
+
+
+def record(directory, codes):
+    """经由真实上游拉取 codes 的实时行情、当日分钟线和五日数据并保存"""
+    install(Recorder(directory))
+    service = data.DataService
+    service.history = None
+    service.get_realtime_data(codes + data.INDEX_CODES)
+    for code in codes:
+        service.get_minute_data(code)
+        service.get_5days_data(code)
+    print(f"recorded {len(codes)} codes into {directory}")
+
+
+def install(stub):
+    """让 DataService 当前及之后（configure_http 重建）的 HttpClient 都经由 stub（或 Recorder）应答"""
+
+    class StubHttpClient(HttpClient):
+        def _session_for(self, host):
+            session, semaphore = super()._session_for(host)
+            if session.get_adapter("http://") is not stub:
+                session.mount("http://", stub)
+                session.mount("https://", stub)
+            return session, semaphore
+
+    data.HttpClient = StubHttpClient
+    old = data.DataService.http
+    data.DataService.http = StubHttpClient(old.pool_size, old.max_retries, old.backoff, old.max_concurrency)
+    old.close()
+    return stub
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="录制真实上游响应，供基准测试回放")
+    parser.add_argument("--record", metavar="DIR", required=True)
+    parser.add_argument("codes", nargs="+")
+    args = parser.parse_args()
+    record(args.record, args.codes)
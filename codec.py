@@ -0,0 +1,54 @@
+import gzip
+import json
+import logging
+
+logger = logging.getLogger("Codec")
+
+# 可选依赖：有 orjson 时用它编码（快数倍，并直接支持 numpy 数值），有 brotli 时提供 br 压缩
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MIN_COMPRESS_BYTES = 1024    # 更小的响应压缩收益不大，直接发送原文
+
+# 按优先顺序排列的可用压缩编码
+ENCODINGS = (("br",) if brotli is not None else ()) + ("gzip",)
+
+
+def _default(value):
+    """标准库 json 无法编码的 numpy 数值/数组"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """编码为紧凑的 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode("utf-8")
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"unsupported encoding: {encoding}")
+
+
+def negotiate(accept_encodings, size):
+    """按请求的 Accept-Encoding（werkzeug 的 request.accept_encodings）选择压缩编码；不压缩时返回 None"""
+    if size < MIN_COMPRESS_BYTES:
+        return None
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
@@ -1,16 +1,55 @@
+import os
+import copy
 import json
+import fcntl
 import threading
 import logging
+from contextlib import contextmanager
 
 logger = logging.getLogger("ConfigManager")
 
 class ConfigManager:
     def __init__(self, config_file):
         self.config_file = config_file
-        self._lock = threading.Lock()
+        self._lock = threading.RLock()
         self.default_config = {
             "pairs": [],               # 空列表，不再预设任何套利对
-            "active_pair": ""          # 空字符串
+            "active_pair": "",         # 空字符串
+            "refresh_interval": 5,     # 交易时段后台刷新间隔（秒）
+            "idle_refresh_interval": 60,  # 休市期间检查交易时段的间隔（秒），不访问上游
+            "calendar": {              # 交易日历（见 market_calendar.py）
+                "holidays_file": "",   # 节假日文件，缺省为 HOLIDAYS_FILE 环境变量或内置 holidays.txt
+                "settle_seconds": 300,  # 每次休市后继续刷新的秒数（取得收盘数据），之后冻结快照
+                "holiday_confirm_ticks": 3,  # 开盘后连续几轮只拿到旧交易日数据才暂记当日休市
+                "holiday_recheck_seconds": 1800  # 暂记休市后，交易时段内重新确认的间隔（秒）
+            },
+            "fetch_deadline": 15,      # 每轮并发拉取的截止时间（秒）
+            "lookback": {              # 长周期价差视图的交易日数，可按 pair_id 单独设置
+                "default": 20
+            },
+            "stats": {                 # 价差滚动统计：窗口长度（分钟数）及分位数
+                "windows": [30, 60, 120],
+                "five_day_windows": [240, 1200],
+                "quantiles": [0.05, 0.5, 0.95]
+            },
+            "alerts": {                # 价差告警：rules 按 pair_id（"default" 作用于全部）配置
+                "rules": {},
+                "sinks": [{"type": "log"}],
+                "history_size": 500
+            },
+            "cache": {                 # 行情缓存：各数据源 TTL（秒）及容量上限
+                "realtime_ttl": 3,
+                "minute_ttl": 5,
+                "five_days_ttl": 30,
+                "history_ttl": 600,
+                "max_entries": 1024
+            },
+            "http": {                  # 上游 HTTP 连接池设置
+                "pool_size": 10,
+                "max_retries": 2,
+                "backoff": 0.2,
+                "max_concurrency": 4
+            }
         }
 
     def load_config(self):
@@ -24,7 +63,7 @@ class ConfigManager:
 
             # 补全缺失字段
             for key, val in self.default_config.items():
-                config.setdefault(key, val)
+                config.setdefault(key, copy.deepcopy(val))
 
             # 确保 active_pair 有效（如果 pairs 为空，则 active_pair 也为空）
             valid_ids = [f"{a}-{b}" for a, b in config.get("pairs", [])]
@@ -35,11 +74,33 @@ class ConfigManager:
 
             return config
 
+    def revision(self):
+        """配置文件的版本标识（文件被替换或修改后改变），供其他进程判断是否需要重新加载"""
+        try:
+            st = os.stat(self.config_file)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    @contextmanager
+    def transaction(self):
+        """跨进程串行化 读取-修改-保存（多 worker 部署时各进程共用同一配置文件）"""
+        with self._lock, open(self.config_file + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
     def save_config(self, config):
         with self._lock:
             try:
-                with open(self.config_file, 'w', encoding='utf-8') as f:
+                # 先写临时文件再替换，其他进程不会读到写了一半的配置
+                tmp_path = f"{self.config_file}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
                     json.dump(config, f, ensure_ascii=False, indent=2)
+                os.chmod(tmp_path, 0o666)
+                os.replace(tmp_path, self.config_file)
                 logger.info("Config saved successfully")
                 return True
             except Exception as e:
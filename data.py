@@ -1,22 +1,107 @@
-import requests
 import re
 import json
-import pandas as pd
+from bisect import bisect_left
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, time
+from time import perf_counter
 import numpy as np
 import logging
+import threading
+from collections import namedtuple
+
+import codec
+import metrics
+from alerts import AlertEngine
+from cache import SingleFlight, TTLCache
+from history_store import HistoryStore
+from http_client import HttpClient
+from market_calendar import AUCTION, CLOSE, CONTINUOUS, OPEN, PRE_OPEN, MarketCalendar
+from spread_history import SpreadPyramid, spread_series
+from spread_state import IntradaySpreadState, asof_indices, bars_to_arrays, format_minutes
+from spread_stats import SpreadStatistics
+from symbols import GRID_MINUTES, SymbolRegistry, SymbolSeries, latest_stats, pair_spreads
 
 logger = logging.getLogger("DataService")
 
+INDEX_CODES = [
+    "sh000001", "sz399001", "sz399006", "sh000688",
+    "sh000016", "sh000300", "sh000905", "sh000852"
+]
+
+
+MinuteBar = namedtuple("MinuteBar", ["datetime", "price", "changePercent"])
+
+# 各阶段耗时（上游请求耗时见 http_client 的 stockmonitor_upstream_request_seconds）
+STAGE_SECONDS = metrics.histogram("stockmonitor_stage_seconds", "Time spent in each data pipeline stage", ("stage",))
+# 被吞掉（返回空数据或跳过）的异常，按阶段和异常类型计数
+DATA_ERRORS = metrics.counter("stockmonitor_data_errors_total", "Errors swallowed by the data pipeline", ("stage", "cause"))
+
+
+def _count_error(stage, error):
+    DATA_ERRORS.inc(stage=stage, cause=type(error).__name__)
+
 
 class DataService:
-    _five_days_cache = {}
+    http = HttpClient()
+    # 各数据源的缓存；值为只读对象（分钟线为 MinuteBar 元组），命中时不拷贝
+    realtime_cache = TTLCache("realtime", ttl=3, max_entries=4096)
+    minute_cache = TTLCache("minute", ttl=5, max_entries=1024)
+    five_days_cache = TTLCache("five_days", ttl=30, max_entries=1024)
+    # 已收盘交易日的价差金字塔，键为 (两腿代码, 交易日元组)，历史不变时可长期复用
+    history_cache = TTLCache("history", ttl=600, max_entries=256)
+    _realtime_flight = SingleFlight()
+    # 异步接口在该线程池中执行阻塞的 HTTP 请求（复用 http 的连接池）
+    _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="DataFetch")
+    fetch_deadline = 15.0
+    # 已收盘交易日的本地分钟线存储（None 表示不落盘）
+    history = None
+    # 交易日历，用于判断本地存储是否已有上一交易日（None 时每天向上游对齐一次）
+    calendar = None
+
+    @classmethod
+    def configure(cls, config, history_root=None):
+        """按应用配置设置 HTTP 客户端、缓存、拉取截止时间及本地历史存储"""
+        cls.configure_http(config.get("http", {}))
+        cls.configure_cache(config.get("cache", {}))
+        try:
+            cls.configure_history(history_root)
+        except OSError as e:
+            logger.error(f"History store disabled: {e}")
+        cls.calendar = MarketCalendar.load(config.get("calendar", {}).get("holidays_file"))
+        cls.fetch_deadline = float(config.get("fetch_deadline", cls.fetch_deadline))
+
+    @classmethod
+    def configure_history(cls, root):
+        cls.history = HistoryStore(root) if root else None
+
+    @classmethod
+    def configure_http(cls, settings):
+        """按配置重建共享 HTTP 客户端"""
+        old = cls.http
+        cls.http = HttpClient(**settings)
+        old.close()
+
+    @classmethod
+    def configure_cache(cls, settings):
+        """按配置重建缓存：realtime_ttl / minute_ttl / five_days_ttl / history_ttl / max_entries"""
+        max_entries = settings.get("max_entries", 1024)
+        cls.realtime_cache = TTLCache("realtime", settings.get("realtime_ttl", 3), max_entries * 4)
+        cls.minute_cache = TTLCache("minute", settings.get("minute_ttl", 5), max_entries)
+        cls.five_days_cache = TTLCache("five_days", settings.get("five_days_ttl", 30), max_entries)
+        cls.history_cache = TTLCache("history", settings.get("history_ttl", 600), max(max_entries // 4, 1))
+
+    @classmethod
+    def cache_stats(cls):
+        caches = (cls.realtime_cache, cls.minute_cache, cls.five_days_cache, cls.history_cache)
+        return {cache.name: cache.stats() for cache in caches}
 
     @classmethod
     def clear_stock_cache(cls, code):
         """清除指定股票的缓存"""
-        if code in cls._five_days_cache:
-            del cls._five_days_cache[code]
+        cls.realtime_cache.invalidate(cls.to_market_code(code))
+        cls.minute_cache.invalidate(code)
+        cls.five_days_cache.invalidate(code)
 
     @staticmethod
     def _is_valid_trading_time(t: time) -> bool:
@@ -27,46 +112,72 @@ class DataService:
             return True
         return False
 
+    # qt.gtimg.cn 单次请求的代码数量上限，超出后按批拆分，避免 URL 过长
+    REALTIME_BATCH_SIZE = 60
+
+    @staticmethod
+    def to_market_code(code):
+        """补全市场前缀，如 600000 -> sh600000"""
+        if code.startswith(('sh', 'sz')):
+            return code
+        return f"{DataService.get_market_prefix(code)}{code}"
+
     @staticmethod
+    @STAGE_SECONDS.time(stage="get_realtime_data")
     def get_realtime_data(codes):
-        """获取实时行情数据（包含涨跌幅）"""
-        base_url = "http://qt.gtimg.cn/q="
-        market_codes = []
-        for c in codes:
-            if not c:
-                continue
-            if c.startswith(('sh', 'sz')):
-                market_codes.append(c)
+        """获取实时行情数据（包含涨跌幅），代码去重后只为未命中缓存的代码按批请求"""
+        market_codes = list(dict.fromkeys(DataService.to_market_code(c) for c in codes if c))
+        cache = DataService.realtime_cache
+        stock_info = {}
+        missing = []
+        for code in market_codes:
+            quote = cache.get(code)
+            if quote is None:
+                missing.append(code)
             else:
-                prefix = DataService.get_market_prefix(c)
-                market_codes.append(f"{prefix}{c}")
+                stock_info[code] = quote
+        size = DataService.REALTIME_BATCH_SIZE
+        for start in range(0, len(missing), size):
+            batch = tuple(missing[start:start + size])
+            try:
+                quotes = DataService._realtime_flight.do(batch, lambda: DataService._fetch_realtime_batch(batch))
+            except Exception as e:
+                _count_error("get_realtime_data", e)
+                logger.warning(f"Realtime fetch failed for {len(batch)} codes: {type(e).__name__}: {e}")
+                continue
+            for code, quote in quotes.items():
+                cache.put(code, quote)
+            stock_info.update(quotes)
+        return stock_info
 
-        try:
-            response = requests.get(base_url + ",".join(market_codes), timeout=5)
-            response.encoding = 'gbk'
-            data = response.text
-            stock_info = {}
+    @staticmethod
+    def _fetch_realtime_batch(market_codes):
+        base_url = "http://qt.gtimg.cn/q="
+        response = DataService.http.get(base_url + ",".join(market_codes), endpoint="realtime", timeout=5)
+        response.encoding = 'gbk'
+        data = response.text
+        parse_started = perf_counter()
+        stock_info = {}
 
-            for line in data.split(';'):
-                if not line:
-                    continue
-                parts = line.split('~')
-                if len(parts) < 33:
-                    continue
-                raw_code = parts[0].split('=')[0].split('_')[-1]
-                code = raw_code
-                if code.startswith('SH'):
-                    code = 'sh' + code[2:]
-                elif code.startswith('SZ'):
-                    code = 'sz' + code[2:]
-                stock_info[code] = {
-                    "name": parts[1],
-                    "price": float(parts[3]) if parts[3] else 0.0,
-                    "changePercent": float(parts[32]) / 100 if parts[32] else 0.0
-                }
-            return stock_info
-        except Exception as e:
-            return {}
+        for line in data.split(';'):
+            if not line:
+                continue
+            parts = line.split('~')
+            if len(parts) < 33:
+                continue
+            raw_code = parts[0].split('=')[0].split('_')[-1]
+            code = raw_code
+            if code.startswith('SH'):
+                code = 'sh' + code[2:]
+            elif code.startswith('SZ'):
+                code = 'sz' + code[2:]
+            stock_info[code] = {
+                "name": parts[1],
+                "price": float(parts[3]) if parts[3] else 0.0,
+                "changePercent": float(parts[32]) / 100 if parts[32] else 0.0
+            }
+        STAGE_SECONDS.observe(perf_counter() - parse_started, stage="parse_realtime")
+        return stock_info
 
     @staticmethod
     def get_market_prefix(code):
@@ -76,107 +187,271 @@ class DataService:
         return 'sh'
 
     @staticmethod
-    def get_minute_data(code):
-        """获取当日分钟级数据（每分钟）基于昨收价计算涨跌幅"""
+    def _full_code(code):
+        if code.startswith(('sh', 'sz')):
+            return code
+        market = "sh" if code.startswith(('6', '9', '688')) else "sz"
+        return f"{market}{code}"
+
+    @staticmethod
+    def _bars_since(bars, since):
+        """bars 中时间不早于 since 的尾部（从尾部向前扫描，开销与返回条数成正比）"""
+        start = len(bars)
+        while start > 0 and bars[start - 1].datetime >= since:
+            start -= 1
+        return bars[start:]
+
+    @staticmethod
+    @STAGE_SECONDS.time(stage="get_minute_data")
+    def get_minute_data(code, since=None):
+        """获取当日分钟级数据（每分钟）基于昨收价计算涨跌幅
+
+        返回 MinuteBar 元组；since 为当日已有的最新分钟时，只返回该分钟（含）之后的数据。
+        """
         try:
-            if code.startswith(('sh', 'sz')):
-                full_code = code
-            else:
-                market = "sh" if code.startswith(('6', '9', '688')) else "sz"
-                full_code = f"{market}{code}"
+            bars = DataService.minute_cache.get_or_load(code, lambda: DataService._load_minute_data(code))
+        except Exception as e:
+            _count_error("get_minute_data", e)
+            logger.warning(f"Minute fetch failed for {code}: {type(e).__name__}: {e}")
+            return ()
+        if since is not None:
+            return DataService._bars_since(bars, since)
+        return bars
 
-            url = f"https://web.ifzq.gtimg.cn/appstock/app/minute/query?code={full_code}"
-            response = requests.get(url, timeout=10)
-            data = response.json()
+    @staticmethod
+    def _load_minute_data(code):
+        """从上游拉取当日分钟线；缓存中已有同日数据时只解析其最后一分钟（含）之后的部分"""
+        full_code = DataService._full_code(code)
+        url = f"https://web.ifzq.gtimg.cn/appstock/app/minute/query?code={full_code}"
+        response = DataService.http.get(url, endpoint="minute", timeout=10)
+        parse_started = perf_counter()
+        data = response.json()
 
-            qt_data = data["data"][full_code].get("qt", {}).get(full_code, [0] * 5)
-            close_prev = float(qt_data[4]) if len(qt_data) >= 5 else 0
+        qt_data = data["data"][full_code].get("qt", {}).get(full_code, [0] * 5)
+        close_prev = float(qt_data[4]) if len(qt_data) >= 5 else 0
 
-            minute_data = []
+        day_data = data["data"][full_code]["data"]
+        try:
+            base_date = datetime.strptime(day_data.get("date", ""), "%Y%m%d").date()
+        except ValueError:
             base_date = datetime.now().date()
-            for item in data["data"][full_code]["data"]["data"]:
-                parts = item.split()
-                if len(parts) >= 3:
-                    try:
-                        dt_time = datetime.strptime(parts[0], "%H%M").time()
-                        full_dt = datetime.combine(base_date, dt_time)
-
-                        if not DataService._is_valid_trading_time(dt_time):
-                            continue
-
-                        price = float(parts[1])
-                        changePercent = (price - close_prev) / close_prev if close_prev != 0 else 0
-                        minute_data.append({
-                            "datetime": full_dt,
-                            "price": price,
-                            "changePercent": changePercent
-                        })
-                    except Exception:
+        items = day_data["data"]
+        previous = DataService.minute_cache.peek(code) or ()
+        if previous and previous[-1].datetime.date() == base_date:
+            since = previous[-1].datetime
+            since_key = since.strftime("%H%M")
+            start = len(items)
+            while start > 0 and items[start - 1][:4] >= since_key:
+                start -= 1
+            items = items[start:]
+            kept = previous[:len(previous) - len(DataService._bars_since(previous, since))]
+        else:
+            kept = ()
+
+        minute_data = []
+        for item in items:
+            parts = item.split()
+            if len(parts) >= 3:
+                try:
+                    dt_time = datetime.strptime(parts[0], "%H%M").time()
+                    full_dt = datetime.combine(base_date, dt_time)
+
+                    if not DataService._is_valid_trading_time(dt_time):
                         continue
-            return minute_data
-        except Exception as e:
-            return []
+
+                    price = float(parts[1])
+                    changePercent = (price - close_prev) / close_prev if close_prev != 0 else 0
+                    minute_data.append(MinuteBar(full_dt, price, changePercent))
+                except Exception:
+                    continue
+        STAGE_SECONDS.observe(perf_counter() - parse_started, stage="parse_minute")
+        return kept + tuple(minute_data)
 
     @staticmethod
+    @STAGE_SECONDS.time(stage="get_5days_data")
     def get_5days_data(code):
-        """获取五日分钟级数据（带缓存）"""
+        """获取五日分钟级数据（带缓存），返回 MinuteBar 元组"""
         try:
-            now = datetime.now()
-            if code in DataService._five_days_cache:
-                cached_time, cached_data = DataService._five_days_cache[code]
-                if (now - cached_time).total_seconds() < 30:
-                    return cached_data.copy()
-
-            if code.startswith(('sh', 'sz')):
-                full_code = code
-            else:
-                market = "sh" if code.startswith(('6', '9', '688')) else "sz"
-                full_code = f"{market}{code}"
+            return DataService.five_days_cache.get_or_load(code, lambda: DataService._load_5days_data(code))
+        except Exception as e:
+            _count_error("get_5days_data", e)
+            logger.warning(f"Five-day fetch failed for {code}: {type(e).__name__}: {e}")
+            return ()
 
-            url = f"https://web.ifzq.gtimg.cn/appstock/app/day/query?_var=fdays_data_{full_code}&code={full_code}"
-            response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
-            json_str = re.search(r'=\s*({.*})', response.text, re.DOTALL).group(1)
-            data = json.loads(json_str)
+    @staticmethod
+    def _load_5days_data(code):
+        """优先由本地存储的已收盘交易日 + 当日分钟线拼出五日数据；
+        本地已有上一交易日及之前的五个交易日时不请求上游，否则每个代码每天最多请求一次，
+        用于补齐最近一个已存储交易日之后缺失的交易日"""
+        full_code = DataService._full_code(code)
+        store = DataService.history
+        today = datetime.now().date()
+        if store is not None:
+            # 已收盘交易日由刷新线程在收盘后落盘（见 MultiPairManager._persist_closed_sessions）
+            stored = [day for day in store.days(full_code) if day < today]
+            calendar = DataService.calendar
+            covered = (len(stored) >= 5 and calendar is not None
+                       and stored[-1] >= calendar.previous_trading_day(today))
+            # 当天已与上游对齐：本地不足五日（新股、长期停牌）时直接使用已有部分，不再每次缓存过期都请求上游
+            if covered or store.synced_on(full_code) == today:
+                bars = DataService._5days_from_store(store, code, full_code, today)
+                if bars is not None:
+                    return bars
+
+        url = f"https://web.ifzq.gtimg.cn/appstock/app/day/query?_var=fdays_data_{full_code}&code={full_code}"
+        response = DataService.http.get(url, endpoint="fivedays", timeout=10,
+                                        headers={"User-Agent": "Mozilla/5.0"})
+        parse_started = perf_counter()
+        json_str = re.search(r'=\s*({.*})', response.text, re.DOTALL).group(1)
+        data = json.loads(json_str)
+
+        if data.get("code") != 0:
+            raise ValueError(f"upstream returned code {data.get('code')}")
 
-            if data.get("code") != 0:
-                return []
+        days_data = data["data"][full_code]["data"][-5:][::-1]
+        oldest_day = days_data[0]
+        close_prev_oldest = float(oldest_day["prec"]) if oldest_day["prec"] else 0
 
-            days_data = data["data"][full_code]["data"][-5:][::-1]
-            oldest_day = days_data[0]
-            close_prev_oldest = float(oldest_day["prec"]) if oldest_day["prec"] else 0
+        all_data = []
+        persisted = True
+        for day in days_data:
+            date_str = day["date"]
+            day_bars = []
+            try:
+                trade_date = datetime.strptime(date_str, "%Y%m%d").date()
+                for time_entry in day["data"]:
+                    time_part = time_entry.split()[0]
+                    dt_time = datetime.strptime(time_part, "%H%M").time()
+                    full_dt = datetime.combine(trade_date, dt_time)
 
-            all_data = []
-            for day in days_data:
-                date_str = day["date"]
+                    if not DataService._is_valid_trading_time(dt_time):
+                        continue
+
+                    price = float(time_entry.split()[1])
+                    changePercent = (price - close_prev_oldest) / close_prev_oldest if close_prev_oldest != 0 else 0
+                    day_bars.append(MinuteBar(full_dt, price, changePercent))
+            except Exception as e:
+                _count_error("parse_five_days", e)
+                continue
+            all_data.extend(day_bars)
+            # 当日之前的交易日已收盘，落盘后不再变化
+            if store is not None and trade_date < today and day_bars and day.get("prec"):
                 try:
-                    trade_date = datetime.strptime(date_str, "%Y%m%d").date()
-                    for time_entry in day["data"]:
-                        time_part = time_entry.split()[0]
-                        dt_time = datetime.strptime(time_part, "%H%M").time()
-                        full_dt = datetime.combine(trade_date, dt_time)
-
-                        if not DataService._is_valid_trading_time(dt_time):
-                            continue
-
-                        price = float(time_entry.split()[1])
-                        changePercent = (price - close_prev_oldest) / close_prev_oldest if close_prev_oldest != 0 else 0
-                        all_data.append({
-                            "datetime": full_dt,
-                            "price": price,
-                            "changePercent": changePercent
-                        })
-                except Exception as e:
-                    continue
+                    store.write_day(full_code, trade_date, float(day["prec"]),
+                                    [bar.datetime for bar in day_bars], [bar.price for bar in day_bars])
+                except (OSError, ValueError) as e:
+                    persisted = False
+                    _count_error("history_store", e)
+                    logger.warning(f"Failed to persist {full_code} {trade_date}: {e}")
+        # 含已收盘交易日落盘的耗时
+        STAGE_SECONDS.observe(perf_counter() - parse_started, stage="parse_five_days")
+        # 有交易日落盘失败时不记为已对齐，下次缓存过期后重新请求上游
+        if store is not None and persisted:
+            try:
+                store.mark_synced(full_code, today)
+            except OSError as e:
+                logger.warning(f"Failed to mark {full_code} synced: {e}")
+        return tuple(all_data)
 
-            DataService._five_days_cache[code] = (now, all_data.copy())
-            return all_data
-        except Exception as e:
-            return []
+    @staticmethod
+    def _5days_from_store(store, code, full_code, today):
+        """本地存储的最近交易日（内存映射读取）+ 当日分钟线；不足五日时返回已有的部分，
+        某个交易日的文件无法读取时返回 None"""
+        today_bars = DataService.get_minute_data(code)
+        # 非交易日上游返回的是已落盘的最近交易日，此时不单独拼接当日
+        days, live = store.window([full_code], 5, today, today_bars[-1].datetime.date() if today_bars else None)
+        if not days:
+            # 没有已收盘的交易日（上市首日）：当日分钟线的涨跌幅即相对昨收
+            return tuple(today_bars) if live else ()
+        segment = store.read_days(full_code, days)
+        if segment is None:
+            return None
+        close_prev_oldest, stamps, prices = segment
+
+        if close_prev_oldest != 0:
+            changes = (prices - close_prev_oldest) / close_prev_oldest
+        else:
+            changes = np.zeros(len(prices))
+        all_data = list(map(MinuteBar, stamps.astype(datetime).tolist(), prices.tolist(), changes.tolist()))
+        if live:
+            for bar in today_bars:
+                changePercent = (bar.price - close_prev_oldest) / close_prev_oldest if close_prev_oldest != 0 else 0
+                all_data.append(MinuteBar(bar.datetime, bar.price, changePercent))
+        return tuple(all_data)
 
+    # ---------- 异步接口 ----------
+    @staticmethod
+    async def _run_blocking(func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(DataService._executor, func, *args)
+
+    @staticmethod
+    async def get_realtime_data_async(codes):
+        return await DataService._run_blocking(DataService.get_realtime_data, codes)
+
+    @staticmethod
+    async def get_minute_data_async(code, since=None):
+        return await DataService._run_blocking(DataService.get_minute_data, code, since)
+
+    @staticmethod
+    async def get_5days_data_async(code):
+        return await DataService._run_blocking(DataService.get_5days_data, code)
+
+    @staticmethod
+    async def fetch_tick_async(realtime_codes, series_codes, deadline=None):
+        """并发拉取一轮所需的全部数据，共享同一截止时间。
+
+        series_codes 为代码列表，或 code -> since 的字典（分钟线增量拉取起点）。
+        返回 (realtime_data, series)，series 为 code -> {"minute": [...], "five_days": [...]}；
+        超过截止时间仍未完成的请求按空结果处理。
+        """
+        deadline = DataService.fetch_deadline if deadline is None else deadline
+        if isinstance(series_codes, dict):
+            minute_since = series_codes
+        else:
+            minute_since = dict.fromkeys(series_codes)
+        series_codes = [c for c in minute_since if c]
+        jobs = {}
+        if realtime_codes:
+            jobs[("realtime", None)] = DataService.get_realtime_data_async(realtime_codes)
+        for code in series_codes:
+            jobs[("minute", code)] = DataService.get_minute_data_async(code, minute_since[code])
+            jobs[("five_days", code)] = DataService.get_5days_data_async(code)
+
+        tasks = {asyncio.ensure_future(coro): key for key, coro in jobs.items()}
+        results = {}
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=deadline)
+            for task in pending:
+                task.cancel()
+            if pending:
+                DATA_ERRORS.inc(len(pending), stage="fetch_tick", cause="DeadlineExceeded")
+                logger.warning(f"{len(pending)} fetches missed the {deadline}s deadline")
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    results[tasks[task]] = task.result()
+
+        realtime_data = results.get(("realtime", None), {})
+        series = {
+            code: {
+                "minute": results.get(("minute", code), []),
+                "five_days": results.get(("five_days", code), []),
+            }
+            for code in series_codes
+        }
+        return realtime_data, series
+
+    @staticmethod
+    @STAGE_SECONDS.time(stage="fetch_tick")
+    def fetch_tick(realtime_codes, series_codes, deadline=None):
+        """fetch_tick_async 的同步封装，供 Flask 路由及后台线程调用"""
+        return asyncio.run(DataService.fetch_tick_async(realtime_codes, series_codes, deadline))
 
 class StockMonitorApp:
-    def __init__(self, config):
-        """初始化股票监控应用"""
+    def __init__(self, config, symbols=None):
+        """初始化股票监控应用；symbols 为多个套利对共享的分钟线数据面，缺省时独占一个"""
+        self.symbols = symbols if symbols is not None else SymbolRegistry()
+        self.refresh_lock = threading.Lock()    # 同一套利对的同步刷新只进行一次
         self.stocks = [
             {
                 "code": config.get("stock1", ""),
@@ -193,10 +468,10 @@ class StockMonitorApp:
         ]
         self.current_diff = 0.0
         self.pair_key = f"{config.get('stock1', '')}-{config.get('stock2', '')}"
+        self.stats_settings = dict(config.get("stats", {}))
         self.intraday_data = []
+        self.intraday_state = IntradaySpreadState(self._acquire_legs(), self._intraday_statistics)
         self.five_day_data = []
-        self.stock1_minute_data = []
-        self.stock2_minute_data = []
         self.intraday_stats = {
             "current": 0.0, "current_time": "",
             "max": 0.0, "max_time": "",
@@ -210,19 +485,36 @@ class StockMonitorApp:
         }
         self.stock1_chart_data = {"prices": [], "times": [], "change_percent": []}
         self.stock2_chart_data = {"prices": [], "times": [], "change_percent": []}
-        self.index_codes = [
-            "sh000001", "sz399001", "sz399006", "sh000688",
-            "sh000016", "sh000300", "sh000905", "sh000852"
-        ]
+        self.index_codes = list(INDEX_CODES)
+        self.five_day_version = 0
+        self._five_day_inputs = None    # 上次计算五日价差所用的两腿五日数据
+        # 最近一次刷新是否完整：两腿都拿到了实时行情且分时/五日计算未出错；不完整时不评估告警
+        self.refresh_complete = False
+
+    def _intraday_statistics(self):
+        settings = self.stats_settings
+        return SpreadStatistics(settings.get("windows", (30, 60, 120)), settings.get("quantiles", (0.05, 0.5, 0.95)))
+
+    def _acquire_legs(self):
+        return tuple(self.symbols.acquire(stock['code']) if stock.get('code') else SymbolSeries()
+                     for stock in self.stocks)
+
+    def release(self):
+        """释放两条腿在共享数据面中的引用（套利对删除或换股时调用）"""
+        for leg in self.intraday_state.legs:
+            if leg.code:
+                self.symbols.release(leg.code)
 
     def update_config(self, new_config):
+        self.release()
         self.stocks[0]['code'] = new_config.get("stock1", "")
         self.stocks[1]['code'] = new_config.get("stock2", "")
         self.pair_key = f"{new_config.get('stock1', '')}-{new_config.get('stock2', '')}"
+        self.stats_settings = dict(new_config.get("stats", self.stats_settings))
         self.intraday_data = []
+        self.intraday_state = IntradaySpreadState(self._acquire_legs(), self._intraday_statistics)
         self.five_day_data = []
-        self.stock1_minute_data = []
-        self.stock2_minute_data = []
+        self._five_day_inputs = None
         self.intraday_stats = {
             "current": 0.0, "current_time": "",
             "max": 0.0, "max_time": "",
@@ -237,45 +529,36 @@ class StockMonitorApp:
         self.stock1_chart_data = {"prices": [], "times": [], "change_percent": []}
         self.stock2_chart_data = {"prices": [], "times": [], "change_percent": []}
 
-    def refresh_data(self):
-        try:
-            self._fetch_realtime_data()
-            self._fetch_minute_data()
-            return self._prepare_response()
-        except Exception as e:
-            response = {
-                "stock1": {"code": "", "name": "错误", "price": 0, "changePercent": 0},
-                "stock2": {"code": "", "name": "错误", "price": 0, "changePercent": 0},
-                "diff": {"current": 0},
-                "intraday": {"data": [], "stats": {}},
-                "fiveDay": {"data": [], "stats": {}},
-                "stock1ChartData": {"prices": [], "times": [], "change_percent": []},
-                "stock2ChartData": {"prices": [], "times": [], "change_percent": []}
-            }
-            for i in range(1, 9):
-                response[f"index{i}"] = {"name": f"指数{i}", "price": 0.0, "changePercent": 0.0}
-            return response
+    def refresh_data(self, realtime_data=None, series=None):
+        """刷新数据；realtime_data/series 为管理器批量拉取的数据，缺省时自行并发拉取。
+        计算出错时抛出异常，由管理器保留该套利对上一次的快照（不发布占位数据）"""
+        if realtime_data is None or series is None:
+            realtime_data, series = DataService.fetch_tick(self.realtime_codes(), self.minute_cursors())
+            self.symbols.ingest(series)
+        self.refresh_complete = True
+        self._apply_realtime_data(realtime_data)
+        self._fetch_minute_data(series)
+        return self._prepare_response(realtime_data)
 
-    def _fetch_realtime_data(self):
+    def realtime_codes(self):
+        """本套利对需要的实时行情代码（含指数）"""
         codes = [s.get('code', '') for s in self.stocks if s.get('code')]
-        codes += self.index_codes
-        if not codes:
-            return
-        realtime_data = DataService.get_realtime_data(codes)
+        return codes + self.index_codes
+
+    def _apply_realtime_data(self, realtime_data):
         for stock in self.stocks:
             code = stock.get('code', '')
             if not code:
                 continue
-            code_key = code
-            if not code.startswith(('sh', 'sz')):
-                prefix = DataService.get_market_prefix(code)
-                code_key = f"{prefix}{code}"
+            code_key = DataService.to_market_code(code)
             if code_key in realtime_data:
                 data = realtime_data[code_key]
                 stock['name'] = data.get('name', f"股票{code}")
                 stock['price'] = data.get('price', 0.0)
                 stock['changePercent'] = data.get('changePercent', 0.0)
             else:
+                # 本轮未拿到行情（拉取失败或超时），价格沿用上一轮
+                self.refresh_complete = False
                 if not stock.get('name'):
                     stock['name'] = f"股票{code}"
         try:
@@ -285,90 +568,148 @@ class StockMonitorApp:
             self.intraday_stats['current'] = self.current_diff
             self.intraday_stats['current_time'] = datetime.now().strftime("%H:%M")
         except Exception as e:
+            self.refresh_complete = False
+            _count_error("apply_realtime_data", e)
             logger.error(f"Error calculating spread: {str(e)}")
 
-    def _fetch_minute_data(self):
+    def minute_cursors(self):
+        """各腿分钟线的增量拉取起点；当日尚无数据时为 None（全量拉取）"""
+        return self.symbols.minute_cursors([stock['code'] for stock in self.stocks if stock.get('code')])
+
+    def _fetch_minute_data(self, series):
         if not all(stock.get('code') for stock in self.stocks):
             return
         try:
-            self.stock1_minute_data = DataService.get_minute_data(self.stocks[0]['code'])
-            self.stock2_minute_data = DataService.get_minute_data(self.stocks[1]['code'])
-            self._process_intraday_data(self.stock1_minute_data, self.stock2_minute_data)
-            stock1_5days = DataService.get_5days_data(self.stocks[0]['code'])
-            stock2_5days = DataService.get_5days_data(self.stocks[1]['code'])
-            self._process_five_day_data(stock1_5days, stock2_5days)
+            series1 = series.get(self.stocks[0]['code'], {})
+            series2 = series.get(self.stocks[1]['code'], {})
+            self._update_intraday_data()
+            five_days = (series1.get("five_days", []), series2.get("five_days", []))
+            # 五日数据是按代码缓存的元组：两腿都与上一轮是同一对象时结果不变，跳过重算
+            last = self._five_day_inputs
+            if last is not None and five_days[0] is last[0] and five_days[1] is last[1]:
+                return
+            previous = self.five_day_data
+            self._process_five_day_data(*five_days)
+            self._five_day_inputs = five_days
+            if self.five_day_data != previous:
+                self.five_day_version += 1
+                self._update_five_day_rolling()
         except Exception as e:
+            self.refresh_complete = False
+            _count_error("update_series", e)
             logger.error(f"Error fetching minute data: {str(e)}")
 
-    def _process_intraday_data(self, data1, data2):
-        self.intraday_data = []
-        if not data1 or not data2:
+    @STAGE_SECONDS.time(stage="update_intraday")
+    def _update_intraday_data(self):
+        """从共享的两腿分钟线增量推进价差，换日时全量重建"""
+        state = self.intraday_state
+        dates = [leg.trade_date for leg in state.legs if leg.trade_date]
+        if not dates:
             return
-        df1 = pd.DataFrame(data1)
-        df2 = pd.DataFrame(data2)
-        if 'datetime' not in df1.columns or 'datetime' not in df2.columns:
+        trade_date = max(dates)
+        if state.trade_date != trade_date:
+            self._process_intraday_data(trade_date)
+        else:
+            state.advance()
+        self._publish_intraday()
+
+    @STAGE_SECONDS.time(stage="process_intraday_data")
+    def _process_intraday_data(self, trade_date):
+        """以两腿完整分钟线重建当日价差状态"""
+        state = self.intraday_state
+        state.reset(trade_date)
+        frontier = state.frontier()
+        if frontier is None:
             return
-        df1 = df1.sort_values('datetime')
-        df2 = df2.sort_values('datetime')
-        merged = pd.merge_asof(df1, df2, on='datetime', suffixes=('_1', '_2'), tolerance=pd.Timedelta('1min')).dropna()
-        merged['diff'] = merged['changePercent_1'] - merged['changePercent_2']
+        leg1, leg2 = state.legs
+        t1, p1, c1 = leg1.arrays()
+        t2, p2, c2 = leg2.arrays()
+        idx, hit = asof_indices(t1, t2, 1)
+        hit &= t1 < np.datetime64(frontier, "m")
+        hit &= ~(np.isnan(p1) | np.isnan(c1) | np.isnan(p2[idx]) | np.isnan(c2[idx]))
+        idx = idx[hit]
+        diff = c1[hit] - c2[idx]
+        state.extend(
+            [leg1.times[i] for i in np.flatnonzero(hit).tolist()],
+            format_minutes(t1[hit], 11, 16),
+            p1[hit].tolist(),
+            c1[hit].tolist(),
+            p2[idx].tolist(),
+            c2[idx].tolist(),
+            diff.tolist(),
+        )
+
+    def _publish_intraday(self):
+        """由增量状态生成图表序列与统计（已提交部分只做列表拷贝）"""
+        state = self.intraday_state
+        provisional = state.provisional()
+        times = state.times + [row[1] for row in provisional]
+        self.intraday_data = state.rows + [{"time": row[1], "value": row[6]} for row in provisional]
         self.stock1_chart_data = {
-            "prices": merged["price_1"].tolist(),
-            "times": merged["datetime"].dt.strftime("%H:%M").tolist(),
-            "change_percent": merged["changePercent_1"].tolist()
+            "prices": state.prices1 + [row[2] for row in provisional],
+            "times": times,
+            "change_percent": state.change1 + [row[3] for row in provisional]
         }
         self.stock2_chart_data = {
-            "prices": merged["price_2"].tolist(),
-            "times": merged["datetime"].dt.strftime("%H:%M").tolist(),
-            "change_percent": merged["changePercent_2"].tolist()
+            "prices": state.prices2 + [row[4] for row in provisional],
+            "times": times,
+            "change_percent": state.change2 + [row[5] for row in provisional]
         }
-        for _, row in merged.iterrows():
-            self.intraday_data.append({"time": row["datetime"].strftime("%H:%M"), "value": row['diff']})
-        if not merged.empty:
-            max_idx = merged['diff'].idxmax()
-            max_row = merged.loc[max_idx]
-            self.intraday_stats['max'] = max_row['diff']
-            self.intraday_stats['max_time'] = max_row['datetime'].strftime("%H:%M")
-            min_idx = merged['diff'].idxmin()
-            min_row = merged.loc[min_idx]
-            self.intraday_stats['min'] = min_row['diff']
-            self.intraday_stats['min_time'] = min_row['datetime'].strftime("%H:%M")
-            last_row = merged.iloc[-1]
-            self.intraday_stats['latest_time'] = last_row['datetime'].strftime("%H:%M")
+        if not times:
+            return
+        high, low = state.extremes(provisional)
+        self.intraday_stats['max'], self.intraday_stats['max_time'] = high
+        self.intraday_stats['min'], self.intraday_stats['min_time'] = low
+        self.intraday_stats['latest_time'] = times[-1]
 
+    @STAGE_SECONDS.time(stage="process_five_day_data")
     def _process_five_day_data(self, data1, data2):
         self.five_day_data = []
         if not data1 or not data2:
             return
-        df1 = pd.DataFrame(data1)
-        df2 = pd.DataFrame(data2)
-        if 'datetime' not in df1.columns or 'datetime' not in df2.columns:
+        leg1, leg2 = self.intraday_state.legs
+        t1, c1 = leg1.five_day_arrays(data1)
+        t2, c2 = leg2.five_day_arrays(data2)
+        idx, hit = asof_indices(t1, t2, 5)
+        idx = idx[hit]
+        diff = c1[hit] - c2[idx]
+        valid = ~np.isnan(diff)
+        diff = diff[valid]
+        if not len(diff):
             return
-        df1 = df1.sort_values('datetime')
-        df2 = df2.sort_values('datetime')
-        merged = pd.merge_asof(df1, df2, on='datetime', suffixes=('_1', '_2'), tolerance=pd.Timedelta('5min')).dropna()
-        merged['diff'] = merged['changePercent_1'] - merged['changePercent_2']
-        for _, row in merged.iterrows():
-            self.five_day_data.append({"datetime": row["datetime"].strftime("%m-%d %H:%M"), "value": row['diff']})
-        if not merged.empty:
-            last_row = merged.iloc[-1]
-            last_diff = last_row['diff']
-            last_time = last_row['datetime'].strftime("%m-%d %H:%M")
-            max_idx = merged['diff'].idxmax()
-            max_row = merged.loc[max_idx]
-            max_time = max_row["datetime"].strftime("%m-%d %H:%M")
-            min_idx = merged['diff'].idxmin()
-            min_row = merged.loc[min_idx]
-            min_time = min_row["datetime"].strftime("%m-%d %H:%M")
-            self.five_day_stats['current'] = last_diff
-            self.five_day_stats['current_date'] = last_time
-            self.five_day_stats['max'] = max_row['diff']
-            self.five_day_stats['max_date'] = max_time
-            self.five_day_stats['min'] = min_row['diff']
-            self.five_day_stats['min_date'] = min_time
-
-    def _prepare_response(self):
-        index_data = DataService.get_realtime_data(self.index_codes)
+        labels = format_minutes(t1[hit][valid], 5, 16)
+        values = diff.tolist()
+        self.five_day_data = [{"datetime": label, "value": value} for label, value in zip(labels, values)]
+        max_idx = int(np.argmax(diff))
+        min_idx = int(np.argmin(diff))
+        self.five_day_stats['current'] = values[-1]
+        self.five_day_stats['current_date'] = labels[-1]
+        self.five_day_stats['max'] = values[max_idx]
+        self.five_day_stats['max_date'] = labels[max_idx]
+        self.five_day_stats['min'] = values[min_idx]
+        self.five_day_stats['min_date'] = labels[min_idx]
+
+    @STAGE_SECONDS.time(stage="update_five_day_rolling")
+    def _update_five_day_rolling(self):
+        """五日序列只在数据变化时重新计算滚动统计"""
+        values = [row["value"] for row in self.five_day_data]
+        if not values:
+            self.five_day_stats.pop('rolling', None)
+            return
+        settings = self.stats_settings
+        stats = SpreadStatistics(settings.get("five_day_windows", (240, 1200)), settings.get("quantiles", (0.05, 0.5, 0.95)))
+        stats.extend(values)
+        self.five_day_stats['rolling'] = stats.snapshot(values[-1])
+
+    def _intraday_stats_block(self):
+        stats = dict(self.intraday_stats)
+        rolling = self.intraday_state.stats
+        if rolling is not None:
+            stats['rolling'] = rolling.snapshot(self.current_diff)
+        return stats
+
+    @STAGE_SECONDS.time(stage="prepare_response")
+    def _prepare_response(self, index_data):
         response = {
             "stock1": {
                 "code": self.stocks[0].get('code', ''),
@@ -383,8 +724,16 @@ class StockMonitorApp:
                 "changePercent": self.stocks[1].get('changePercent', 0.0)
             },
             "diff": {"current": self.current_diff},
-            "intraday": {"data": self.intraday_data, "stats": self.intraday_stats},
-            "fiveDay": {"data": self.five_day_data, "stats": self.five_day_stats},
+            "intraday": {
+                "data": self.intraday_data,
+                "stats": self._intraday_stats_block(),
+                "date": self.intraday_state.trade_date.isoformat() if self.intraday_state.trade_date else ""
+            },
+            "fiveDay": {
+                "data": self.five_day_data,
+                "stats": dict(self.five_day_stats),
+                "version": self.five_day_version
+            },
             "stock1ChartData": self.stock1_chart_data,
             "stock2ChartData": self.stock2_chart_data,
             "index1": index_data.get(self.index_codes[0], {}),
@@ -402,37 +751,333 @@ class StockMonitorApp:
                 response[index_key] = {"name": f"指数{i}", "price": 0.0, "changePercent": 0.0}
         return response
 
-    def get_frontend_data(self):
-        return self.refresh_data()
+    def get_frontend_data(self, realtime_data=None, series=None):
+        return self.refresh_data(realtime_data, series)
+
+
+def _column(values, precision=None, dtype=None):
+    """数值列表按需降低精度：dtype='float32' 时取 float32 的最短表示，precision 为保留小数位"""
+    if not values or (precision is None and dtype is None):
+        return list(values)
+    arr = np.asarray(values, dtype=np.float64)
+    if precision is not None:
+        arr = np.round(arr, precision)
+    if dtype == "float32":
+        return [float(str(v)) for v in arr.astype(np.float32)]
+    return arr.tolist()
+
+
+@STAGE_SECONDS.time(stage="to_columnar")
+def to_columnar(data, precision=None, dtype=None):
+    """将行式响应转换为列式：分时价差与两只股票走势共享同一时间轴，数值为并行数组"""
+    intraday = data.get("intraday", {})
+    five_day = data.get("fiveDay", {})
+    rows = intraday.get("data", [])
+    five_rows = five_day.get("data", [])
+    chart1 = data.get("stock1ChartData", {})
+    chart2 = data.get("stock2ChartData", {})
+    result = {key: value for key, value in data.items()
+              if key not in ("intraday", "fiveDay", "stock1ChartData", "stock2ChartData")}
+    result["format"] = "columnar"
+    result["intraday"] = {
+        "times": [row["time"] for row in rows],
+        "values": _column([row["value"] for row in rows], precision, dtype),
+        "stock1": {
+            "prices": _column(chart1.get("prices", []), None, dtype),
+            "changePercent": _column(chart1.get("change_percent", []), precision, dtype),
+        },
+        "stock2": {
+            "prices": _column(chart2.get("prices", []), None, dtype),
+            "changePercent": _column(chart2.get("change_percent", []), precision, dtype),
+        },
+        "stats": intraday.get("stats", {}),
+        "date": intraday.get("date", ""),
+    }
+    result["fiveDay"] = {
+        "times": [row["datetime"] for row in five_rows],
+        "values": _column([row["value"] for row in five_rows], precision, dtype),
+        "stats": five_day.get("stats", {}),
+        "version": five_day.get("version", 0),
+    }
+    return result
+
+
+def history_payload(pyramid, resolution, precision=None, dtype=None):
+    """价差金字塔某一层的列式响应；日线时间为 'YYYY-MM-DD'，其余为 'YYYY-MM-DD HH:MM'"""
+    stamps, opens, highs, lows, closes = pyramid.levels[resolution]
+    return {
+        "format": "columnar",
+        "resolution": resolution,
+        "resolutions": pyramid.sizes(),
+        "times": format_minutes(stamps, 0, 10 if resolution == "1d" else 16),
+        "open": _column(opens.tolist(), precision, dtype),
+        "high": _column(highs.tolist(), precision, dtype),
+        "low": _column(lows.tolist(), precision, dtype),
+        "close": _column(closes.tolist(), precision, dtype),
+    }
+
+
+def to_delta(payload, since, five_day_version=None):
+    """从列式响应中裁出增量：只保留 since（'YYYY-MM-DDTHH:MM'）及之后的分时点；
+    客户端五日数据版本未变时省略 fiveDay。游标与当前交易日不符时返回 None（需全量）"""
+    intraday = payload.get("intraday", {})
+    date, _, hm = since.partition("T")
+    if payload.get("format") != "columnar" or not hm or date != intraday.get("date"):
+        return None
+    start = bisect_left(intraday["times"], hm)
+    result = dict(payload)
+    result["delta"] = True
+    result["intraday"] = {
+        "from": hm,
+        "date": intraday["date"],
+        "times": intraday["times"][start:],
+        "values": intraday["values"][start:],
+        "stock1": {key: values[start:] for key, values in intraday["stock1"].items()},
+        "stock2": {key: values[start:] for key, values in intraday["stock2"].items()},
+        "stats": intraday["stats"],
+    }
+    if five_day_version is not None and payload.get("fiveDay", {}).get("version") == five_day_version:
+        del result["fiveDay"]
+    return result
+
+
+@STAGE_SECONDS.time(stage="spread_history")
+def pair_spread_history(code1, code2, days, live1=None, live2=None):
+    """由本地历史构建 code1/code2 最近 days 个交易日（含当日）的价差金字塔。
+
+    已收盘部分按交易日集合缓存，每次只为当日分钟线重新构建一小段并拼接；
+    两条腿的涨跌幅均以窗口首日昨收价为基准（同五日视图）。
+    live1/live2 为两条腿当日分钟线的 (datetime64[m] 时间, 价格)。
+    返回 (金字塔, 交易日列表)；没有本地历史时返回 None。
+    """
+    store = DataService.history
+    if store is None:
+        return None
+    full1, full2 = DataService._full_code(code1), DataService._full_code(code2)
+    live_date = None
+    if live1 is not None and live2 is not None and len(live1[0]) and len(live2[0]):
+        live_date = min(live1[0][-1], live2[0][-1]).astype("datetime64[D]").item()
+    window, live = store.window([full1, full2], days, datetime.now().date(), live_date)
+    if not window:
+        return None
+
+    def load_closed():
+        legs = []
+        for full_code in (full1, full2):
+            segment = store.read_days(full_code, window)
+            if segment is None:
+                raise FileNotFoundError(f"history for {full_code} is incomplete")
+            prec, stamps, prices = segment
+            legs.append((prec, stamps, (prices - prec) / prec if prec else np.zeros(len(prices))))
+        (prec1, t1, c1), (prec2, t2, c2) = legs
+        return prec1, prec2, SpreadPyramid.build(*spread_series(t1, c1, t2, c2))
+
+    try:
+        prec1, prec2, pyramid = DataService.history_cache.get_or_load((full1, full2, tuple(window)), load_closed)
+    except FileNotFoundError as e:
+        logger.warning(f"Spread history unavailable for {code1}-{code2}: {e}")
+        return None
+    if live:
+        (t1, p1), (t2, p2) = live1, live2
+        c1 = (p1 - prec1) / prec1 if prec1 else np.zeros(len(p1))
+        c2 = (p2 - prec2) / prec2 if prec2 else np.zeros(len(p2))
+        pyramid = pyramid.concat(SpreadPyramid.build(*spread_series(t1, c1, t2, c2)))
+    return pyramid, window + ([live_date] if live else [])
+
+
+@STAGE_SECONDS.time(stage="overview")
+def overview_payload(pairs, codes, trade_date, matrix, window=60):
+    """pairs 为 [(pair_id, 两腿 stocks)]；在 代码 × 分钟 涨跌幅矩阵上一次 gather-相减
+    得到全部价差序列，再按行向量化统计最近 window 个点"""
+    row = {code: i for i, code in enumerate(codes)}
+    items = [(pid, stocks) for pid, stocks in pairs
+             if stocks[0].get('code') in row and stocks[1].get('code') in row]
+    result = {"date": trade_date.isoformat() if trade_date else "", "window": window, "pairs": []}
+    if not items:
+        return result
+    rows1 = np.array([row[stocks[0]['code']] for _, stocks in items])
+    rows2 = np.array([row[stocks[1]['code']] for _, stocks in items])
+    current, last, mean, std, count = latest_stats(pair_spreads(matrix, rows1, rows2), window)
+    for i, (pid, stocks) in enumerate(items):
+        has = last[i] >= 0
+        minute = int(GRID_MINUTES[last[i]]) if has else None
+        result["pairs"].append({
+            "pair": pid,
+            "stock1": {"code": stocks[0]['code'], "name": stocks[0].get('name', '')},
+            "stock2": {"code": stocks[1]['code'], "name": stocks[1].get('name', '')},
+            "current": float(current[i]) if has else None,
+            "time": f"{minute // 60:02d}:{minute % 60:02d}" if has else "",
+            "mean": float(mean[i]) if count[i] else None,
+            "std": float(std[i]) if count[i] > 1 else None,
+            "zscore": float((current[i] - mean[i]) / std[i]) if count[i] > 1 and std[i] > 1e-12 else None,
+            "points": int(count[i]),
+        })
+    return result
+
+
+class PairSnapshot:
+    """某个套利对在一次刷新后发布的只读快照"""
+    __slots__ = ("pair_id", "version", "data", "created_at", "_payloads", "_bodies", "_lock")
+
+    # 发布后预先编码的响应格式（前端默认请求的列式 6 位小数）
+    PRELOAD = (("columnar", 6, None),)
+
+    def __init__(self, pair_id, version, data):
+        self.pair_id = pair_id
+        self.version = version
+        self.data = data
+        self.created_at = datetime.now()
+        self._payloads = {}
+        self._bodies = {}
+        self._lock = threading.RLock()
+
+    def payload(self, fmt="rows", precision=None, dtype=None):
+        """按响应格式返回数据；同一快照的每种格式只转换一次"""
+        if fmt != "columnar":
+            return self.data
+        key = (fmt, precision, dtype)
+        with self._lock:
+            if key not in self._payloads:
+                self._payloads[key] = to_columnar(self.data, precision, dtype)
+            return self._payloads[key]
+
+    def body(self, fmt="rows", precision=None, dtype=None, encoding=None):
+        """响应体字节串（JSON，encoding 为 gzip/br 时为压缩后的字节）；每个快照的每种变体只编码一次"""
+        key = (fmt, precision, dtype, encoding)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                if encoding is None:
+                    payload = self.payload(fmt, precision, dtype)
+                    with STAGE_SECONDS.time(stage="encode_json"):
+                        body = codec.dumps(payload)
+                else:
+                    raw = self.body(fmt, precision, dtype)
+                    with STAGE_SECONDS.time(stage=f"compress_{encoding}"):
+                        body = codec.compress(raw, encoding)
+                self._bodies[key] = body
+            return body
+
+    def warm(self):
+        """预先编码常用格式及各可用压缩编码，使读请求只需发送现成的字节"""
+        for options in self.PRELOAD:
+            for encoding in (None,) + codec.ENCODINGS:
+                self.body(*options, encoding)
 
 
 # ========== 新增：多套利对管理器 ==========
 class MultiPairManager:
-    """管理多个套利对的容器"""
-    def __init__(self, config):
-        self.apps = {}          # pair_id -> StockMonitorApp
+    """管理多个套利对的容器。
+
+    publisher 为共享状态库（多 worker 部署时由采集进程传入），
+    发布快照、分钟线和告警，供其他进程中的 web worker 读取。
+    calendar 为交易日历，缺省时使用 DataService 的日历（未配置时按配置的节假日文件加载）。
+    """
+    def __init__(self, config, publisher=None, calendar=None):
+        # pair_id -> StockMonitorApp；写时复制（修改时整体替换），读者取引用后无需加锁
+        self.apps = {}
+        # pair_id -> PairSnapshot；快照只读，发布时按 key 原子替换
+        self.snapshots = {}
+        # pair_id -> 最近一次完成计算的时刻（time.time()，内容未变化时也更新），用于刷新滞后指标
+        self.refreshed_at = {}
         self.active_pair_id = config.get("active_pair", "")
+        self.refresh_interval = float(config.get("refresh_interval", 5))
+        self.idle_refresh_interval = float(config.get("idle_refresh_interval", 60))
+        calendar_settings = config.get("calendar", {})
+        self.calendar = calendar or DataService.calendar or MarketCalendar.load(calendar_settings.get("holidays_file"))
+        self.settle_seconds = float(calendar_settings.get("settle_seconds", 300))
+        # 开盘后连续多少轮成功拉取都只有更早交易日的数据才暂记为休市，以及暂记后多久重新确认一次
+        self.holiday_confirm_ticks = int(calendar_settings.get("holiday_confirm_ticks", 3))
+        self.holiday_recheck_interval = float(calendar_settings.get("holiday_recheck_seconds", 1800))
+        self.lookback = dict(config.get("lookback", {}))    # pair_id / "default" -> 交易日数
+        self.stats_settings = dict(config.get("stats", {}))
+        self.symbols = SymbolRegistry()     # 各套利对共享的分钟线，按代码引用计数
+        self.alerts = AlertEngine.from_config(config.get("alerts", {}))
+        self.publisher = publisher
+        self._version = 0
+        if publisher is not None:
+            # 版本号（ETag）与告警 id 接续上次运行，避免 web worker 的缓存把新数据当成旧数据
+            self._version = publisher.last_version()
+            self.alerts.sinks.append(publisher)
+            self.alerts.resume(publisher.last_alert_id())
+        self._apps_lock = threading.Lock()      # 串行化对 apps 的修改
+        self._tick_lock = threading.Lock()      # 同一时刻只进行一轮 refresh_all
+        self._compute_lock = threading.Lock()   # 写入共享数据面及计算各套利对状态（不含网络 I/O）
+        self._share_lock = threading.Lock()     # 串行化快照写入/删除共享状态库（在计算锁之外）
+        self._published = threading.Condition()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._fetched_dates = []        # 最近一轮成功拉取到分钟线的各代码的交易日
+        self._stale_ticks = (None, 0)   # (日期, 当日连续只拿到旧数据的轮数)
+        self._holiday_probe_at = None
+        self._persisted = {}            # 代码 -> 已写入本地存储的最近交易日
         self._build_apps(config.get("pairs", []))
 
     def _build_apps(self, pair_list):
+        apps = dict(self.apps)
         for code1, code2 in pair_list:
             pid = f"{code1}-{code2}"
-            if pid not in self.apps:
-                cfg = {"stock1": code1, "stock2": code2}
-                self.apps[pid] = StockMonitorApp(cfg)
+            if pid not in apps:
+                cfg = {"stock1": code1, "stock2": code2, "stats": self.stats_settings}
+                apps[pid] = StockMonitorApp(cfg, self.symbols)
+        self.apps = apps
 
     def add_pair(self, code1, code2):
         pid = f"{code1}-{code2}"
-        if pid not in self.apps:
-            cfg = {"stock1": code1, "stock2": code2}
-            self.apps[pid] = StockMonitorApp(cfg)
+        with self._apps_lock:
+            if pid not in self.apps:
+                cfg = {"stock1": code1, "stock2": code2, "stats": self.stats_settings}
+                self.apps = {**self.apps, pid: StockMonitorApp(cfg, self.symbols)}
+                self._wakeup.set()
         return pid
 
     def remove_pair(self, pid):
-        if pid in self.apps:
-            del self.apps[pid]
+        with self._apps_lock:
+            apps = dict(self.apps)
+            app = apps.pop(pid, None)
+            if app is None:
+                return
+            self.apps = apps
             if self.active_pair_id == pid:
-                self.active_pair_id = next(iter(self.apps)) if self.apps else None
+                self.active_pair_id = next(iter(apps)) if apps else None
+        app.release()
+        self.refreshed_at.pop(pid, None)
+        with self._published:
+            self.snapshots.pop(pid, None)
+            self._published.notify_all()
+        self.alerts.drop_pair(pid)
+        if self.publisher is not None:
+            with self._share_lock:
+                try:
+                    self.publisher.delete_snapshot(pid)
+                except Exception as e:
+                    _count_error("publish", e)
+                    logger.error(f"Failed to delete shared snapshot of {pid}: {e}")
+
+    def apply_config(self, config):
+        """应用由其他进程修改后的配置：增删套利对、切换当前套利对、更新回看天数与告警规则"""
+        wanted = {f"{code1}-{code2}": (code1, code2) for code1, code2 in config.get("pairs", [])}
+        for pid in list(self.apps):
+            if pid not in wanted:
+                self.remove_pair(pid)
+                logger.info(f"Removed pair {pid} (config changed)")
+        for pid, (code1, code2) in wanted.items():
+            if pid not in self.apps:
+                self.add_pair(code1, code2)
+                logger.info(f"Added pair {pid} (config changed)")
+        if config.get("active_pair") in self.apps:
+            self.active_pair_id = config["active_pair"]
+        self.lookback = dict(config.get("lookback", self.lookback))
+        rules = config.get("alerts", {}).get("rules", {})
+        current = self.alerts.rules()
+        for pid in set(current) | set(rules):
+            if current.get(pid) == rules.get(pid):
+                continue
+            try:
+                self.alerts.set_rules(pid, rules.get(pid, []))
+            except ValueError as e:
+                logger.error(f"Invalid alert rules for {pid}: {e}")
 
     def switch_to(self, pid):
         if pid in self.apps:
@@ -447,14 +1092,316 @@ class MultiPairManager:
     def get_pair_ids(self):
         return list(self.apps.keys())
 
+    def get_snapshot(self, pid):
+        """读取最近一次发布的快照，不触发任何网络请求"""
+        return self.snapshots.get(pid)
+
+    def lookback_days(self, pid):
+        return int(self.lookback.get(pid, self.lookback.get("default", 20)))
+
+    def spread_history(self, pid, days=None):
+        """该套利对最近 days 个交易日（含当日）的价差金字塔，见 pair_spread_history"""
+        app = self.apps.get(pid)
+        if app is None:
+            return None
+        code1, code2 = app.stocks[0]["code"], app.stocks[1]["code"]
+        live = [bars_to_arrays(DataService.get_minute_data(code))[:2] for code in (code1, code2)]
+        return pair_spread_history(code1, code2, days or self.lookback_days(pid), *live)
+
+    def overview(self, window=60):
+        """所有套利对的最新分时价差与 z-score（基于共享的分钟线矩阵）"""
+        pairs = [(pid, app.stocks) for pid, app in list(self.apps.items())
+                 if all(stock.get('code') for stock in app.stocks)]
+        return overview_payload(pairs, *self.symbols.matrix(), window)
+
     def refresh_active(self):
-        app = self.get_active_app()
-        if app:
-            return app.get_frontend_data()
-        return None
+        return self.refresh_pair(self.active_pair_id)
 
+    @STAGE_SECONDS.time(stage="refresh_pair")
     def refresh_pair(self, pid):
+        """同步刷新单个套利对并发布快照。
+
+        网络拉取只持有该套利对自己的锁：同一套利对的并发刷新只执行一次，
+        不阻塞其他套利对的刷新和任何读者。
+        """
         app = self.get_app(pid)
-        if app:
-            return app.get_frontend_data()
-        return None
+        if not app:
+            return None
+        known = self.snapshots.get(pid)
+        with app.refresh_lock:
+            # 等锁期间其他请求可能已完成同一套利对的刷新
+            latest = self.snapshots.get(pid)
+            if latest is not known and latest is not None:
+                return latest.data
+            realtime_data, series = DataService.fetch_tick(app.realtime_codes(), app.minute_cursors())
+            with self._compute_lock:
+                self.symbols.ingest(series)
+                try:
+                    data = app.get_frontend_data(realtime_data, series)
+                except Exception as e:
+                    # 保留上一次的快照，读者继续看到最近一次成功刷新的数据
+                    _count_error("refresh_pair", e)
+                    logger.error(f"Error refreshing pair {pid}: {type(e).__name__}: {e}")
+                    data, snapshot = (latest.data if latest is not None else None), None
+                else:
+                    snapshot = self._publish(pid, app, data)
+                self._share_symbols()
+            if snapshot is not None:
+                self._share_snapshot(snapshot)
+                snapshot.warm()
+        return data
+
+    def _plan_realtime_codes(self, apps):
+        """汇总本轮所有套利对及指数所需代码（去重）"""
+        codes = []
+        for app in apps:
+            codes.extend(app.realtime_codes())
+        codes.extend(INDEX_CODES)
+        return list(dict.fromkeys(DataService.to_market_code(c) for c in codes if c))
+
+    @STAGE_SECONDS.time(stage="refresh_all")
+    def refresh_all(self):
+        """刷新所有套利对并发布快照；实时行情每轮只批量拉取一次，
+        各代码的分时/五日数据按代码拉取一次，分钟线写入共享数据面后各套利对只计算价差"""
+        with self._tick_lock:
+            items = list(self.apps.items())
+            if not items:
+                return
+            # 网络拉取期间不持有计算锁，单个套利对的同步刷新仍可进行
+            realtime_data, series = DataService.fetch_tick(
+                self._plan_realtime_codes(app for _, app in items),
+                self.symbols.minute_cursors())
+            # 拉取失败或超时的代码分钟线为空，不参与节假日判断
+            self._fetched_dates = [data["minute"][-1].datetime.date()
+                                   for data in series.values() if data.get("minute")]
+            published = []
+            with self._compute_lock:
+                self.symbols.ingest(series)
+                for pid, app in items:
+                    try:
+                        data = app.get_frontend_data(realtime_data, series)
+                    except Exception as e:
+                        # 保留上一次的快照（不发布、不评估告警），读者继续看到最近一次成功刷新的数据
+                        _count_error("refresh_all", e)
+                        logger.error(f"Error refreshing pair {pid}: {type(e).__name__}: {e}")
+                        continue
+                    snapshot = self._publish(pid, app, data)
+                    if snapshot is not None:
+                        published.append(snapshot)
+                self._share_symbols()
+            # 响应体在计算锁之外编码：每次刷新编码一次，读请求直接发送字节
+            for snapshot in published:
+                self._share_snapshot(snapshot)
+                snapshot.warm()
+
+    def _share_symbols(self):
+        """把有变化的分钟线写入共享状态库（web worker 据此计算总览和长周期价差）"""
+        if self.publisher is None:
+            return
+        try:
+            self.publisher.publish_symbols(self.symbols)
+        except Exception as e:
+            _count_error("publish", e)
+            logger.error(f"Failed to share minute series: {e}")
+
+    def _publish(self, pid, app, data):
+        """发布新快照并返回；套利对已不存在或内容未变化时返回 None"""
+        # 刷新期间该套利对可能已被删除或替换
+        if self.apps.get(pid) is not app:
+            return None
+        self.refreshed_at[pid] = datetime.now().timestamp()
+        # 内容未变化时保留原快照，版本号（ETag）不变
+        previous = self.snapshots.get(pid)
+        if previous is not None and previous.data == data:
+            return None
+        with self._published:
+            self._version += 1
+            snapshot = self.snapshots[pid] = PairSnapshot(pid, self._version, data)
+            self._published.notify_all()
+        # 只按完整的刷新结果评估告警：沿用旧行情的价差不应触发告警或推进去抖/回差状态
+        if app.refresh_complete:
+            self.alerts.evaluate(pid, data)
+        return snapshot
+
+    def _share_snapshot(self, snapshot):
+        """把快照写入共享状态库；在计算锁之外调用，编码和写库不阻塞其他套利对的计算"""
+        if self.publisher is None:
+            return
+        body = snapshot.body()
+        with self._share_lock:
+            # 编码期间该套利对可能已被删除，或已发布更新的快照（由后者写入）
+            if self.snapshots.get(snapshot.pair_id) is not snapshot:
+                return
+            try:
+                self.publisher.publish_snapshot(snapshot.pair_id, snapshot.version, body)
+            except Exception as e:
+                _count_error("publish", e)
+                logger.error(f"Failed to share snapshot of {snapshot.pair_id}: {e}")
+
+    def wait_for_snapshot(self, pid, last_version=None, timeout=None):
+        """阻塞等待该套利对出现与 last_version 不同的快照（供推送流使用）。
+
+        超时返回 None；套利对已被删除时抛出 KeyError。
+        """
+        def ready():
+            snapshot = self.snapshots.get(pid)
+            return pid not in self.apps or (snapshot is not None and snapshot.version != last_version)
+
+        with self._published:
+            if not self._published.wait_for(ready, timeout):
+                return None
+            if pid not in self.apps:
+                raise KeyError(pid)
+            return self.snapshots[pid]
+
+    def collect_metrics(self):
+        """各套利对的刷新滞后、快照年龄与版本，以及行情缓存的命中率（注册为 metrics 采集回调）"""
+        now = datetime.now().timestamp()
+        refresh_age = metrics.Family("stockmonitor_pair_refresh_age_seconds", "gauge",
+                                     "Seconds since the pair was last recomputed", ("pair",))
+        snapshot_age = metrics.Family("stockmonitor_pair_snapshot_age_seconds", "gauge",
+                                      "Seconds since the pair's data last changed", ("pair",))
+        version = metrics.Family("stockmonitor_pair_snapshot_version", "gauge",
+                                 "Version (ETag) of the pair's latest snapshot", ("pair",))
+        for pid in list(self.apps):
+            refreshed = self.refreshed_at.get(pid)
+            if refreshed is not None:
+                refresh_age.add(now - refreshed, pid)
+            snapshot = self.snapshots.get(pid)
+            if snapshot is not None:
+                snapshot_age.add(now - snapshot.created_at.timestamp(), pid)
+                version.add(snapshot.version, pid)
+        refreshing, interval = self._schedule()
+        schedule = [
+            metrics.Family("stockmonitor_pairs", "gauge", "Number of configured pairs").add(len(self.apps)),
+            metrics.Family("stockmonitor_refresh_active", "gauge",
+                           "1 while the scheduler refreshes on every interval, 0 while the market is closed")
+            .add(1 if refreshing else 0),
+            metrics.Family("stockmonitor_refresh_interval_seconds", "gauge",
+                           "Current scheduler sleep between rounds").add(interval),
+        ]
+        return [refresh_age, snapshot_age, version] + schedule + metrics.cache_families(DataService.cache_stats())
+
+    # ---------- 后台刷新 ----------
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="PairRefresher", daemon=True)
+        self._thread.start()
+        logger.info(f"Background refresher started (interval {self.refresh_interval}s)")
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _schedule(self, now=None):
+        """(本轮是否刷新, 距下一轮的秒数)。
+
+        集合竞价及连续竞价时段按 refresh_interval 刷新；每次休市（11:30、15:00）后继续刷新
+        settle_seconds 以取得收盘数据，之后冻结最后的快照、不再访问上游，直到下一个交易时段。
+        休市期间每隔 idle_refresh_interval 醒来重新判断（不刷新）。
+        """
+        now = now or datetime.now()
+        if self.calendar.phase(now) in (AUCTION, CONTINUOUS):
+            return True, self.refresh_interval
+        last_close = self.calendar.last_close(now)
+        if last_close is not None and (now - last_close).total_seconds() < self.settle_seconds:
+            return True, self.refresh_interval
+        until_open = (self.calendar.next_session(now) - now).total_seconds()
+        return False, max(0.0, min(until_open, self.idle_refresh_interval))
+
+    def _bootstrap(self):
+        """休市期间只为尚无快照的套利对（刚启动或新增）拉取一次数据"""
+        missing = [pid for pid in self.apps if pid not in self.snapshots]
+        if not missing:
+            return
+        logger.info(f"Market closed, loading {len(missing)} pairs once")
+        if len(missing) == len(self.apps):
+            self.refresh_all()
+            return
+        for pid in missing:
+            self.refresh_pair(pid)
+
+    def _detect_holiday(self, now=None):
+        """开盘已过 settle_seconds，连续 holiday_confirm_ticks 轮成功拉取到的分钟线都属于更早的交易日：
+        日历缺少该节假日，当日暂记为休市。任何一轮拿到当日数据即撤销（见 _holiday_probe_due）。"""
+        now = now or datetime.now()
+        today = now.date()
+        dates = self._fetched_dates
+        if not dates:
+            return
+        if max(dates) >= today:
+            self._stale_ticks = (today, 0)
+            self.calendar.unmark_closed(today)
+            return
+        if (now - datetime.combine(today, OPEN)).total_seconds() < self.settle_seconds:
+            return
+        day, count = self._stale_ticks
+        count = count + 1 if day == today else 1
+        self._stale_ticks = (today, count)
+        if count >= self.holiday_confirm_ticks:
+            self.calendar.mark_closed(today)
+
+    def _holiday_probe_due(self, now):
+        """当日被暂记为休市时，交易时段内每隔 holiday_recheck_interval 再拉取一轮确认"""
+        if not self.calendar.is_inferred_closed(now.date()) or not PRE_OPEN <= now.time() < CLOSE:
+            return False
+        if self._holiday_probe_at is not None and (now - self._holiday_probe_at).total_seconds() < self.holiday_recheck_interval:
+            return False
+        self._holiday_probe_at = now
+        return True
+
+    def _persist_closed_sessions(self, now=None):
+        """收盘 settle_seconds 之后，把共享数据面中已收盘交易日的分钟线写入本地存储；
+        之后的五日数据由本地存储拼出，不再为这些交易日请求上游"""
+        store = DataService.history
+        if store is None:
+            return
+        now = now or datetime.now()
+        pending = []
+        with self._compute_lock:
+            for code in self.symbols.codes():
+                series = self.symbols.get(code)
+                if series is None or not series.times or self._persisted.get(code) == series.trade_date:
+                    continue
+                closed_at = datetime.combine(series.trade_date, CLOSE)
+                # 没有走到收盘的数据（盘中停牌、拉取中断）不落盘，由五日数据补齐
+                if series.times[-1] < closed_at or (now - closed_at).total_seconds() < self.settle_seconds:
+                    continue
+                # 涨跌幅相对当日昨收价，由最后一分钟反推（价格最多三位小数）
+                price, change = series.points[series.times[-1]]
+                pending.append((code, series.trade_date, round(price / (1 + change), 3),
+                                list(series.times), [series.points[dt][0] for dt in series.times]))
+        for code, trade_date, prev_close, times, prices in pending:
+            full_code = DataService._full_code(code)
+            try:
+                if store.write_day(full_code, trade_date, prev_close, times, prices):
+                    logger.info(f"Persisted {full_code} {trade_date} ({len(prices)} bars)")
+            except (OSError, ValueError) as e:
+                _count_error("history_store", e)
+                logger.warning(f"Failed to persist {full_code} {trade_date}: {e}")
+                continue
+            self._persisted[code] = trade_date
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            started = datetime.now()
+            refresh, interval = self._schedule(started)
+            try:
+                if refresh or self._holiday_probe_due(started):
+                    self.refresh_all()
+                    self._detect_holiday(started)
+                else:
+                    self._bootstrap()
+                    self._persist_closed_sessions(started)
+            except Exception as e:
+                _count_error("background_refresh", e)
+                logger.error(f"Background refresh failed: {str(e)}")
+            elapsed = (datetime.now() - started).total_seconds()
+            self._wakeup.wait(max(0.0, interval - elapsed))
+            self._wakeup.clear()
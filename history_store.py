@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger("HistoryStore")
+
+# 定长记录：分钟序号（距 00:00 的分钟数）+ 价格。
+# 每个文件的第 0 条为文件头：minute = -1，price = 该交易日的昨收价。
+RECORD = np.dtype([("minute", "<i2"), ("price", "<f8")])
+HEADER_MINUTE = -1
+
+
+class HistoryStore:
+    """按 代码/交易日 存放已收盘分钟线的本地只追加存储。
+
+    目录结构：<root>/<full_code>/<YYYYMMDD>.bin；每个交易日一个定长二进制文件，
+    收盘后写入一次（临时文件 + 原子 rename），此后只读，读取时以 np.memmap 零拷贝映射。
+    <root>/<full_code>/SYNCED 记录最近一次与上游五日数据对齐的日期。
+    """
+
+    def __init__(self, root, max_open_segments=512):
+        self.root = root
+        self.max_open_segments = max_open_segments
+        self._lock = threading.Lock()
+        self._segments = {}     # path -> np.memmap（文件只写一次，可安全复用）
+        os.makedirs(root, exist_ok=True)
+        logger.info(f"History store at {root}")
+
+    def _code_dir(self, code):
+        return os.path.join(self.root, code)
+
+    def _day_path(self, code, trade_date):
+        return os.path.join(self._code_dir(code), trade_date.strftime("%Y%m%d") + ".bin")
+
+    @staticmethod
+    def _atomic_write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def days(self, code):
+        """已存储的交易日（升序）"""
+        try:
+            names = os.listdir(self._code_dir(code))
+        except FileNotFoundError:
+            return []
+        days = []
+        for name in names:
+            if name.endswith(".bin") and len(name) == 12:
+                try:
+                    days.append(datetime.strptime(name[:8], "%Y%m%d").date())
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def has_day(self, code, trade_date):
+        return os.path.exists(self._day_path(code, trade_date))
+
+    def write_day(self, code, trade_date, prev_close, datetimes, prices):
+        """写入一个已收盘交易日的分钟线；已存在时不覆盖（空文件视为不存在）"""
+        path = self._day_path(code, trade_date)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return False
+        records = np.empty(len(prices) + 1, dtype=RECORD)
+        records[0] = (HEADER_MINUTE, prev_close)
+        records["minute"][1:] = [dt.hour * 60 + dt.minute for dt in datetimes]
+        records["price"][1:] = prices
+        self._atomic_write(path, records.tobytes())
+        return True
+
+    def read_day(self, code, trade_date):
+        """返回 (昨收价, 分钟序号数组, 价格数组)；数组为内存映射视图，不拷贝。不存在时返回 None"""
+        path = self._day_path(code, trade_date)
+        with self._lock:
+            segment = self._segments.get(path)
+        if segment is None:
+            if not os.path.exists(path):
+                return None
+            try:
+                segment = np.memmap(path, dtype=RECORD, mode="r")
+            except ValueError:
+                # 空文件（写入中途磁盘写满等）无法映射，按缺失处理，下次同步时重写
+                logger.warning(f"Empty history segment ignored: {path}")
+                return None
+            if len(segment) == 0 or segment[0]["minute"] != HEADER_MINUTE:
+                logger.warning(f"Corrupt history segment ignored: {path}")
+                return None
+            with self._lock:
+                if len(self._segments) >= self.max_open_segments:
+                    self._segments.pop(next(iter(self._segments)))
+                self._segments[path] = segment
+        body = segment[1:]
+        return float(segment[0]["price"]), body["minute"], body["price"]
+
+    def read_days(self, code, days):
+        """按顺序拼接多个交易日：返回 (首日昨收价, datetime64[m] 时间, 价格)；任一交易日缺失时返回 None"""
+        segments = [self.read_day(code, day) for day in days]
+        if not segments or any(segment is None for segment in segments):
+            return None
+        stamps = np.concatenate([np.datetime64(day, "m") + minutes.astype("timedelta64[m]")
+                                 for day, (_, minutes, _) in zip(days, segments)])
+        prices = np.concatenate([segment[2] for segment in segments])
+        return segments[0][0], stamps, prices
+
+    def window(self, codes, n_days, before, live_date=None):
+        """codes 共同拥有、早于 before 的最近交易日，共 n_days 个；
+        live_date（当日行情所属日期）晚于已存储交易日时为其预留一个位置。
+        返回 (交易日列表, 是否包含当日行情)"""
+        common = None
+        for code in codes:
+            days = {day for day in self.days(code) if day < before}
+            common = days if common is None else common & days
+        stored = sorted(common or ())
+        live = live_date is not None and (not stored or live_date > stored[-1])
+        count = n_days - 1 if live else n_days
+        return (stored[max(0, len(stored) - count):] if count > 0 else []), live
+
+    def synced_on(self, code):
+        try:
+            with open(os.path.join(self._code_dir(code), "SYNCED"), "r") as f:
+                return datetime.strptime(f.read().strip(), "%Y-%m-%d").date()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def mark_synced(self, code, day):
+        self._atomic_write(os.path.join(self._code_dir(code), "SYNCED"), day.isoformat().encode())
@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+import logging
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger("HttpClient")
+
+UPSTREAM_SECONDS = metrics.histogram("stockmonitor_upstream_request_seconds",
+                                     "Upstream request latency per attempt", ("endpoint",))
+UPSTREAM_ERRORS = metrics.counter("stockmonitor_upstream_errors_total",
+                                  "Failed upstream attempts by cause (retried attempts included)", ("endpoint", "cause"))
+
+
+class HttpClient:
+    """按上游主机复用连接的 HTTP 客户端（连接池 + 重试退避 + 并发上限 + 耗时统计）"""
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size=10, max_retries=2, backoff=0.2, max_concurrency=4):
+        self.pool_size = int(pool_size)
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.max_concurrency = int(max_concurrency)
+        self._lock = threading.Lock()
+        self._sessions = {}     # host -> requests.Session
+        self._semaphores = {}   # host -> BoundedSemaphore
+        self._stats = {}        # endpoint -> 计数器
+
+    def _session_for(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrency)
+            return session, self._semaphores[host]
+
+    def get(self, url, endpoint=None, timeout=10, headers=None):
+        """发起 GET 请求；连接错误、超时及 5xx 按抖动指数退避重试，最终失败时抛出异常"""
+        host = urlsplit(url).netloc
+        endpoint = endpoint or host
+        session, semaphore = self._session_for(host)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with semaphore:
+                    response = session.get(url, timeout=timeout, headers=headers)
+                if response.status_code in self.RETRY_STATUS:
+                    raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                self._record(endpoint, time.perf_counter() - started, None)
+                return response
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                self._record(endpoint, time.perf_counter() - started, e)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"{endpoint} request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s")
+                attempt += 1
+                time.sleep(delay)
+
+    def _record(self, endpoint, elapsed, error):
+        UPSTREAM_SECONDS.observe(elapsed, endpoint=endpoint)
+        if error is not None:
+            response = getattr(error, "response", None)
+            cause = f"http_{response.status_code}" if response is not None else type(error).__name__
+            UPSTREAM_ERRORS.inc(endpoint=endpoint, cause=cause)
+        with self._lock:
+            stat = self._stats.setdefault(endpoint, {
+                "requests": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0
+            })
+            stat["requests"] += 1
+            stat["total_seconds"] += elapsed
+            stat["max_seconds"] = max(stat["max_seconds"], elapsed)
+            if error is not None:
+                stat["errors"] += 1
+
+    def stats(self):
+        """返回各端点的请求次数、失败次数和耗时"""
+        with self._lock:
+            return {name: dict(stat) for name, stat in self._stats.items()}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._semaphores.clear()
@@ -0,0 +1,69 @@
+"""行情采集进程（多 worker 部署，见 startup.sh 的 WORKERS）。
+
+独占上游拉取与计算，把各套利对快照、分钟线和告警发布到共享状态库；
+监视配置文件，把 web worker 写入的套利对/告警规则变更应用到本进程。
+"""
+import os
+import signal
+import logging
+import threading
+import time
+
+import metrics
+from config import ConfigManager
+from data import DataService, MultiPairManager
+from shared_state import SharedStateStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Ingest")
+
+PERSISTENT_DATA_DIR = os.getenv('PERSISTENT_DATA_DIR', '/data')
+CONFIG_FILE = os.getenv('CONFIG_FILE', '/data/config.ini')
+HISTORY_DIR = os.getenv('HISTORY_DIR', os.path.join(PERSISTENT_DATA_DIR, 'history'))
+SHARED_STATE_PATH = os.getenv('SHARED_STATE_PATH', os.path.join(PERSISTENT_DATA_DIR, 'state.db'))
+CONFIG_POLL_SECONDS = 1.0
+METRICS_PUBLISH_SECONDS = 5.0
+
+
+def main():
+    config_manager = ConfigManager(CONFIG_FILE)
+    if not os.path.exists(CONFIG_FILE):
+        config_manager._create_default_config()
+    config = config_manager.load_config()
+    DataService.configure(config, HISTORY_DIR)
+
+    store = SharedStateStore(SHARED_STATE_PATH)
+    manager = MultiPairManager(config, publisher=store)
+    metrics.register_collector(manager.collect_metrics)
+    store.prune_snapshots(manager.get_pair_ids())
+    store.heartbeat()
+    manager.start()
+    logger.info(f"Ingest started with {len(manager.apps)} pairs")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    revision = config_manager.revision()
+    metrics_published = 0.0
+    while not stop.wait(CONFIG_POLL_SECONDS):
+        try:
+            store.heartbeat()
+            if time.monotonic() - metrics_published >= METRICS_PUBLISH_SECONDS:
+                store.publish_metrics(metrics.render())
+                metrics_published = time.monotonic()
+            current = config_manager.revision()
+            if current != revision:
+                revision = current
+                manager.apply_config(config_manager.load_config())
+        except Exception as e:
+            logger.error(f"Ingest loop error: {e}")
+    manager.stop()
+    logger.info("Ingest stopped")
+
+
+if __name__ == "__main__":
+    main()
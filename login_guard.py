@@ -0,0 +1,295 @@
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash
+
+import metrics
+
+logger = logging.getLogger("LoginGuard")
+
+HASH_SECONDS = metrics.histogram("stockmonitor_password_hash_seconds", "Password hash verification time")
+HASH_WAIT_SECONDS = metrics.histogram("stockmonitor_password_hash_wait_seconds",
+                                      "Time a verification waited for a free hash worker")
+
+
+class LoginRejected(Exception):
+    """登录请求未被处理；retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class LoginThrottled(LoginRejected):
+    pass
+
+
+class VerifierBusy(LoginRejected):
+    pass
+
+
+class PasswordVerifier:
+    """在固定大小的线程池中校验密码哈希。
+
+    PBKDF2 计算期间释放 GIL，但会占满一个 CPU 核；限制并发数和排队数后，
+    登录洪峰最多占用 workers 个核，超出排队上限的请求直接拒绝，不再拖慢行情接口。
+    """
+
+    def __init__(self, workers=2, max_queue=16, timeout=10.0):
+        self.workers = int(workers)
+        self.max_queue = int(max_queue)
+        self.timeout = float(timeout)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="PasswordHash")
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            "verifications": 0, "rejected": 0, "timeouts": 0, "in_flight": 0,
+            "hash_seconds_total": 0.0, "hash_seconds_max": 0.0,
+            "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+        }
+
+    def verify(self, password_hash, password):
+        """返回密码是否匹配；排队已满或等待超时时抛出 VerifierBusy"""
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise VerifierBusy("Password verification queue is full", 1)
+        submitted = time.perf_counter()
+        self._count("in_flight")
+        try:
+            future = self._executor.submit(self._check, submitted, password_hash, password)
+        except BaseException:
+            self._release()
+            raise
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # 计算仍在进行，名额在其完成后释放
+            self._count("timeouts")
+            raise VerifierBusy("Password verification timed out", 1)
+
+    def _check(self, submitted, password_hash, password):
+        started = time.perf_counter()
+        try:
+            return check_password_hash(password_hash, password)
+        finally:
+            finished = time.perf_counter()
+            HASH_SECONDS.observe(finished - started)
+            HASH_WAIT_SECONDS.observe(started - submitted)
+            with self._lock:
+                stats = self._stats
+                stats["verifications"] += 1
+                stats["hash_seconds_total"] += finished - started
+                stats["hash_seconds_max"] = max(stats["hash_seconds_max"], finished - started)
+                stats["wait_seconds_total"] += started - submitted
+                stats["wait_seconds_max"] = max(stats["wait_seconds_max"], started - submitted)
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._stats["in_flight"] -= 1
+        self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """返回校验次数、拒绝/超时次数、当前在途数，以及哈希计算和排队耗时"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["workers"] = self.workers
+        stats["max_queue"] = self.max_queue
+        return stats
+
+
+class MemoryThrottleState:
+    """进程内的失败计数；多 worker 部署时各进程分别计数（只用于 JSON 用户库等无共享库的情况）"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = int(max_keys)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()       # key -> (连续失败次数, 最近失败时刻, 解禁时刻)
+
+    def get(self, keys):
+        with self._lock:
+            return [self._entries.get(key) for key in keys]
+
+    def update(self, keys, func):
+        """对每个 key 以 func(key, 原记录或 None) 的返回值替换记录，返回 [(key, 新记录)]"""
+        with self._lock:
+            updated = []
+            for key in keys:
+                entry = func(key, self._entries.pop(key, None))
+                self._entries[key] = entry
+                updated.append((key, entry))
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            return updated
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def prune(self, before):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[1] < before and entry[2] < before]:
+                del self._entries[key]
+
+    def counts(self, now):
+        """(记录的 key 数, 仍在退避期内的 key 数)"""
+        with self._lock:
+            return len(self._entries), sum(1 for entry in self._entries.values() if entry[2] > now)
+
+
+class SqliteThrottleState:
+    """失败计数保存在 SQLite（WAL）表中，同一库文件的所有 worker 进程共享。
+
+    更新在 BEGIN IMMEDIATE 事务内读改写，多个进程并发失败时计数不会丢失；
+    库暂时不可用时按无记录处理（不因限流本身拒绝登录）。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS login_failures (
+        key TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        last REAL NOT NULL,
+        unblock_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS login_failures_last ON login_failures (last);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 自动提交模式，事务由 update 显式开始
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, keys):
+        try:
+            conn = self._connect()
+            return [conn.execute("SELECT count, last, unblock_at FROM login_failures WHERE key = ?",
+                                 (key,)).fetchone() for key in keys]
+        except sqlite3.Error as e:
+            logger.warning(f"Login throttle state unavailable: {e}")
+            return [None] * len(keys)
+
+    def update(self, keys, func):
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = []
+                for key in keys:
+                    row = conn.execute("SELECT count, last, unblock_at FROM login_failures WHERE key = ?",
+                                       (key,)).fetchone()
+                    entry = func(key, row)
+                    conn.execute("INSERT OR REPLACE INTO login_failures VALUES (?, ?, ?, ?)", (key,) + tuple(entry))
+                    updated.append((key, entry))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return updated
+        except sqlite3.Error as e:
+            logger.warning(f"Login throttle state unavailable: {e}")
+            return []
+
+    def delete(self, key):
+        try:
+            self._connect().execute("DELETE FROM login_failures WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Login throttle state unavailable: {e}")
+
+    def prune(self, before):
+        try:
+            self._connect().execute("DELETE FROM login_failures WHERE last < ? AND unblock_at < ?", (before, before))
+        except sqlite3.Error as e:
+            logger.warning(f"Login throttle state unavailable: {e}")
+
+    def counts(self, now):
+        try:
+            return self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(unblock_at > ?), 0) FROM login_failures", (now,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Login throttle state unavailable: {e}")
+            return 0, 0
+
+
+class LoginThrottle:
+    """按用户名和客户端 IP 统计连续失败次数，超过 free_attempts 后按指数退避拒绝登录。
+
+    第 n 次超额失败后需等待 base_delay * 2^(n-1) 秒（不超过 max_delay）才能再次尝试；
+    期间的请求直接返回 LoginThrottled，不做哈希计算也不占用请求线程休眠。
+    reset_after 秒内没有新的失败则计数清零。计数保存在 state 中（缺省为进程内的 MemoryThrottleState，
+    多 worker 部署时使用共享的 SqliteThrottleState），时刻为 time.time()，各进程可比较。
+    """
+
+    # 每记录这么多次失败清理一次已过期的记录
+    PRUNE_EVERY = 100
+
+    def __init__(self, free_attempts=5, base_delay=1.0, max_delay=300.0, reset_after=900.0, state=None):
+        self.free_attempts = int(free_attempts)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.reset_after = float(reset_after)
+        self.state = state if state is not None else MemoryThrottleState()
+        self._lock = threading.Lock()
+        self._failures_recorded = 0
+        self.throttled = 0
+
+    @staticmethod
+    def _keys(username, client):
+        return (f"user:{username}", f"ip:{client}")
+
+    def check(self, username, client):
+        """尝试登录前调用；仍在退避期内时抛出 LoginThrottled"""
+        now = time.time()
+        wait = max([entry[2] - now for entry in self.state.get(self._keys(username, client)) if entry is not None],
+                   default=0.0)
+        if wait > 0:
+            with self._lock:
+                self.throttled += 1
+            raise LoginThrottled("Too many failed login attempts", wait)
+
+    def failure(self, username, client):
+        now = time.time()
+
+        def record(key, entry):
+            count, last, _ = entry if entry is not None else (0, now, now)
+            if now - last > self.reset_after:
+                count = 0
+            count += 1
+            excess = count - self.free_attempts
+            delay = min(self.max_delay, self.base_delay * 2 ** (excess - 1)) if excess > 0 else 0.0
+            return (count, now, now + delay)
+
+        for key, (count, _, unblock_at) in self.state.update(self._keys(username, client), record):
+            if count > self.free_attempts and key.startswith("user:"):
+                logger.warning(f"login_throttled user={username} client={client} failures={count} "
+                               f"delay={unblock_at - now:.0f}s")
+        with self._lock:
+            self._failures_recorded += 1
+            prune = self._failures_recorded % self.PRUNE_EVERY == 0
+        if prune:
+            self.state.prune(now - self.reset_after)
+
+    def success(self, username, client):
+        """登录成功后清除该用户名的失败计数（IP 的计数按时间自然清零）"""
+        self.state.delete(self._keys(username, client)[0])
+
+    def stats(self):
+        tracked, blocked = self.state.counts(time.time())
+        return {"tracked_keys": tracked, "blocked_keys": blocked, "throttled": self.throttled}
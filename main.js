@@ -1,6 +1,9 @@
 // main.js
 // 全局变量
 let pollInterval = 5000; // 5秒轮询一次
+const TRADING_POLL_INTERVAL = 5000;
+const IDLE_POLL_INTERVAL = 60000; // 休市时服务端快照已冻结，1分钟轮询一次
+const dataFormatParams = 'format=columnar&precision=6'; // 列式响应，数值保留 6 位小数
 let timerId = null;
 let intradayChart = null;
 let fiveDayChart = null;
@@ -8,6 +11,12 @@ let stock1Chart = null;
 let stock2Chart = null;
 let currentPairId = null;
 let pairList = [];
+let dataCache = null;   // 当前套利对的完整列式数据（已合并增量）
+let dataEtag = null;    // 上次响应的 ETag
+let eventSource = null; // 推送流连接
+let streamFailures = 0; // 推送流连续出错次数（连接成功后清零）
+let streamGeneration = 0; // 每次申请票据时递增，用于丢弃过期的票据请求结果
+let streamLastId = null; // 最近收到的快照版本，换新票据重连时告知服务端
 
 // 初始化应用
 function initApp() {
@@ -45,7 +54,7 @@ function fetchPairs() {
         renderPairTabs();
 
         if (currentPairId) {
-            startPolling();
+            startUpdates();
         } else {
             document.getElementById('pairTabsContainer').innerHTML =
                 '<div style="text-align:center;color:#999;padding:20px;">暂无套利对，请点击“+ 新建套利对”添加</div>';
@@ -126,7 +135,7 @@ function switchPair(pid) {
     .then(() => {
         currentPairId = pid;
         renderPairTabs();
-        fetchData(); // 立即刷新数据
+        startUpdates(); // 切换到新套利对的数据源
     })
     .catch(error => console.error('Switch pair failed:', error));
 }
@@ -188,6 +197,18 @@ function startPolling() {
     fetchData(); // 立即获取一次
 }
 
+// 按交易时段调整轮询间隔（仅轮询模式下生效）
+function adjustPolling(phase) {
+    if (!phase) return;
+    const interval = (phase === 'auction' || phase === 'continuous') ? TRADING_POLL_INTERVAL : IDLE_POLL_INTERVAL;
+    if (interval === pollInterval) return;
+    pollInterval = interval;
+    if (timerId) {
+        clearInterval(timerId);
+        timerId = setInterval(fetchData, pollInterval);
+    }
+}
+
 // 停止轮询
 function stopPolling() {
     if (timerId) {
@@ -196,19 +217,139 @@ function stopPolling() {
     }
 }
 
-// 获取数据（带上当前 pair）
+// 开始接收数据：优先使用推送流，不支持或连接失败时退回轮询
+function startUpdates() {
+    stopPolling();
+    if (!startStreaming()) {
+        startPolling();
+    }
+}
+
+// 订阅服务端推送流（SSE），服务端每次刷新后推送快照或增量
+function startStreaming() {
+    stopStreaming();
+    if (!window.EventSource || !currentPairId) return false;
+    openStream(currentPairId);
+    return true;
+}
+
+// 用登录令牌换取短期推送流票据后建立连接（EventSource 无法设置请求头，票据代替 URL 中的登录令牌）；
+// 重新连接时沿用 streamFailures 与 streamLastId
+function openStream(pairId) {
+    closeStream();
+    const generation = ++streamGeneration;
+    fetch('/api/stream/ticket', {
+        method: 'POST',
+        headers: Auth.withAuthHeader(),
+        cache: 'no-store'
+    })
+    .then(response => {
+        if (response.status === 401) {
+            Auth.redirectToLogin();
+            return null;
+        }
+        if (!response.ok) throw new Error(`ticket request failed: ${response.status}`);
+        return response.json();
+    })
+    .then(data => {
+        // 期间已切换套利对或停止推送流
+        if (data && generation === streamGeneration) connectStream(pairId, data.ticket);
+    })
+    .catch(error => {
+        if (generation !== streamGeneration) return;
+        console.warn('Stream unavailable, falling back to polling', error);
+        stopStreaming();
+        startPolling();
+    });
+}
+
+function connectStream(pairId, ticket) {
+    let url = `/api/stream?${dataFormatParams}&pair=${encodeURIComponent(pairId)}` +
+        `&ticket=${encodeURIComponent(ticket)}`;
+    if (streamLastId) url += `&lastEventId=${encodeURIComponent(streamLastId)}`;
+    const source = eventSource = new EventSource(url);
+    source.addEventListener('open', () => {
+        streamFailures = 0;
+    });
+    // 服务端即将按计划断开：换新票据重连（浏览器自动重连会沿用已过期的票据）
+    source.addEventListener('reconnect', () => {
+        openStream(pairId);
+    });
+    source.addEventListener('snapshot', (event) => {
+        streamLastId = event.lastEventId;
+        const data = JSON.parse(event.data);
+        if (pairId !== currentPairId) return;
+        dataCache = mergeData(dataCache, data, pairId);
+        updateUI(dataCache);
+    });
+    source.addEventListener('removed', () => {
+        stopStreaming();
+        fetchPairs();
+    });
+    source.onerror = () => {
+        if (source !== eventSource) return;
+        streamFailures += 1;
+        if (streamFailures >= 3) {
+            console.warn('Stream unavailable, falling back to polling');
+            stopStreaming();
+            startPolling();
+        } else if (source.readyState === EventSource.CLOSED) {
+            // 连接被拒绝（票据过期、推送流名额已满等）：申请新票据再试，连续失败 3 次后退回轮询
+            openStream(pairId);
+        }
+        // 其余情况由浏览器自动重连
+    };
+}
+
+function closeStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+// 关闭推送流
+function stopStreaming() {
+    streamGeneration += 1;  // 丢弃尚未返回的票据请求
+    closeStream();
+    streamFailures = 0;
+    streamLastId = null;
+}
+
+// 获取数据（带上当前 pair）；已有缓存时只请求增量
 function fetchData() {
-    let url = '/api/get-data';
-    if (currentPairId) {
-        url += `?pair=${encodeURIComponent(currentPairId)}`;
+    const pairId = currentPairId;
+    let url = `/api/get-data?${dataFormatParams}`;
+    if (pairId) {
+        url += `&pair=${encodeURIComponent(pairId)}`;
+    }
+    const headers = Auth.withAuthHeader();
+    if (dataCache && dataCache.pair === pairId) {
+        const times = dataCache.intraday.times;
+        if (dataCache.intraday.date && times.length > 0) {
+            url += `&since=${encodeURIComponent(dataCache.intraday.date + 'T' + times[times.length - 1])}`;
+        }
+        if (dataCache.fiveDay) {
+            url += `&fiveDay=${dataCache.fiveDay.version}`;
+        }
+        if (dataEtag) {
+            headers['If-None-Match'] = dataEtag;
+        }
     }
     fetch(url, {
-        headers: Auth.withAuthHeader()
+        headers: headers,
+        cache: 'no-store'
+    })
+    .then(response => {
+        adjustPolling(response.headers.get('X-Market-Phase'));
+        if (response.status === 304) return null;  // 数据未变化
+        if (response.ok) dataEtag = response.headers.get('ETag');
+        return Auth.handleResponse(response);
     })
-    .then(response => Auth.handleResponse(response))
     .then(data => {
-        if (data) {
-            updateUI(data);
+        if (data && !data.error && pairId === currentPairId) {
+            dataCache = mergeData(dataCache, data, pairId);
+            updateUI(dataCache);
         }
     })
     .catch(error => {
@@ -216,6 +357,36 @@ function fetchData() {
     });
 }
 
+// 将增量响应合并进缓存：去掉缓存中 from 及之后的分时点，再追加新点
+function mergeData(previous, data, pairId) {
+    if (!data.delta || !previous || previous.pair !== pairId) {
+        return { ...data, pair: pairId };
+    }
+    const base = previous.intraday;
+    const patch = data.intraday;
+    let keep = base.times.findIndex(time => time >= patch.from);
+    if (keep === -1) keep = base.times.length;
+    const splice = (oldValues, newValues) => oldValues.slice(0, keep).concat(newValues);
+    return {
+        ...data,
+        pair: pairId,
+        intraday: {
+            ...patch,
+            times: splice(base.times, patch.times),
+            values: splice(base.values, patch.values),
+            stock1: {
+                prices: splice(base.stock1.prices, patch.stock1.prices),
+                changePercent: splice(base.stock1.changePercent, patch.stock1.changePercent)
+            },
+            stock2: {
+                prices: splice(base.stock2.prices, patch.stock2.prices),
+                changePercent: splice(base.stock2.changePercent, patch.stock2.changePercent)
+            }
+        },
+        fiveDay: data.fiveDay || previous.fiveDay
+    };
+}
+
 // 更新所有 UI
 function updateUI(data) {
     updateStockDisplay('stock1', data.stock1);
@@ -231,9 +402,10 @@ function updateUI(data) {
     updateIndexDisplay('sh000905', data.index7);
     updateIndexDisplay('sh000852', data.index8);
 
-    // 更新股票走势图
-    updateStockChart('stock1', data.stock1ChartData, data.stock1);
-    updateStockChart('stock2', data.stock2ChartData, data.stock2);
+    // 更新股票走势图（与分时价差共享时间轴）
+    const intraday = data.intraday || {};
+    updateStockChart('stock1', stockChartData(intraday, 'stock1'), data.stock1);
+    updateStockChart('stock2', stockChartData(intraday, 'stock2'), data.stock2);
 
     // 更新价差图表
     updateIntradayChart(data.intraday);
@@ -243,6 +415,16 @@ function updateUI(data) {
     updateStatsDisplay(data);
 }
 
+// 从列式分时数据中取出单只股票的走势
+function stockChartData(intraday, stockId) {
+    const series = intraday[stockId] || {};
+    return {
+        times: intraday.times || [],
+        prices: series.prices || [],
+        change_percent: series.changePercent || []
+    };
+}
+
 // 更新指数显示
 function updateIndexDisplay(indexCode, indexData) {
     const item = document.querySelector(`.index-item[data-code="${indexCode}"]`);
@@ -439,16 +621,17 @@ function updateStockChart(stockId, chartData, stockData) {
 
 // 更新当日价差图表
 function updateIntradayChart(intradayData) {
-    if (!intradayChart || !intradayData || !intradayData.data) return;
-    const dataPoints = intradayData.data;
-    const filteredData = dataPoints.filter(d => {
-        const time = d.time;
+    if (!intradayChart || !intradayData || !intradayData.times) return;
+    const times = [];
+    const values = [];
+    intradayData.times.forEach((time, i) => {
         const hour = parseInt(time.split(':')[0]);
         const minute = parseInt(time.split(':')[1]);
-        return (hour >= 9 && minute >= 30) || hour >= 10;
+        if ((hour >= 9 && minute >= 30) || hour >= 10) {
+            times.push(time);
+            values.push(intradayData.values[i]);
+        }
     });
-    const times = filteredData.map(d => d.time);
-    const values = filteredData.map(d => d.value);
     const lunchTimeIndex = times.findIndex(time => time === '11:30');
     const markLines = [];
     if (lunchTimeIndex !== -1) {
@@ -475,43 +658,37 @@ function updateIntradayChart(intradayData) {
 
 // 更新五日价差图表
 function updateFiveDayChart(fiveDayData) {
-    if (!fiveDayChart || !fiveDayData || !fiveDayData.data) return;
-    const dataPoints = fiveDayData.data;
-    const xAxisData = dataPoints.map(d => d.datetime);
-    const values = dataPoints.map(d => d.value);
+    if (!fiveDayChart || !fiveDayData || !fiveDayData.times) return;
+    const xAxisData = fiveDayData.times;
+    const values = fiveDayData.values;
     const datePositions = {};
+    const markLines = [];
     let currentDate = '';
     let startIndex = 0;
-    for (let i = 0; i < dataPoints.length; i++) {
-        const [datePart] = dataPoints[i].datetime.split(' ');
+    for (let i = 0; i < xAxisData.length; i++) {
+        const [datePart] = xAxisData[i].split(' ');
         if (datePart !== currentDate) {
             if (currentDate !== '') {
                 const endIndex = i - 1;
                 const midIndex = Math.floor((startIndex + endIndex) / 2);
                 datePositions[midIndex] = currentDate;
             }
+            // 每个交易日的第一个点画分隔线
+            markLines.push({
+                xAxis: i,
+                lineStyle: { color: '#999', type: 'dashed', width: 1.5 },
+                label: { show: false }
+            });
             currentDate = datePart;
             startIndex = i;
         }
     }
     if (currentDate !== '') {
-        const endIndex = dataPoints.length - 1;
+        const endIndex = xAxisData.length - 1;
         const midIndex = Math.floor((startIndex + endIndex) / 2);
         datePositions[midIndex] = currentDate;
     }
     const labels = xAxisData.map((_, index) => datePositions[index] || '');
-    const uniqueDates = [...new Set(dataPoints.map(d => d.datetime.split(' ')[0]))];
-    const markLines = [];
-    uniqueDates.forEach(date => {
-        const firstIndex = dataPoints.findIndex(d => d.datetime.startsWith(date));
-        if (firstIndex !== -1) {
-            markLines.push({
-                xAxis: firstIndex,
-                lineStyle: { color: '#999', type: 'dashed', width: 1.5 },
-                label: { show: false }
-            });
-        }
-    });
     fiveDayChart.setOption({
         xAxis: {
             data: xAxisData,
@@ -0,0 +1,123 @@
+import os
+import logging
+from datetime import datetime, time, timedelta
+
+logger = logging.getLogger("MarketCalendar")
+
+# A 股交易时段（北京时间）
+PRE_OPEN = time(9, 15)          # 开盘集合竞价
+OPEN = time(9, 30)
+MORNING_CLOSE = time(11, 30)
+AFTERNOON_OPEN = time(13, 0)
+CLOSE = time(15, 0)
+
+# 时段
+HOLIDAY = "holiday"             # 非交易日（周末、节假日）
+PRE_MARKET = "pre_market"       # 交易日开盘集合竞价之前
+AUCTION = "auction"             # 开盘集合竞价 9:15-9:30
+CONTINUOUS = "continuous"       # 连续竞价 9:30-11:30、13:00-15:00
+LUNCH = "lunch"                 # 午间休市 11:30-13:00
+CLOSED = "closed"               # 收盘之后
+
+DEFAULT_HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "holidays.txt")
+
+
+class MarketCalendar:
+    """A 股交易日历：周末及节假日文件中的日期休市。
+
+    节假日文件每行一个日期（YYYY-MM-DD 或 YYYYMMDD），# 之后为注释。
+    由上游数据推断的休市日单独记录在 inferred 中，可被之后的数据撤销。
+    """
+
+    def __init__(self, holidays=()):
+        self.holidays = set(holidays)
+        self.inferred = set()
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.getenv("HOLIDAYS_FILE") or DEFAULT_HOLIDAYS_FILE
+        holidays = set()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    text = line.split("#", 1)[0].strip()
+                    if not text:
+                        continue
+                    try:
+                        holidays.add(datetime.strptime(text.replace("-", ""), "%Y%m%d").date())
+                    except ValueError:
+                        logger.warning(f"Invalid holiday entry in {path}: {text}")
+        except OSError as e:
+            logger.warning(f"Holiday file unavailable, only weekends are closed: {e}")
+        logger.info(f"Loaded {len(holidays)} holidays from {path}")
+        latest = max(holidays, default=None)
+        if latest is None or latest.year < datetime.now().year:
+            logger.warning(f"Holiday file {path} has no dates for {datetime.now().year}; "
+                           f"append this year's exchange closures (see the header of holidays.txt)")
+        return cls(holidays)
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays and day not in self.inferred
+
+    def is_inferred_closed(self, day):
+        return day in self.inferred
+
+    def mark_closed(self, day):
+        """把某天暂记为休市（日历文件缺失该节假日时，由上游数据推断）；可由 unmark_closed 撤销"""
+        if day not in self.holidays and day not in self.inferred:
+            self.inferred.add(day)
+            logger.warning(f"{day} treated as a market holiday (upstream has no data for it)")
+
+    def unmark_closed(self, day):
+        if day in self.inferred:
+            self.inferred.discard(day)
+            logger.warning(f"{day} is a trading day after all (upstream returned data for it)")
+
+    def phase(self, now):
+        if not self.is_trading_day(now.date()):
+            return HOLIDAY
+        t = now.time()
+        if t < PRE_OPEN:
+            return PRE_MARKET
+        if t < OPEN:
+            return AUCTION
+        if t < MORNING_CLOSE:
+            return CONTINUOUS
+        if t < AFTERNOON_OPEN:
+            return LUNCH
+        if t < CLOSE:
+            return CONTINUOUS
+        return CLOSED
+
+    def next_trading_day(self, day):
+        day += timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    def previous_trading_day(self, day):
+        day -= timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    def next_session(self, now):
+        """下一个交易时段（集合竞价或午后开盘）的开始时刻"""
+        phase = self.phase(now)
+        if phase == PRE_MARKET:
+            return datetime.combine(now.date(), PRE_OPEN)
+        if phase == LUNCH:
+            return datetime.combine(now.date(), AFTERNOON_OPEN)
+        if phase in (AUCTION, CONTINUOUS):
+            return now
+        return datetime.combine(self.next_trading_day(now.date()), PRE_OPEN)
+
+    def last_close(self, now):
+        """now 所在交易日最近一次休市（11:30 或 15:00）的时刻；尚未休市过时返回 None"""
+        if not self.is_trading_day(now.date()):
+            return None
+        for close in (CLOSE, MORNING_CLOSE):
+            moment = datetime.combine(now.date(), close)
+            if now >= moment:
+                return moment
+        return None
@@ -0,0 +1,275 @@
+"""进程内指标（计数器、仪表、直方图），以 Prometheus 文本格式输出。
+
+指标对象在模块级创建并注册到 REGISTRY；缓存命中率等已有统计通过 register_collector
+注册的回调在输出时读取。每个进程各自统计，多 worker 部署时采集进程的指标经共享状态库转发。
+"""
+import math
+import time
+import threading
+import functools
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认直方图桶（秒），覆盖微秒级的内存计算到秒级的上游请求
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """[(样本名, [(标签名, 值)], 数值)]"""
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+
+class _Timer:
+    """Histogram.time() 的返回值：可作为 with 语句或装饰器使用"""
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """计时 with 块或被装饰函数的耗时（秒）"""
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def summary(self, **labels):
+        """(次数, 总耗时)"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return (entry[2], entry[1]) if entry else (0, 0.0)
+
+    def samples(self):
+        with self._lock:
+            entries = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in entries:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", labels + [("le", _format_value(float(bound)))], cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+
+class Family:
+    """由采集回调在输出时生成的一组样本"""
+
+    def __init__(self, name, kind, documentation, labelnames=()):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples = []
+
+    def add(self, value, *labelvalues):
+        self._samples.append((self.name, list(zip(self.labelnames, labelvalues)), value))
+        return self
+
+    def samples(self):
+        return self._samples
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """collector() 返回 Family 列表，每次输出时调用"""
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def collect(self):
+        with self._lock:
+            families = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                families.append(Family("stockmonitor_metrics_collector_errors", "gauge",
+                                       "Collector failed during this scrape", ("collector", "error"))
+                                .add(1, getattr(collector, "__name__", "collector"), type(e).__name__))
+        return families
+
+    def render(self):
+        """Prometheus 文本格式：多个回调产生的同名指标合并输出，无样本的指标省略"""
+        grouped = {}
+        for family in self.collect():
+            samples = family.samples()
+            if not samples:
+                continue
+            entry = grouped.setdefault(family.name, (family, []))
+            entry[1].extend(samples)
+        lines = []
+        for family, samples in grouped.values():
+            lines.append(f"# HELP {family.name} {_escape(family.documentation)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+register_collector = REGISTRY.register_collector
+render = REGISTRY.render
+
+
+def cache_families(stats_by_cache):
+    """把 TTLCache.stats() 的结果（cache 名 -> stats）转换为指标"""
+    hits = Family("stockmonitor_cache_hits_total", "counter", "Cache lookups served from cache", ("cache",))
+    misses = Family("stockmonitor_cache_misses_total", "counter", "Cache lookups that had to load", ("cache",))
+    ratio = Family("stockmonitor_cache_hit_ratio", "gauge", "Cache hit ratio since start", ("cache",))
+    size = Family("stockmonitor_cache_entries", "gauge", "Entries currently cached", ("cache",))
+    evictions = Family("stockmonitor_cache_evictions_total", "counter", "Entries evicted by the LRU limit", ("cache",))
+    shared = Family("stockmonitor_cache_shared_loads_total", "counter",
+                    "Concurrent misses that waited for an in-flight load", ("cache",))
+    for name, stats in stats_by_cache.items():
+        hits.add(stats["hits"], name)
+        misses.add(stats["misses"], name)
+        ratio.add(stats["hit_ratio"], name)
+        size.add(stats["size"], name)
+        evictions.add(stats["evictions"], name)
+        shared.add(stats["shared_loads"], name)
+    return [hits, misses, ratio, size, evictions, shared]
@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger("Profiler")
+
+
+class SamplingProfiler:
+    """采样式性能剖析：后台线程每隔 interval 秒抓取所有线程的调用栈并计数。
+
+    开销与采样频率成正比、与被测代码无关，可在线上临时开启；到达 max_seconds 后自动停止。
+    结果为折叠栈格式（"线程;文件:函数;... 次数"），可直接交给 flamegraph.pl / speedscope 绘图。
+    """
+
+    def __init__(self, interval=0.01, max_seconds=60, max_depth=64):
+        self.interval = float(interval)
+        self.max_seconds = float(max_seconds)
+        self.max_depth = int(max_depth)
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started = None
+        self._stopped = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None, max_seconds=None):
+        """开始一次新的剖析（清空上次结果）；已在运行时返回 False"""
+        with self._lock:
+            if self.running:
+                return False
+            if interval is not None:
+                self.interval = max(0.001, float(interval))
+            if max_seconds is not None:
+                self.max_seconds = max(1.0, float(max_seconds))
+            self._stacks = Counter()
+            self._samples = 0
+            self._started = time.time()
+            self._stopped = None
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Profiler started (interval {self.interval}s, at most {self.max_seconds}s)")
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            collapsed = []
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                collapsed.append(self._collapse(names.get(ident, str(ident)), frame))
+            with self._lock:
+                self._stacks.update(collapsed)
+                self._samples += 1
+        self._stopped = time.time()
+        logger.info(f"Profiler stopped after {self._samples} samples")
+
+    def _collapse(self, thread_name, frame):
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "interval": self.interval,
+                "max_seconds": self.max_seconds,
+                "samples": self._samples,
+                "stacks": len(self._stacks),
+                "started_at": self._started,
+                "stopped_at": self._stopped,
+            }
+
+    def collapsed(self, limit=None):
+        """折叠栈文本，按次数从多到少排列"""
+        with self._lock:
+            items = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in items)
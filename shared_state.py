@@ -0,0 +1,385 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import date
+
+import numpy as np
+
+from alerts import AlertEngine
+from data import PairSnapshot, overview_payload, pair_spread_history
+from market_calendar import MarketCalendar
+from symbols import GRID_MINUTES, GRID_SLOTS
+
+logger = logging.getLogger("SharedState")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    pair_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    code TEXT PRIMARY KEY,
+    trade_date TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    minutes BLOB NOT NULL,
+    prices BLOB NOT NULL,
+    changes BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    pair_id TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SharedStateStore:
+    """多 worker 部署时的共享状态库（SQLite，WAL 模式）。
+
+    采集进程写入各套利对的快照、各代码的当日分钟线与告警；web worker 只读。
+    WAL 下读者不阻塞写者，每个线程各用一个连接。
+    """
+
+    ALERT_HISTORY = 5000    # 保留的告警条数
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._shared = {}      # code -> (SymbolSeries 对象 id, revision)，只在采集进程中使用
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        logger.info(f"Shared state store: {path}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 快照 ----------
+    def publish_snapshot(self, pid, version, body):
+        """body 为快照数据的 JSON 字节串（PairSnapshot.body()）"""
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                         (pid, version, body.decode("utf-8"), time.time()))
+
+    def delete_snapshot(self, pid):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM snapshots WHERE pair_id = ?", (pid,))
+
+    def prune_snapshots(self, pair_ids):
+        """删除不在 pair_ids 中的快照（采集进程启动时清理上次运行遗留的套利对）"""
+        with self._connect() as conn:
+            for (pid,) in conn.execute("SELECT pair_id FROM snapshots").fetchall():
+                if pid not in pair_ids:
+                    conn.execute("DELETE FROM snapshots WHERE pair_id = ?", (pid,))
+
+    def snapshot_version(self, pid):
+        row = self._connect().execute("SELECT version FROM snapshots WHERE pair_id = ?", (pid,)).fetchone()
+        return row[0] if row else None
+
+    def load_snapshot(self, pid):
+        """(版本号, 响应数据)；不存在时返回 None"""
+        row = self._connect().execute("SELECT version, data FROM snapshots WHERE pair_id = ?", (pid,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def last_version(self):
+        row = self._connect().execute("SELECT MAX(version) FROM snapshots").fetchone()
+        return row[0] or 0
+
+    # ---------- 分钟线 ----------
+    def publish_symbols(self, registry):
+        """写入自上次发布以来有变化的代码，删除已不再引用的代码"""
+        codes = set(registry.codes())
+        with self._connect() as conn:
+            for code in list(self._shared):
+                if code not in codes:
+                    conn.execute("DELETE FROM symbols WHERE code = ?", (code,))
+                    del self._shared[code]
+            for code in codes:
+                series = registry.get(code)
+                if series is None or series.trade_date is None:
+                    continue
+                key = (id(series), series.revision)
+                if self._shared.get(code) == key:
+                    continue
+                stamps, prices, changes = series.arrays()
+                minutes = (stamps - np.datetime64(series.trade_date, "m")).astype(np.int16)
+                conn.execute("INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?, ?, ?)", (
+                    code, series.trade_date.isoformat(), series.revision,
+                    minutes.tobytes(), prices.tobytes(), changes.tobytes()))
+                self._shared[code] = key
+
+    def symbol_revisions(self):
+        return dict(self._connect().execute("SELECT code, revision FROM symbols").fetchall())
+
+    def load_symbols(self):
+        """code -> (交易日, datetime64[m] 时间, 价格, 涨跌幅)"""
+        result = {}
+        for code, trade_date, _, minutes, prices, changes in self._connect().execute("SELECT * FROM symbols"):
+            day = date.fromisoformat(trade_date)
+            stamps = np.datetime64(day, "m") + np.frombuffer(minutes, dtype=np.int16).astype(np.int64)
+            result[code] = (day, stamps, np.frombuffer(prices, dtype=np.float64),
+                            np.frombuffer(changes, dtype=np.float64))
+        return result
+
+    # ---------- 告警（同时作为 AlertEngine 的 sink） ----------
+    def emit(self, alert):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO alerts VALUES (?, ?, ?)",
+                         (alert["id"], alert["pair"], json.dumps(alert, ensure_ascii=False)))
+            conn.execute("DELETE FROM alerts WHERE id <= ?", (alert["id"] - self.ALERT_HISTORY,))
+
+    def alerts(self, pid=None, after=0, limit=100):
+        """同 AlertEngine.query"""
+        sql, params = "SELECT body FROM alerts WHERE id > ?", [after]
+        if pid is not None:
+            sql += " AND pair_id = ?"
+            params.append(pid)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._connect().execute(sql, params).fetchall()
+        return [json.loads(body) for (body,) in reversed(rows)]
+
+    def last_alert_id(self):
+        row = self._connect().execute("SELECT MAX(id) FROM alerts").fetchone()
+        return row[0] or 0
+
+    # ---------- 采集进程心跳 ----------
+    def heartbeat(self):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('ingest_heartbeat', ?)", (str(time.time()),))
+
+    def ingest_alive(self, max_age=30):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'ingest_heartbeat'").fetchone()
+        return row is not None and time.time() - float(row[0]) <= max_age
+
+    # ---------- 采集进程指标 ----------
+    def publish_metrics(self, text):
+        """采集进程的 Prometheus 文本（web worker 通过 /api/metrics?process=ingest 转发）"""
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('ingest_metrics', ?)", (text,))
+
+    def load_metrics(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'ingest_metrics'").fetchone()
+        return row[0] if row else None
+
+
+class SharedPair:
+    """web worker 中的套利对：只有两条腿的代码和名称"""
+
+    def __init__(self, code1, code2):
+        self.stocks = [{"code": code1, "name": ""}, {"code": code2, "name": ""}]
+
+
+class SharedAlerts:
+    """web worker 中的告警接口：历史从共享状态库读取，规则写入配置后由采集进程生效"""
+
+    def __init__(self, store, view):
+        self.store = store
+        self.view = view
+
+    def query(self, pid=None, after=0, limit=100):
+        return self.store.alerts(pid, after, limit)
+
+    def rules(self):
+        return {pid: list(specs) for pid, specs in self.view.config.get("alerts", {}).get("rules", {}).items()}
+
+    def set_rules(self, pid, specs):
+        rules = AlertEngine.parse_rules(specs)
+        self.view.sync(force=True)
+        configured = self.view.config.setdefault("alerts", {}).setdefault("rules", {})
+        if rules:
+            configured[pid] = [rule.spec for rule in rules]
+        else:
+            configured.pop(pid, None)
+        return rules
+
+
+class SharedPairView:
+    """web worker 中代替 MultiPairManager 的只读视图（接口相同）。
+
+    套利对列表、当前套利对取自配置文件（文件变化时重新加载），快照、分钟线和告警取自共享状态库；
+    不访问上游。增删/切换套利对只修改本进程的配置副本，由路由保存配置后采集进程应用。
+    """
+
+    POLL_SECONDS = 0.25
+
+    def __init__(self, store, config_manager, wait_seconds=15):
+        self.store = store
+        self.config_manager = config_manager
+        self.wait_seconds = wait_seconds      # 新增套利对时等待采集进程发布首个快照的时间
+        self.alerts = SharedAlerts(store, self)
+        self.calendar = MarketCalendar.load(config_manager.load_config()["calendar"].get("holidays_file"))
+        self.config = {}
+        self._apps = {}
+        self._revision = None
+        self._lock = threading.RLock()
+        self._snapshots = {}    # pair_id -> PairSnapshot，按版本号失效
+        self._symbols = None    # (分钟线版本, 代码列表, 交易日, 矩阵, code -> (时间, 价格))
+        self.sync(force=True)
+
+    def sync(self, force=False):
+        """配置文件有变化（或 force）时重新加载套利对列表"""
+        revision = self.config_manager.revision()
+        if not force and revision == self._revision:
+            return
+        with self._lock:
+            config = self.config_manager.load_config()
+            apps = {}
+            for code1, code2 in config.get("pairs", []):
+                pid = f"{code1}-{code2}"
+                apps[pid] = self._apps.get(pid) or SharedPair(code1, code2)
+            self.config, self._apps, self._revision = config, apps, revision
+
+    @property
+    def apps(self):
+        self.sync()
+        return self._apps
+
+    @property
+    def active_pair_id(self):
+        self.sync()
+        return self.config.get("active_pair", "")
+
+    @property
+    def lookback(self):
+        return self.config.get("lookback", {})
+
+    def start(self):
+        logger.info(f"Serving {len(self.apps)} pairs from shared state (no upstream fetching)")
+
+    def stop(self):
+        pass
+
+    def add_pair(self, code1, code2):
+        pid = f"{code1}-{code2}"
+        with self._lock:
+            self.sync(force=True)
+            if pid not in self._apps:
+                self._apps = {**self._apps, pid: SharedPair(code1, code2)}
+                self.config["pairs"] = self.config.get("pairs", []) + [[code1, code2]]
+        return pid
+
+    def remove_pair(self, pid):
+        with self._lock:
+            self.sync(force=True)
+            apps = dict(self._apps)
+            if apps.pop(pid, None) is None:
+                return
+            self._apps = apps
+            self.config["pairs"] = [pair for pair in self.config.get("pairs", []) if f"{pair[0]}-{pair[1]}" != pid]
+            if self.config.get("active_pair") == pid:
+                self.config["active_pair"] = next(iter(apps)) if apps else ""
+            self._snapshots.pop(pid, None)
+
+    def switch_to(self, pid):
+        with self._lock:
+            if pid in self._apps:
+                self.config["active_pair"] = pid
+
+    def get_active_app(self):
+        return self.apps.get(self.active_pair_id)
+
+    def get_app(self, pid):
+        return self.apps.get(pid)
+
+    def get_pair_ids(self):
+        return list(self.apps.keys())
+
+    def get_snapshot(self, pid):
+        version = self.store.snapshot_version(pid)
+        if version is None:
+            return None
+        cached = self._snapshots.get(pid)
+        if cached is not None and cached.version == version:
+            return cached
+        loaded = self.store.load_snapshot(pid)
+        if loaded is None:
+            return None
+        snapshot = PairSnapshot(pid, *loaded)
+        self._snapshots[pid] = snapshot
+        app = self._apps.get(pid)
+        if app is not None:
+            for stock, key in zip(app.stocks, ("stock1", "stock2")):
+                stock["name"] = snapshot.data.get(key, {}).get("name", stock["name"])
+        return snapshot
+
+    def refresh_pair(self, pid):
+        """等待采集进程发布该套利对的首个快照（采集进程不在运行时立即返回 None）"""
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            snapshot = self.get_snapshot(pid)
+            if snapshot is not None:
+                return snapshot.data
+            if time.monotonic() >= deadline or not self.store.ingest_alive():
+                return None
+            time.sleep(self.POLL_SECONDS)
+
+    def refresh_active(self):
+        return self.refresh_pair(self.active_pair_id)
+
+    def wait_for_snapshot(self, pid, last_version=None, timeout=None):
+        """轮询共享状态库，语义同 MultiPairManager.wait_for_snapshot"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if pid not in self.apps:
+                raise KeyError(pid)
+            snapshot = self.get_snapshot(pid)
+            if snapshot is not None and snapshot.version != last_version:
+                return snapshot
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_SECONDS)
+
+    def lookback_days(self, pid):
+        return int(self.lookback.get(pid, self.lookback.get("default", 20)))
+
+    def _shared_symbols(self):
+        revisions = self.store.symbol_revisions()
+        cached = self._symbols
+        if cached is not None and cached[0] == revisions:
+            return cached[1:]
+        loaded = self.store.load_symbols()
+        codes = list(loaded)
+        dates = [day for day, _, _, _ in loaded.values()]
+        trade_date = max(dates) if dates else None
+        matrix = np.full((len(codes), len(GRID_MINUTES)), np.nan)
+        for row, (day, stamps, _, changes) in enumerate(loaded.values()):
+            if day != trade_date:
+                continue
+            minutes = (stamps - np.datetime64(day, "m")).astype(np.int64)
+            slots = GRID_SLOTS[minutes % (24 * 60)]
+            matrix[row, slots[slots >= 0]] = changes[slots >= 0]
+        live = {code: (stamps, prices) for code, (_, stamps, prices, _) in loaded.items()}
+        self._symbols = (revisions, codes, trade_date, matrix, live)
+        return self._symbols[1:]
+
+    def spread_history(self, pid, days=None):
+        app = self.apps.get(pid)
+        if app is None:
+            return None
+        code1, code2 = app.stocks[0]["code"], app.stocks[1]["code"]
+        live = self._shared_symbols()[3]
+        return pair_spread_history(code1, code2, days or self.lookback_days(pid), live.get(code1), live.get(code2))
+
+    def overview(self, window=60):
+        codes, trade_date, matrix, _ = self._shared_symbols()
+        pairs = list(self.apps.items())
+        for pid, _ in pairs:
+            self.get_snapshot(pid)      # 顺带更新股票名称
+        pairs = [(pid, app.stocks) for pid, app in pairs]
+        return overview_payload(pairs, codes, trade_date, matrix, window)
@@ -0,0 +1,66 @@
+import numpy as np
+
+from spread_state import asof_indices
+
+# 降采样层级：(名称, 每个桶的分钟数)，由细到粗逐级聚合
+RESOLUTIONS = (("1m", 1), ("5m", 5), ("30m", 30), ("1d", 1440))
+
+
+def spread_series(stamps1, changes1, stamps2, changes2, tolerance_minutes=5):
+    """两腿按时间向后 as-of 对齐后的价差（与五日视图一致）：返回 (datetime64[m] 时间, 价差)"""
+    idx, hit = asof_indices(stamps1, stamps2, tolerance_minutes)
+    diff = changes1[hit] - changes2[idx[hit]]
+    valid = ~np.isnan(diff)
+    return stamps1[hit][valid], diff[valid]
+
+
+def _downsample(level, minutes):
+    """按 minutes 分钟对齐分桶聚合 OHLC；输入已按时间排序"""
+    stamps, opens, highs, lows, closes = level
+    if not len(stamps):
+        return level
+    keys = stamps.astype(np.int64) // minutes
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys)) - 1
+    return (
+        (keys[starts] * minutes).view("datetime64[m]"),
+        opens[starts],
+        np.maximum.reduceat(highs, starts),
+        np.minimum.reduceat(lows, starts),
+        closes[ends],
+    )
+
+
+class SpreadPyramid:
+    """价差序列的多分辨率 OHLC 金字塔：1m -> 5m -> 30m -> 日线，构建一次后按图表宽度选层读取"""
+    __slots__ = ("levels",)
+
+    def __init__(self, levels):
+        self.levels = levels    # 名称 -> (时间, open, high, low, close)
+
+    @classmethod
+    def build(cls, stamps, values):
+        level = (stamps, values, values, values, values)
+        levels = {}
+        for name, minutes in RESOLUTIONS:
+            if minutes > 1:
+                level = _downsample(level, minutes)
+            levels[name] = level
+        return cls(levels)
+
+    def concat(self, other):
+        """拼接时间上更晚的另一段（须从新的交易日开始，避免同一个桶跨两段）"""
+        return SpreadPyramid({
+            name: tuple(np.concatenate((a, b)) for a, b in zip(level, other.levels[name]))
+            for name, level in self.levels.items()
+        })
+
+    def sizes(self):
+        return {name: len(level[0]) for name, level in self.levels.items()}
+
+    def resolution_for(self, width):
+        """点数不超过 width 的最细层级；都超过时取最粗层级"""
+        for name, _ in RESOLUTIONS:
+            if len(self.levels[name][0]) <= width:
+                return name
+        return RESOLUTIONS[-1][0]
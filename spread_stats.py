@@ -0,0 +1,141 @@
+import math
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+
+class SortedBuckets:
+    """分桶有序表（顺序统计用）：插入/删除先二分定位桶，再在不超过 2 * load 个元素的桶内移动，
+    按名次取值只需累加各桶长度"""
+
+    def __init__(self, load=64):
+        self.load = load
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, value):
+        if not self._buckets:
+            self._buckets.append([value])
+            self._maxes.append(value)
+        else:
+            pos = bisect_left(self._maxes, value)
+            if pos == len(self._maxes):
+                pos -= 1
+                self._buckets[pos].append(value)
+                self._maxes[pos] = value
+            else:
+                insort(self._buckets[pos], value)
+            bucket = self._buckets[pos]
+            if len(bucket) > 2 * self.load:
+                self._buckets[pos:pos + 1] = [bucket[:self.load], bucket[self.load:]]
+                self._maxes[pos:pos + 1] = [bucket[self.load - 1], bucket[-1]]
+        self._len += 1
+
+    def remove(self, value):
+        pos = bisect_left(self._maxes, value)
+        bucket = self._buckets[pos]
+        del bucket[bisect_left(bucket, value)]
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+        self._len -= 1
+
+    def __getitem__(self, index):
+        for bucket in self._buckets:
+            if index < len(bucket):
+                return bucket[index]
+            index -= len(bucket)
+        raise IndexError("SortedBuckets index out of range")
+
+    def rank(self, value):
+        """不大于 value 的元素个数"""
+        pos = bisect_left(self._maxes, value)
+        count = sum(len(bucket) for bucket in self._buckets[:pos])
+        if pos < len(self._buckets):
+            count += bisect_right(self._buckets[pos], value)
+        return count
+
+
+class RollingWindow:
+    """最近 size 个点的滑动统计：均值/方差按 Welford 增量更新（O(1)），分位数由 SortedBuckets 维护"""
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.sorted = SortedBuckets()
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value):
+        if len(self.values) == self.size:
+            old = self.values.popleft()
+            self.sorted.remove(old)
+            self.values.append(value)
+            old_mean = self.mean
+            self.mean += (value - old) / self.size
+            self._m2 += (value - old) * (value - self.mean + old - old_mean)
+        else:
+            self.values.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(self.values)
+            self._m2 += delta * (value - self.mean)
+        self._m2 = max(self._m2, 0.0)
+        self.sorted.add(value)
+
+    def std(self):
+        n = len(self.values)
+        return math.sqrt(self._m2 / (n - 1)) if n > 1 else 0.0
+
+    def quantile(self, q):
+        """线性插值分位数（同 numpy.quantile 默认方法）"""
+        n = len(self.sorted)
+        if not n:
+            return None
+        pos = q * (n - 1)
+        lo = int(pos)
+        low = self.sorted[lo]
+        if lo + 1 >= n:
+            return low
+        return low + (self.sorted[lo + 1] - low) * (pos - lo)
+
+    def summary(self, current, quantiles):
+        if not self.values:
+            return {"count": 0}
+        std = self.std()
+        return {
+            "count": len(self.values),
+            "mean": self.mean,
+            "std": std,
+            "zscore": (current - self.mean) / std if std > 1e-12 else None,
+            "percentile": self.sorted.rank(current) / len(self.sorted),
+            "quantiles": {f"p{round(q * 100)}": self.quantile(q) for q in quantiles},
+        }
+
+
+class SpreadStatistics:
+    """价差序列的多窗口滚动统计；每新增一个点：均值/方差 O(1)，有序表二分定位 O(log n)"""
+
+    def __init__(self, windows=(30, 60, 120), quantiles=(0.05, 0.5, 0.95)):
+        self.windows = {int(size): RollingWindow(int(size)) for size in windows if int(size) > 1}
+        self.quantiles = tuple(float(q) for q in quantiles)
+        self.count = 0
+
+    def push(self, value):
+        if value != value:     # NaN 不计入
+            return
+        self.count += 1
+        for window in self.windows.values():
+            window.push(value)
+
+    def extend(self, values):
+        for value in values:
+            self.push(value)
+
+    def snapshot(self, current):
+        """以 current（当前价差）计算 z-score 与所处分位；键为 '<窗口分钟数>m'"""
+        return {f"{size}m": window.summary(current, self.quantiles) for size, window in self.windows.items()}
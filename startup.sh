@@ -6,12 +6,30 @@ mkdir -p ${PERSISTENT_DATA_DIR}
 # 设置文件路径（环境变量）
 export USER_DB_PATH=${PERSISTENT_DATA_DIR}/users.json
 export CONFIG_FILE=${PERSISTENT_DATA_DIR}/config.ini
+export HISTORY_DIR=${PERSISTENT_DATA_DIR}/history
 
 # 不再手动创建 INI 配置文件，应用启动时会自动创建 JSON 格式的默认配置
-# 用户数据库也会由应用自动初始化（创建 admin 用户）
+# 用户数据库也会由应用自动初始化（创建 admin 用户）；默认存放在同目录的 users.db（SQLite），
+# 已有的 users.json 首次启动时自动导入并改名为 users.json.migrated；USER_STORE=json 沿用旧的 JSON 文件
 
 # 修复文件权限（如果文件已存在）
-chmod 666 ${CONFIG_FILE} ${USER_DB_PATH} 2>/dev/null || true
+chmod 666 ${CONFIG_FILE} ${USER_DB_PATH} ${USER_DB_PATH%.json}.db 2>/dev/null || true
 
-# 启动应用（单 worker，避免多进程竞争）
-exec gunicorn -w 1 -b 0.0.0.0:12580 app:app
+export SHARED_STATE_PATH=${PERSISTENT_DATA_DIR}/state.db
+
+# 部署在 nginx 等反向代理之后时设置为代理层数，登录限流才能区分各客户端 IP；0 表示不信任 X-Forwarded-For
+export TRUSTED_PROXY_HOPS=${TRUSTED_PROXY_HOPS:-0}
+
+# WORKERS=1（默认）：单进程拉取、计算并提供服务；多线程以承载 /api/stream 长连接
+# WORKERS>1：由一个采集进程（ingest.py）独占上游拉取，把快照发布到共享状态库，
+#            各 gunicorn worker 以 web 角色只读共享状态；配置和用户文件的修改对所有进程可见
+WORKERS=${WORKERS:-1}
+# 每个 worker 的线程数；其中至多 STREAM_MAX_CLIENTS（默认一半）用于推送流，其余留给普通请求
+export GUNICORN_THREADS=${GUNICORN_THREADS:-32}
+if [ "${WORKERS}" -gt 1 ]; then
+    # 采集进程异常退出时自动重启
+    (while true; do python ingest.py; sleep 1; done) &
+    export STATE_ROLE=web
+fi
+
+exec gunicorn -w ${WORKERS} -k gthread --threads ${GUNICORN_THREADS} -b 0.0.0.0:12580 app:app
@@ -0,0 +1,197 @@
+import threading
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from spread_state import bars_to_arrays, to_minute_stamps
+
+logger = logging.getLogger("SymbolRegistry")
+
+
+def _trading_minutes():
+    """当日分钟网格（与 DataService._is_valid_trading_time 一致）：9:30-11:32、13:00-15:00"""
+    return [m for m in range(24 * 60) if 570 <= m <= 692 or 780 <= m <= 900]
+
+
+GRID_MINUTES = np.array(_trading_minutes(), dtype=np.int64)
+GRID_SLOTS = np.full(24 * 60, -1, dtype=np.int64)      # 日内分钟 -> 网格下标，非交易分钟为 -1
+GRID_SLOTS[GRID_MINUTES] = np.arange(len(GRID_MINUTES))
+# 网格中与前一格相差恰好一分钟的位置（午休前后不相邻）
+GRID_CONTIGUOUS = np.concatenate(([False], np.diff(GRID_MINUTES) == 1))
+
+
+def pair_spreads(matrix, rows1, rows2):
+    """一次性计算全部套利对的分时价差 (套利对数, 网格分钟数)：
+    第一腿取当分钟涨跌幅，第二腿取当分钟、缺失时取前一分钟（同分时价差的 as-of 容差）"""
+    filled = matrix.copy()
+    fill = np.isnan(matrix[:, 1:]) & GRID_CONTIGUOUS[1:]
+    filled[:, 1:] = np.where(fill, matrix[:, :-1], matrix[:, 1:])
+    return matrix[rows1] - filled[rows2]
+
+
+def latest_stats(spreads, window):
+    """各行最新有效价差及其所在网格下标，以及最近 window 个有效点的均值、标准差和点数"""
+    valid = ~np.isnan(spreads)
+    rows = np.arange(len(spreads))
+    last = spreads.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    has = valid[rows, last]
+    current = np.where(has, spreads[rows, last], np.nan)
+    # 每个有效点之后（含）的有效点数，不超过 window 的即为最近 window 个点
+    from_end = np.cumsum(valid[:, ::-1], axis=1)[:, ::-1]
+    in_window = valid & (from_end <= window)
+    count = in_window.sum(axis=1)
+    values = np.where(in_window, spreads, 0.0)
+    mean = values.sum(axis=1) / np.maximum(count, 1)
+    deviation = np.where(in_window, spreads - mean[:, None], 0.0)
+    std = np.sqrt((deviation ** 2).sum(axis=1) / np.maximum(count - 1, 1))
+    return current, np.where(has, last, -1), mean, std, count
+
+
+class SymbolSeries:
+    """单个代码的当日分钟线（所有引用该代码的套利对共享同一份）。
+
+    分钟按时间追加；与最新分钟相同的 bar 覆盖旧值（最新一分钟仍在变化），更早的 bar 忽略。
+    收到新交易日的数据时整体重置。
+    """
+
+    def __init__(self, code=""):
+        self.code = code
+        self.revision = 0             # 每次写入递增，用于判断矩阵是否需要重建
+        self._five_days = None        # (五日 bars 元组, 时间数组, 涨跌幅数组)
+        self.reset(None)
+
+    def reset(self, trade_date):
+        self.trade_date = trade_date
+        self.times = []               # 按时间排序的分钟（datetime）
+        self.points = {}              # datetime -> (price, changePercent)
+        self.grid = np.full(len(GRID_MINUTES), np.nan)    # 按分钟网格对齐的涨跌幅
+        self.revision += 1
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.times)
+
+    def get(self, dt):
+        return self.points.get(dt)
+
+    def cursor(self):
+        """已收到的最新分钟，下次拉取从这一分钟（含）开始"""
+        return self.times[-1] if self.times else None
+
+    def ingest(self, bars):
+        if not bars:
+            return
+        trade_date = bars[-1].datetime.date()
+        if self.trade_date is None or trade_date > self.trade_date:
+            self.reset(trade_date)
+        elif trade_date < self.trade_date:
+            return
+        points, times = self.points, self.times
+        for bar in bars:
+            dt = bar.datetime
+            if dt.date() != trade_date or (times and dt < times[-1]):
+                continue
+            if not times or dt > times[-1]:
+                times.append(dt)
+            points[dt] = (bar.price, bar.changePercent)
+            slot = GRID_SLOTS[dt.hour * 60 + dt.minute]
+            if slot >= 0:
+                self.grid[slot] = bar.changePercent
+        self.revision += 1
+        self._arrays = None
+
+    def arrays(self):
+        """(datetime64[m] 时间, 价格, 涨跌幅) 数组；数据不变时复用，供各套利对全量重建共享"""
+        if self._arrays is None:
+            values = [self.points[dt] for dt in self.times]
+            prices = np.array([v[0] for v in values], dtype=np.float64)
+            changes = np.array([v[1] for v in values], dtype=np.float64)
+            self._arrays = (to_minute_stamps(self.times), prices, changes)
+        return self._arrays
+
+    def five_day_arrays(self, bars):
+        """五日分钟线的 (datetime64[m] 时间, 涨跌幅) 数组；bars 为按代码缓存的元组，
+        同一元组只转换一次，引用该代码的各套利对共享结果"""
+        cached = self._five_days
+        if cached is None or cached[0] is not bars:
+            stamps, _, changes, _ = bars_to_arrays(bars)
+            cached = self._five_days = (bars, stamps, changes)
+        return cached[1], cached[2]
+
+
+class SymbolRegistry:
+    """按代码引用计数的分钟线数据面：套利对通过 acquire/release 共享同一份 SymbolSeries，
+    每个代码每轮只拉取、解析、保存一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}       # code -> SymbolSeries
+        self._refs = {}         # code -> 引用数
+        self._matrix = None     # (版本键, 代码列表, 交易日, 矩阵)
+
+    def acquire(self, code):
+        with self._lock:
+            series = self._series.get(code)
+            if series is None:
+                series = self._series[code] = SymbolSeries(code)
+                self._refs[code] = 0
+            self._refs[code] += 1
+            return series
+
+    def release(self, code):
+        with self._lock:
+            if code not in self._refs:
+                return
+            self._refs[code] -= 1
+            if self._refs[code] <= 0:
+                del self._refs[code]
+                del self._series[code]
+                logger.info(f"Released symbol {code}")
+
+    def get(self, code):
+        with self._lock:
+            return self._series.get(code)
+
+    def codes(self):
+        with self._lock:
+            return list(self._series)
+
+    def refcount(self, code):
+        with self._lock:
+            return self._refs.get(code, 0)
+
+    def matrix(self):
+        """(代码列表, 交易日, 代码 × 网格分钟 的涨跌幅矩阵)；只含最新交易日的数据，
+        其余代码整行为 NaN。各代码数据未变化时复用上次结果"""
+        with self._lock:
+            series = list(self._series.items())
+            key = tuple((code, id(s), s.revision) for code, s in series)
+            if self._matrix is not None and self._matrix[0] == key:
+                return self._matrix[1:]
+        dates = [s.trade_date for _, s in series if s.trade_date]
+        trade_date = max(dates) if dates else None
+        matrix = np.full((len(series), len(GRID_MINUTES)), np.nan)
+        for row, (_, s) in enumerate(series):
+            if s.trade_date == trade_date:
+                matrix[row] = s.grid
+        result = ([code for code, _ in series], trade_date, matrix)
+        with self._lock:
+            self._matrix = (key,) + result
+        return result
+
+    def minute_cursors(self, codes=None):
+        """各代码分钟线的增量拉取起点；当日尚无数据时为 None（全量拉取）"""
+        today = datetime.now().date()
+        with self._lock:
+            series = dict(self._series) if codes is None else {
+                code: self._series[code] for code in codes if code in self._series
+            }
+        return {code: s.cursor() if s.trade_date == today else None for code, s in series.items()}
+
+    def ingest(self, series):
+        """写入 fetch_tick 返回的各代码分钟线"""
+        for code, data in series.items():
+            target = self.get(code)
+            if target is not None:
+                target.ingest(data.get("minute", ()))
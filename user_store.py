@@ -0,0 +1,219 @@
+import os
+import json
+import fcntl
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+logger = logging.getLogger("UserStore")
+
+
+class UsernameTaken(Exception):
+    pass
+
+
+class UserStore(ABC):
+    """用户存储后端接口。
+
+    记录为 {"password": 密码哈希, "created_at": ..., "updated_at": ...}；
+    update 为行级条件更新：只有当前密码哈希仍为 expected_password 时才生效，
+    并发修改同一账户时后到者失败而不是覆盖。
+    """
+
+    @abstractmethod
+    def get(self, username):
+        """返回用户记录；不存在时返回 None"""
+
+    @abstractmethod
+    def create(self, username, record):
+        """新建用户；用户名已存在时返回 False"""
+
+    @abstractmethod
+    def update(self, username, expected_password, updated_at, password=None, new_username=None):
+        """更新密码和/或用户名，返回是否生效；新用户名已存在时抛出 UsernameTaken"""
+
+    @abstractmethod
+    def count(self):
+        """用户总数"""
+
+
+class SqliteUserStore(UserStore):
+    """SQLite（WAL 模式）用户表：按主键查找，单行原子更新，多进程并发安全"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+        logger.info(f"SQLite user store: {path}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, username):
+        row = self._connect().execute(
+            "SELECT password, created_at, updated_at FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return {"password": row[0], "created_at": row[1], "updated_at": row[2]}
+
+    def create(self, username, record):
+        with self._connect() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?)", (
+                username, record["password"], record["created_at"], record["updated_at"]))
+        return cursor.rowcount == 1
+
+    def update(self, username, expected_password, updated_at, password=None, new_username=None):
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    "UPDATE users SET username = ?, password = ?, updated_at = ? WHERE username = ? AND password = ?",
+                    (new_username or username, password or expected_password, updated_at, username, expected_password))
+        except sqlite3.IntegrityError:
+            raise UsernameTaken(new_username)
+        return cursor.rowcount == 1
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def import_users(self, users):
+        """导入 {username: 记录}（已存在的用户名跳过），返回导入条数"""
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?)", [
+                (name, user["password"], user.get("created_at", ""), user.get("updated_at", ""))
+                for name, user in users.items()])
+            return conn.total_changes - before
+
+
+class JsonUserStore(UserStore):
+    """旧版 JSON 文件存储（USER_STORE=json 时使用）：整表读入内存，写入时原子替换整个文件；
+    文件被其他进程修改后重新加载，写操作以文件锁跨进程串行化"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._users = {}
+        self._reload()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _reload(self):
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "r") as f:
+                self._users = json.load(f)
+            self._stamp = stamp
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to load user database {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._users, f, indent=2)
+        os.chmod(tmp_path, 0o666)
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    @contextmanager
+    def _writing(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload()
+                yield self._users
+                self._save()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, username):
+        self._reload()
+        user = self._users.get(username)
+        return dict(user) if user is not None else None
+
+    def create(self, username, record):
+        with self._writing() as users:
+            if username in users:
+                return False
+            users[username] = dict(record)
+        return True
+
+    def update(self, username, expected_password, updated_at, password=None, new_username=None):
+        with self._writing() as users:
+            user = users.get(username)
+            if user is None or user["password"] != expected_password:
+                return False
+            if new_username and new_username != username:
+                if new_username in users:
+                    raise UsernameTaken(new_username)
+                users[new_username] = user = users.pop(username)
+            if password:
+                user["password"] = password
+            user["updated_at"] = updated_at
+        return True
+
+    def count(self):
+        self._reload()
+        return len(self._users)
+
+
+def open_user_store(path, backend=None):
+    """按 backend（缺省取环境变量 USER_STORE，默认 sqlite）打开用户存储。
+
+    path 为 .json 时 SQLite 库位于同目录的同名 .db 文件；库为空且 JSON 文件存在时
+    自动导入，原文件改名为 .json.migrated 保留。
+    """
+    backend = backend or os.getenv("USER_STORE", "sqlite")
+    if backend == "json":
+        return JsonUserStore(path)
+    if backend != "sqlite":
+        raise ValueError(f"unknown user store backend: {backend}")
+    json_path = path if path.endswith(".json") else None
+    store = SqliteUserStore(os.path.splitext(path)[0] + ".db" if json_path else path)
+    if json_path and os.path.exists(json_path) and store.count() == 0:
+        migrate_json(json_path, store)
+    return store
+
+
+def migrate_json(json_path, store):
+    try:
+        with open(json_path, "r") as f:
+            users = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Cannot migrate {json_path}: {e}")
+        return 0
+    imported = store.import_users(users)
+    try:
+        os.replace(json_path, json_path + ".migrated")
+    except OSError as e:
+        # 多个 worker 同时迁移时，文件可能已被其他进程改名
+        logger.warning(f"Could not rename {json_path}: {e}")
+    logger.info(f"Migrated {imported} users from {json_path}")
+    return imported